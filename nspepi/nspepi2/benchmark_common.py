@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Helpers shared by the microbenchmarks of nspepi: timing of a function and
+importing the nspepi2 modules of another checkout, so that the same
+benchmark can be run before and after a change.
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+
+def add_arguments(arg_parser, runs=7):
+    """
+    Adds the arguments common to the benchmarks.
+    arg_parser - argparse.ArgumentParser of the benchmark
+    runs - default number of timed runs
+    """
+    arg_parser.add_argument(
+        "-d", "--nspepi-dir", metavar="<path to nspepi2 directory>",
+        help="benchmark the nspepi2 modules of this directory, for example"
+             " of a checkout of an earlier version (default: the directory"
+             " of the benchmark)")
+    arg_parser.add_argument(
+        "-n", "--runs", type=int, default=runs,
+        help="number of timed runs (default: %(default)s)")
+
+
+def use_nspepi_dir(nspepi_dir):
+    """
+    Makes the nspepi2 modules of a directory the ones imported.
+    nspepi_dir - path of the nspepi2 directory, or None for the directory
+                 of the benchmark
+    Returns the absolute path of the directory.
+    """
+    if nspepi_dir is None:
+        nspepi_dir = os.path.dirname(os.path.abspath(__file__))
+    elif not os.path.isfile(os.path.join(nspepi_dir, "nspepi_main.py")):
+        sys.exit(nspepi_dir + " is not an nspepi2 directory")
+    nspepi_dir = os.path.abspath(nspepi_dir)
+    sys.path.insert(0, nspepi_dir)
+    return nspepi_dir
+
+
+def median_time(func, runs, number=1):
+    """
+    Returns the median time of a call of func in milliseconds.
+    func - function to time, without arguments
+    runs - number of timed runs
+    number - number of calls per run
+    """
+    times = sorted(timeit.repeat(func, repeat=runs, number=number))
+    return times[len(times) // 2] * 1000 / number
+
+
+def report(name, value, unit="ms"):
+    """ Prints the result of a benchmark case, by default a time. """
+    print("{:<40} {:10.3f} {}".format(name, value, unit))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Scaling benchmark of the bind priority analysis: converts generated configs
+of classic policy binds across thousands of vservers, users and groups,
+and reports the time spent in PoliciesAndBinds.analyze() for each size.
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import benchmark_common
+
+
+def config_lines(binds, seed=1):
+    """
+    Returns the lines of a config with the given number of classic policy
+    binds, of filter and appfw policies to global, to thousands of lb
+    vservers and to cs vservers, at random priorities.
+    """
+    rng = random.Random(seed)
+    vservers = ["lb_vs{}".format(i) for i in range(max(1, binds // 30))]
+    cs_vservers = ["cs_vs{}".format(i) for i in range(max(1, binds // 100))]
+    policies = max(1, binds // 20)
+    lines = []
+    for vserver in vservers:
+        lines.append("add lb vserver {} HTTP 10.0.{}.{} 80".format(
+            vserver, rng.randint(0, 255), rng.randint(1, 254)))
+    for vserver in cs_vservers:
+        lines.append("add cs vserver {} HTTP 10.1.{}.{} 80".format(
+            vserver, rng.randint(0, 255), rng.randint(1, 254)))
+    for i in range(policies):
+        lines.append('add filter policy flt_pol{} -rule "REQ.HTTP.URL =='
+                     ' /a{}" -reqAction RESET'.format(i, i % 50))
+        lines.append('add appfw policy appfw_pol{} "REQ.HTTP.URL =='
+                     ' /b{}" APPFW_BYPASS'.format(i, i % 50))
+    for i in range(binds):
+        priority = rng.randint(1, 2000)
+        policy = rng.randrange(policies)
+        target = rng.random()
+        if target < 0.07:
+            lines.append("bind filter global flt_pol{} -priority {}".format(
+                policy, priority))
+        elif target < 0.37:
+            lines.append("bind lb vserver {} -policyName flt_pol{}"
+                         " -priority {}".format(rng.choice(vservers),
+                                                policy, priority))
+        elif target < 0.57:
+            lines.append("bind cs vserver {} -policyName flt_pol{}"
+                         " -priority {}".format(rng.choice(cs_vservers),
+                                                policy, priority))
+        elif target < 0.65:
+            lines.append("bind appfw global appfw_pol{} {}".format(
+                policy, priority))
+        else:
+            lines.append("bind lb vserver {} -policyName appfw_pol{}"
+                         " -priority {} -type REQUEST".format(
+                             rng.choice(vservers), policy, priority))
+    return lines
+
+
+def analysis_time(config_path):
+    """
+    Converts a config with nspepi_main in this process, and returns the
+    time spent in PoliciesAndBinds.analyze() in seconds. The new and warn
+    files are written in the directory of the config.
+    """
+    os.chdir(os.path.dirname(config_path))
+    import nspepi_common as common
+    import nspepi_main
+    times = []
+    analyze = common.PoliciesAndBinds.analyze
+
+    def timed_analyze(self):
+        start = time.time()
+        try:
+            return analyze(self)
+        finally:
+            times.append(time.time() - start)
+    common.PoliciesAndBinds.analyze = timed_analyze
+    saved_argv = sys.argv
+    saved_stdout = sys.stdout
+    try:
+        sys.argv = ["nspepi_main.py", "-f", config_path]
+        with open(os.devnull, "w") as devnull:
+            sys.stdout = devnull
+            nspepi_main.main()
+    finally:
+        sys.stdout = saved_stdout
+        sys.argv = saved_argv
+        common.PoliciesAndBinds.analyze = analyze
+    return sum(times)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the bind priority analysis on large configs.")
+    arg_parser.add_argument(
+        "-b", "--binds", type=int, action="append",
+        metavar="<number of binds>",
+        help="number of binds of a config, may be repeated (default:"
+             " 10000, 30000 and 100000)")
+    benchmark_common.add_arguments(arg_parser, runs=1)
+    args = arg_parser.parse_args()
+    benchmark_common.use_nspepi_dir(args.nspepi_dir)
+    work_dir = tempfile.mkdtemp()
+    try:
+        for binds in args.binds or [10000, 30000, 100000]:
+            config_path = os.path.join(work_dir, "ns_{}.conf".format(binds))
+            with open(config_path, "w") as config:
+                config.write("\n".join(config_lines(binds)) + "\n")
+            # Each conversion starts from the state of a new process.
+            times = []
+            for _ in range(args.runs):
+                pool = multiprocessing.Pool(1)
+                try:
+                    times.append(pool.apply(analysis_time, (config_path,)))
+                finally:
+                    pool.close()
+                    pool.join()
+            times.sort()
+            benchmark_common.report(
+                "analyze, {} binds".format(binds),
+                times[len(times) // 2] * 1000)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
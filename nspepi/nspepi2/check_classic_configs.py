@@ -5,6 +5,8 @@
 # which accompany or are included with this software.
 
 import copy
+import re
+import sys
 
 import cli_lex
 import nspepi_common as common
@@ -75,6 +77,10 @@ def is_advanced_removed_expr_present(expr):
     return False
 
 
+# Lexer reused by remove_quotes
+_quote_lexer = cli_lex.Lexer()
+
+
 def remove_quotes(val):
     """
         Helper function to remove the surrounding
@@ -84,9 +90,8 @@ def remove_quotes(val):
     """
     result = val
     if val.startswith('"') or val.startswith("'"):
-        lexer = cli_lex.Lexer()
-        lexer.input(val)
-        token = lexer.token()
+        _quote_lexer.input(val)
+        token = _quote_lexer.token()
         assert token.type == "NON_KEY"
         result = token.value
     return result
@@ -102,13 +107,8 @@ def is_classic_named_expr_present(expr):
         Returns True if classic named expression is present,
         otherwise returns False.
     """
-    lexer = cli_lex.Lexer()
-    lexer.input(expr)
     classic_expr_info_list = []
-    while True:
-        next_token = lexer.adv_expr_token()
-        if not next_token:
-            break
+    for next_token in cli_lex.adv_expr_tokens(expr):
         token_value = str(next_token)
         if token_value in NamedExpression.built_in_named_expr:
             return True
@@ -1032,3 +1032,9 @@ class NSFeatures(CheckConfig):
             if feature_name in features_to_check:
                 return [commandParseTree]
         return []
+
+
+# Per-run state of this module, initialized by check_configs_init().
+for _name in ("policy_entities_names", "classic_entities_names",
+              "named_expr", "build_version"):
+    common.register_run_state(sys.modules[__name__], _name, lambda: None)
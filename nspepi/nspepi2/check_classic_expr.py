@@ -15,13 +15,10 @@ def check_classic_expr(classic_expr):
     info_msg = 'INFO: Expression is not converted' + \
         ' - most likely it is a valid advanced expression'
     try:
-        nspepi_tool_path = common.get_nspepi_tool_path()
         """Error message will be in the staring of
         output, whereas warning and info messages
         will be present in the last."""
-        nspepi_tool_output = subprocess.check_output(
-            ['perl', nspepi_tool_path, '-e', classic_expr],
-            shell=False, stderr=subprocess.STDOUT)
+        nspepi_tool_output = common.run_nspepi_tool(classic_expr)
         """ old nspepi tool adds newline character at the end
         of the converted string, so remove that character."""
         nspepi_tool_output = nspepi_tool_output.rstrip()
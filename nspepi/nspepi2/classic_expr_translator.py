@@ -0,0 +1,1003 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+In-process conversion of classic expressions.
+This is a port of the conversion done by old nspepi tool (nspepi_helper)
+for "-e <classic expression>". translate() returns the same text as the
+tool prints, that is, error messages followed by the converted expression
+or followed by the info message if nothing is converted.
+Expressions for which the tool output cannot be reproduced exactly are
+left to the tool.
+Dependency packages: None
+"""
+
+import re
+
+# Perl patterns in the tool only match ASCII for \s, \d and \b.
+_RE_FLAGS = getattr(re, "ASCII", 0)
+
+ERR_CSEC_BLOCKED_MSG = ("Conversion of client security expression is not"
+                        " supported")
+ERR_FILE_BLOCKED_MSG = ("Conversion of file system based expression is not"
+                        " supported")
+ERR_SYNTAX_MSG = "Expression is not in proper syntax"
+ERR_SUPPORT_MSG = "Expression is not supported"
+ERR_OPERATOR_MSG = "Operator used in expression is not supported"
+ERR_DATE_MSG = "Date format is invaild"
+ERR_CONVERTED_EXP_LEN = ("Converted expression length is more than 1499"
+                         " characters")
+INFO_MSG = ("INFO: Expression is not converted - most likely it is a valid"
+            " advanced expression")
+
+# Classic expressions that are convertible, in the same order as in the
+# tool: [classic prefix pattern, expression type, advanced expression]
+EXPR_LIST = [
+    ["REQ.HTTP.HEADER ", 1, 'HTTP.REQ.HEADER("$")'],
+    ["RES.HTTP.HEADER ", 1, 'HTTP.RES.HEADER("$")'],
+    ["HEADER ", 1, 'HTTP.REQ.HEADER("$")'],
+    ["RES.HTTP.STATUSCODE ", 3, 'HTTP.RES.STATUS'],
+    ["STATUSCODE ", 3, 'HTTP.RES.STATUS'],
+    ["REQ.HTTP.URLQUERYLEN ", 5, 'HTTP.REQ.URL.QUERY.LENGTH.GT($)'],
+    ["URLQUERYLEN ", 5, 'HTTP.REQ.URL.QUERY.LENGTH.GT($)'],
+    ["REQ.HTTP.URLQUERY ", 2, 'HTTP.REQ.URL.QUERY'],
+    ["URLQUERY ", 2, 'HTTP.REQ.URL.QUERY'],
+    ["REQ.HTTP.URLLEN ", 5, 'HTTP.REQ.URL.LENGTH.GT($)'],
+    ["URLLEN ", 5, 'HTTP.REQ.URL.LENGTH.GT($)'],
+    ["REQ.HTTP.URL ", 7, 'HTTP.REQ.URL'],
+    ["URL ", 7, 'HTTP.REQ.URL'],
+    ["REQ.HTTP.METHOD ", 4, 'HTTP.REQ.METHOD.EQ($)'],
+    ["METHOD ", 4, 'HTTP.REQ.METHOD.EQ($)'],
+    ["LOCATION ", 4, 'CLIENT.IP.SRC.MATCHES_LOCATION("$")'],
+    ["REQ.HTTP.VERSION ", 2, 'HTTP.REQ.VERSION'],
+    ["VERSION ", 2, 'HTTP.REQ.VERSION'],
+    ["RES.HTTP.VERSION ", 2, 'HTTP.RES.VERSION'],
+    ["REQ.SSL.CLIENT.CERT.SERIALNUMBER ", 2,
+     'CLIENT.SSL.CLIENT_CERT.SERIALNUMBER'],
+    ["CLIENT.CERT.SERIALNUMBER ", 2, 'CLIENT.SSL.CLIENT_CERT.SERIALNUMBER'],
+    ["REQ.SSL.CLIENT.CERT.SUBJECT ", 2, 'CLIENT.SSL.CLIENT_CERT.SUBJECT'],
+    ["CLIENT.CERT.SUBJECT ", 2, 'CLIENT.SSL.CLIENT_CERT.SUBJECT'],
+    ["REQ.SSL.CLIENT.CIPHER.BITS ", 3, 'CLIENT.SSL.CIPHER_BITS'],
+    ["CLIENT.CIPHER.BITS ", 3, 'CLIENT.SSL.CIPHER_BITS'],
+    ["REQ.SSL.CLIENT.CERT.ISSUER ", 2, 'CLIENT.SSL.CLIENT_CERT.ISSUER'],
+    ["CLIENT.CERT.ISSUER ", 2, 'CLIENT.SSL.CLIENT_CERT.ISSUER'],
+    ["REQ.SSL.CLIENT.SSL.VERSION ", 3, 'CLIENT.SSL.VERSION'],
+    ["CLIENT.SSL.VERSION ", 3, 'CLIENT.SSL.VERSION'],
+    ["REQ.SSL.CLIENT.CERT.SIGALGO ", 2,
+     'CLIENT.SSL.CLIENT_CERT.SIGNATURE_ALGORITHM'],
+    ["CLIENT.CERT.SIGALGO ", 2, 'CLIENT.SSL.CLIENT_CERT.SIGNATURE_ALGORITHM'],
+    ["REQ.SSL.CLIENT.CERT ", 2, 'CLIENT.SSL.CLIENT_CERT'],
+    ["CLIENT.CERT ", 2, 'CLIENT.SSL.CLIENT_CERT'],
+    ["REQ.SSL.CLIENT.CERT.VERSION ", 3, 'CLIENT.SSL.CLIENT_CERT.VERSION'],
+    ["CLIENT.CERT.VERSION ", 3, 'CLIENT.SSL.CLIENT_CERT.VERSION'],
+    ["REQ.SSL.CLIENT.CIPHER.TYPE == Export", 13,
+     'CLIENT.SSL.CIPHER_EXPORTABLE'],
+    ["REQ.SSL.CLIENT.CIPHER.TYPE != Export", 13,
+     'CLIENT.SSL.CIPHER_EXPORTABLE.NOT'],
+    ["REQ.SSL.CLIENT.CERT.VALIDFROM ", 12,
+     'CLIENT.SSL.CLIENT_CERT.VALID_NOT_BEFORE'],
+    ["REQ.SSL.CLIENT.CERT.VALIDTO ", 12,
+     'CLIENT.SSL.CLIENT_CERT.VALID_NOT_AFTER'],
+    ["REQ.IP.DESTIP ", 6, 'CLIENT.IP.DST'],
+    ["DESTIP ", 6, 'CLIENT.IP.DST'],
+    ["REQ.IP.SOURCEIP ", 6, 'CLIENT.IP.SRC'],
+    ["SOURCEIP ", 6, 'CLIENT.IP.SRC'],
+    ["RES.IP.DESTIP ", 6, 'SERVER.IP.DST'],
+    ["RES.IP.SOURCEIP ", 6, 'SERVER.IP.SRC'],
+    ["MSS ", 3, 'CLIENT.TCP.MSS'],
+    ["REQ.ETHER.DESTMAC ", 8, 'CLIENT.ETHER.DSTMAC'],
+    ["DESTMAC ", 8, 'CLIENT.ETHER.DSTMAC'],
+    ["REQ.ETHER.SOURCEMAC ", 8, 'CLIENT.ETHER.SRCMAC'],
+    ["SOURCEMAC ", 8, 'CLIENT.ETHER.SRCMAC'],
+    ["RES.ETHER.DESTMAC ", 8, 'SERVER.ETHER.DSTMAC'],
+    ["RES.ETHER.SOURCEMAC ", 8, 'SERVER.ETHER.SRCMAC'],
+    ["REQ.INTERFACE.DESTMAC ", 8, 'CLIENT.ETHER.DSTMAC'],
+    ["REQ.INTERFACE.SOURCEMAC ", 8, 'CLIENT.ETHER.SRCMAC'],
+    ["RES.INTERFACE.DESTMAC ", 8, 'SERVER.ETHER.DSTMAC'],
+    ["RES.INTERFACE.SOURCEMAC ", 8, 'SERVER.ETHER.SRCMAC'],
+    ["REQ.TCP.MSS ", 3, 'CLIENT.TCP.MSS'],
+    ["REQ.TCP.DESTPORT ", 14, 'CLIENT.TCP.DSTPORT'],
+    ["DESTPORT ", 14, 'CLIENT.TCP.DSTPORT'],
+    ["REQ.TCP.SOURCEPORT ", 14, 'CLIENT.TCP.SRCPORT'],
+    ["SOURCEPORT ", 14, 'CLIENT.TCP.SRCPORT'],
+    ["RES.TCP.MSS ", 3, 'SERVER.TCP.MSS'],
+    ["RES.TCP.DESTPORT ", 14, 'SERVER.TCP.DSTPORT'],
+    ["RES.TCP.SOURCEPORT ", 14, 'SERVER.TCP.SRCPORT'],
+    ["REQ.INTERFACE.ID ", 2, 'CLIENT.INTERFACE.ID'],
+    ["ID ", 2, 'CLIENT.INTERFACE.ID'],
+    ["REQ.INTERFACE.RXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.RXTHROUGHPUT'],
+    ["RXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.RXTHROUGHPUT'],
+    ["REQ.INTERFACE.TXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.TXTHROUGHPUT'],
+    ["TXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.TXTHROUGHPUT'],
+    ["REQ.INTERFACE.RXTXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.RXTXTHROUGHPUT'],
+    ["RXTXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.RXTXTHROUGHPUT'],
+    ["REQ.ETHER.ID ", 2, 'CLIENT.INTERFACE.ID'],
+    ["REQ.ETHER.RXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.RXTHROUGHPUT'],
+    ["REQ.ETHER.TXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.TXTHROUGHPUT'],
+    ["REQ.ETHER.RXTXTHROUGHPUT ", 3, 'CLIENT.INTERFACE.RXTXTHROUGHPUT'],
+    ["REQ.VLANID ", 3, 'CLIENT.VLAN.ID'],
+    ["VLANID ", 3, 'CLIENT.VLAN.ID'],
+    ["RES.INTERFACE.ID ", 2, 'SERVER.INTERFACE.ID'],
+    ["RES.INTERFACE.RXTHROUGHPUT ", 3, 'SERVER.INTERFACE.RXTHROUGHPUT'],
+    ["RES.INTERFACE.TXTHROUGHPUT ", 3, 'SERVER.INTERFACE.TXTHROUGHPUT'],
+    ["RES.INTERFACE.RXTXTHROUGHPUT ", 3, 'SERVER.INTERFACE.RXTXTHROUGHPUT'],
+    ["RES.ETHER.ID ", 2, 'SERVER.INTERFACE.ID'],
+    ["RES.ETHER.RXTHROUGHPUT ", 3, 'SERVER.INTERFACE.RXTHROUGHPUT'],
+    ["RES.ETHER.TXTHROUGHPUT ", 3, 'SERVER.INTERFACE.TXTHROUGHPUT'],
+    ["RES.ETHER.RXTXTHROUGHPUT ", 3, 'SERVER.INTERFACE.RXTXTHROUGHPUT'],
+    ["RES.VLANID ", 3, 'SERVER.VLAN.ID'],
+    ["DAYOFWEEK ", 9, 'SYS.TIME.WEEKDAY'],
+    ["DATE ", 10, 'SYS.TIME'],
+    ["TIME ", 11, 'SYS.TIME'],
+    ["URLTOKENS", 15, 'HTTP.REQ.URL.SET_TEXT_MODE(NOURLENCODED)'],
+    ["REQ.HTTP.URLTOKENS", 15, 'HTTP.REQ.URL.SET_TEXT_MODE(NOURLENCODED)'],
+    [r"FS\.COMMAND", 16, 'invalid'],
+    [r"FS\.DIR", 16, 'invalid'],
+    [r"FS\.DOMAIN", 16, 'invalid'],
+    [r"FS\.FILE", 16, 'invalid'],
+    [r"FS\.PATH", 16, 'invalid'],
+    [r"FS\.SERVER", 16, 'invalid'],
+    [r"FS\.SERVERIP", 16, 'invalid'],
+    [r"FS\.SERVICE", 16, 'invalid'],
+    [r"FS\.USER", 16, 'invalid'],
+    [r"CLIENT\.APPLICATION", 17, 'invalid'],
+    [r"CLIENT\.FILE", 17, 'invalid'],
+    [r"CLIENT\.OS", 17, 'invalid'],
+    [r"CLIENT\.REG", 17, 'invalid'],
+    [r"CLIENT\.SVC", 17, 'invalid'],
+]
+
+# Classic expressions that are not convertible
+CSEC_BLOCKED_LIST = [
+    r'CLIENT\.APPLICATION',
+    r'CLIENT\.FILE',
+    r'CLIENT\.OS',
+    r'CLIENT\.REG',
+    r'CLIENT\.SVC',
+    'f_5_TrendMicroOfficeScan_7_3',
+    'f_5_sygate_5_6',
+    'f_5_zonealarm_6_5',
+    's_5_norton',
+    'v_5_McAfeevirusscan_11',
+    'v_5_Mcafee',
+    'v_5_Symantec_10',
+    'v_5_Symantec_6_0',
+    'v_5_Symantec_7_5',
+    'v_5_TrendMicroOfficeScan_7_3',
+    'v_5_TrendMicro_11_25',
+    'v_5_sophos_4',
+    'v_5_sophos_5',
+    'v_5_sophos_6',
+]
+
+FILE_BLOCKED_LIST = [
+    r'FS\.COMMAND',
+    r'FS\.DIR',
+    r'FS\.DOMAIN',
+    r'FS\.FILE',
+    r'FS\.PATH',
+    r'FS\.SERVER',
+    r'FS\.SERVERIP',
+    r'FS\.SERVICE',
+    r'FS\.USER',
+]
+
+BLOCKED_LIST = [
+    's_farclient',
+]
+
+# Advanced expression prefixes
+ADVANCED_EXP_LIST = [
+    "AAA", "ANALYTICS", "CLIENT", "CONNECTION", "DIAMETER", "DNS", "FALSE",
+    "HTTP", "ICA", "MSSQL", "MYSQL", "ORACLE", "RADIUS", "SERVER", "SIP",
+    "SMPP", "SUBSCRIBER", "SYS", "TARGET", "TEXT", "TRUE",
+]
+
+MONTHS = {
+    '01': "Jan", '02': "Feb", '03': "Mar", '04': "Apr", '05': "May",
+    '06': "Jun", '07': "Jul", '08': "Aug", '09': "Sep", '10': "Oct",
+    '11': "Nov", '12': "Dec",
+}
+
+WEEKDAYS = {
+    "Sunday": 0, "Monday": 1, "Tuesday": 2, "Wednesday": 3, "Thursday": 4,
+    "Friday": 5, "Saturday": 6,
+}
+
+# The tool wraps the expression in a dummy command quoted with '"', so
+# arguments in the converted expression are always quoted with '\"'.
+_QU = '\\"'
+
+# Largest integer the tool handles without precision loss.
+_MAX_UV = 0xFFFFFFFFFFFFFFFF
+
+_SIS = re.I | re.S | _RE_FLAGS
+_S = re.S | _RE_FLAGS
+
+
+def _compile(pattern, flags=_S):
+    return re.compile(pattern, flags)
+
+
+# [upper case first character of the prefix, index in EXPR_LIST, upper
+# case prefix, expression type, advanced expression] for each prefix. An
+# expression can only match a prefix starting with its first character,
+# so the prefix patterns are compiled in _expr_list_pattern() on first use,
+# keeping the compilation of all of them off the startup of nspepi -e.
+_expr_list = [[key[0].upper(), inx, key.upper(), expr_type, advanced]
+              for inx, (key, expr_type, advanced) in enumerate(EXPR_LIST)]
+_expr_list_re = [None] * len(EXPR_LIST)
+
+
+def _expr_list_pattern(inx):
+    """ Returns the compiled pattern of the prefix at inx in EXPR_LIST. """
+    pattern = _expr_list_re[inx]
+    if pattern is None:
+        pattern = _expr_list_re[inx] = _compile(
+            "^" + EXPR_LIST[inx][0] + "(.*)$", _SIS)
+    return pattern
+
+
+_csec_blocked_re = [_compile(r"^\b" + key, _SIS) for key in CSEC_BLOCKED_LIST]
+_file_blocked_re = [_compile(r"^\b" + key, _SIS) for key in FILE_BLOCKED_LIST]
+_blocked_re = [[_compile(r"^\b" + key, _SIS), key] for key in BLOCKED_LIST]
+_advanced_exp_re = [_compile(r'^["!\d(\s]*' + key, _SIS)
+                    for key in ADVANCED_EXP_LIST]
+
+_paren_re = _compile(r'^\((.*)\)$')
+_cmd_prefix_re = _compile(
+    r'^\badd\b\s*\bpolicy\b\s*\bexpression\b\s*\btest\b\s*')
+_and_or_re = _compile(r'(\s*&&\s*|\s*\|\|\s*)')
+_and_or_present_re = _compile(r'(&&|\|\|)')
+_leading_ws_re = _compile(r'^\s+')
+_trailing_ws_re = _compile(r'\s+$')
+_arg_re = _compile(r'^\s+(\S+)(\s*.*)$')
+_arg_quote_re = _compile(r'^(\\\'|\\"|"|\')(.*)')
+_arg_paren_re = _compile(r'^(.+?)(\).*)')
+_operator_re = _compile(r'^(\S+)(\s*.*)$')
+_header_re = _compile(r'^(\S+)(\s+.*)$')
+_number_re = _compile(r'^(\S+)\s+(\d+)(.*)$')
+_greater_re = _compile(r'^>\s+(\d+)(.*)$')
+_ip_re = _compile(r'^(\S\S)\s+(\d+\.\d+\.\d+.\d+)(.*)$')
+_netmask_re = _compile(r'^\s+-netmask\s+(\d+\.\d+\.\d+.\d+)(.*)$', _SIS)
+_netmask_octets_re = _compile(r'(\d+).(\d+).(\d+).(\d+)')
+_mac_re = _compile(r'^(\S\S)\s+([0-9a-fA-f]{2}:[0-9a-fA-f]{2}:[0-9a-fA-f]{2}:'
+                   r'[0-9a-fA-f]{2}:[0-9a-fA-f]{2}:[0-9a-fA-f]{2})(.*)$')
+_weekday_re = _compile(r'^(\S{1,2})\s+(.+)GMT(.*)$', _SIS)
+_date_re = _compile(r'^(\d{4})-(\d{2})-(\d{2})(\S{3})$', _RE_FLAGS)
+_date_between_re = _compile(
+    r'^(\d{4})-(\d{2})-(\d{2})(\S{3})-(\d{4})-(\d{2})-(\d{2})(\S{3})$',
+    _RE_FLAGS)
+_time_re = _compile(
+    r'^(\d{4})-(\d{2})-(\d{2})-(\d{2}):(\d{2}):(\d{2})(\S{3})$', _RE_FLAGS)
+_time_between_re = _compile(
+    r'^(\d{4})-(\d{2})-(\d{2})-(\d{2}):(\d{2}):(\d{2})(\S{3})-'
+    r'(\d{4})-(\d{2})-(\d{2})-(\d{2}):(\d{2}):(\d{2})(\S{3})$', _RE_FLAGS)
+_rfc822_re = _compile(
+    r'^\S{3}, (\d{1,2}) (\S{3}) (\d{4}) (\d{2}):(\d{2}):(\d{2}) (\S{3})$',
+    _RE_FLAGS)
+_cookie_re = _compile(
+    r'^\S{3}, (\d{1,2})-(\S{3})-(\d{4}) (\d{2}):(\d{2}):(\d{2}) (\S{3})$',
+    _RE_FLAGS)
+_asctime_gmt_re = _compile(
+    r'^\S{3} (\S{3}) (\d{1,2}) (\d{2}):(\d{2}):(\d{2}) (\d{4}) (\S{3})$',
+    _RE_FLAGS)
+_asctime_re = _compile(
+    r'^\S{3} (\S{3}) (\d{1,2}) (\d{2}):(\d{2}):(\d{2}) (\d{4})$', _RE_FLAGS)
+_rfc850_re = _compile(
+    r'^\S{5,8}, (\d{1,2})-(\S{3})-(\d{2}) (\d{2}):(\d{2}):(\d{2}) (\S{3})$',
+    _RE_FLAGS)
+_urltokens_re = _compile(r'^\s*(\S+)\s*(.*)$')
+_urltokens_strip_re = _compile(r"[\\']")
+_len_or_off_re = _compile(r'^\s+(-l\S*|-o\S*)\s+(\d+)(.*)$', _SIS)
+_exists_re = _compile(r'^EXISTS.*', _SIS)
+_exists_rest_re = _compile(r'EXISTS(.*)', _SIS)
+_notexists_re = _compile(r'^NOTEXISTS.*', _SIS)
+_notexists_rest_re = _compile(r'NOTEXISTS(.*)', _SIS)
+_contains_re = _compile(r'CONTAINS$', re.I | _RE_FLAGS)
+_notcontains_re = _compile(r'^NOTCONTAINS$', re.I | _RE_FLAGS)
+_contents_re = _compile(r'^CONTENTS$', re.I | _RE_FLAGS)
+_between_re = _compile(r'^BETWEEN$', re.I | _RE_FLAGS)
+_range_end_re = _compile(r'^-(\d+)(.*)$')
+
+
+class _NotTranslated(Exception):
+    """ Raised for expressions which have to be converted by the tool. """
+    pass
+
+
+def translate(classic_expr):
+    """
+    Returns old nspepi tool output for the given classic expression,
+    or None if the expression has to be converted by the tool.
+    classic_expr - classic expression to be converted
+    """
+    # The tool works on bytes, so leave non-ASCII expressions to it.
+    try:
+        classic_expr.encode("ascii")
+    except UnicodeError:
+        return None
+    try:
+        return _Translator().convert_expression(classic_expr)
+    except _NotTranslated:
+        return None
+
+
+def _trim(text):
+    text = _leading_ws_re.sub("", text, 1)
+    return _trailing_ws_re.sub("", text, 1)
+
+
+def _to_uv(number):
+    """ Returns integer value of number, which the tool computes exactly. """
+    value = int(number)
+    if value > _MAX_UV:
+        raise _NotTranslated()
+    return value
+
+
+def _month(number):
+    """ Returns month name, tool warns for unknown month numbers. """
+    if number not in MONTHS:
+        raise _NotTranslated()
+    return MONTHS[number]
+
+
+def _intelligent_replacer(text, find, replace):
+    """
+    Replaces the classic expression in the command with the converted
+    expression.
+    text - command having the classic expression
+    find - classic expression to be replaced
+    replace - converted expression
+    """
+    find = re.escape(find)
+    if _and_or_present_re.search(text):
+        # Fix beginning
+        text = re.sub(r'(test "\s*[(|!]*\s*)' + find + r'(\s*\)*\s*[&|])',
+                      lambda m: m.group(1) + replace + m.group(2), text, 1,
+                      _RE_FLAGS)
+        # Fix ending
+        text = re.sub(r'([&|]\s*[(|!]*\s*)' + find + r'(\s*\)*\s*")$',
+                      lambda m: m.group(1) + replace + m.group(2), text, 1,
+                      _RE_FLAGS)
+        # Fix middle
+        text = re.sub(r'([&|]\s*[(|!]*\s*)' + find + r'(\s*\)*\s*[&|])',
+                      lambda m: m.group(1) + replace + m.group(2), text, 0,
+                      _RE_FLAGS)
+    else:
+        text = re.sub(find, lambda m: replace, text, 1, _RE_FLAGS)
+    return text
+
+
+class _Translator(object):
+    """
+    Conversion state of one expression, corresponding to the globals
+    used by the tool.
+    Instance variables:
+        errors      - error messages in the order they are reported
+        classic     - command having the expression being converted
+        advanced    - advanced expression for the current classic
+                      expression
+        expr_params - yet to be parsed part of the current classic
+                      expression
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.classic = ""
+        self.advanced = ""
+        self.expr_params = ""
+
+    def err_handle(self, msg):
+        self.errors.append("ERROR: " + msg + "\n")
+
+    def convert_expression(self, expression):
+        """
+        Returns the tool output for the given classic expression.
+        expression - classic expression to be converted
+        """
+        line = 'add policy expression test "' + expression + '"'
+        self.classic = line
+        output = self.convert(expression, line)
+        return "".join(self.errors) + output
+
+    def convert(self, expression, line):
+        """
+        Converts the expression and returns what the tool prints on its
+        standard output.
+        expression - classic expression to be converted
+        line - dummy command having the expression
+        """
+        expressions = self.extract_expressions(expression)
+        # Check for client security expressions
+        for pattern in _csec_blocked_re:
+            if pattern.match(expression):
+                self.err_handle(ERR_CSEC_BLOCKED_MSG)
+                return line + "\n"
+        # Check for file system based expressions
+        for pattern in _file_blocked_re:
+            if pattern.match(expression):
+                self.err_handle(ERR_FILE_BLOCKED_MSG)
+                return line + "\n"
+        # Check for blocked expressions
+        for pattern, name in _blocked_re:
+            if pattern.match(expression):
+                self.err_handle(
+                    "Conversion of " + name + " expression is not supported")
+                return line + "\n"
+        expr_converted = False
+        if not any(pattern.match(expression) for pattern in _advanced_exp_re):
+            for exp in expressions:
+                exp_initial = exp[:1].upper()[:1]
+                for initial, inx, key, expr_type, advanced in _expr_list:
+                    match = _paren_re.match(exp)
+                    if match:
+                        exp = match.group(1)
+                        exp_initial = exp[:1].upper()[:1]
+                    if exp_initial != initial:
+                        continue
+                    key_re = _expr_list_re[inx]
+                    if key_re is None:
+                        key_re = _expr_list_pattern(inx)
+                    match = key_re.match(exp)
+                    if match:
+                        self.expr_params = match.group(1)
+                        self.advanced = advanced
+                        self.identify_expression(expr_type)
+                        self.classic = _intelligent_replacer(
+                            self.classic, exp, self.advanced)
+                        expr_converted = True
+                    elif key == exp.upper() + " ":
+                        # Argument is not specified, like REQ.IP.SOURCEIP
+                        self.classic = _intelligent_replacer(
+                            self.classic, exp, advanced)
+                        expr_converted = True
+        # Removing the dummy command
+        converted = _cmd_prefix_re.sub("", self.classic, 1)
+        if expr_converted and len(converted) > 1499:
+            self.err_handle(ERR_CONVERTED_EXP_LEN)
+            return ""
+        if not expr_converted:
+            return converted + "\n" + INFO_MSG + "\n"
+        return converted + "\n"
+
+    def extract_expressions(self, expression):
+        """
+        Returns individual classic expressions of the given expression.
+        expression - classic expression to be split
+        """
+        exp = expression
+        # The tool does this for all expressions having "(" or "!",
+        # because its check for "&&" or "||" is always true.
+        if "(" in exp or "!" in exp:
+            exp = re.sub(r'^(\(|!)+', "", exp, 1)
+            exp = re.sub(r'\)+$', "", exp, 1)
+            exp = re.sub(r'\)+\s*&&', " &&", exp, 0, _RE_FLAGS)
+            exp = re.sub(r'&&\s*(\(|!)+', "&& ", exp, 0, _RE_FLAGS)
+            exp = re.sub(r'\)+\s*\|\|', " ||", exp, 0, _RE_FLAGS)
+            exp = re.sub(r'\|\|\s*(\(|!)+', "|| ", exp, 0, _RE_FLAGS)
+        expressions = _and_or_re.split(exp)
+        # Perl split drops trailing empty fields
+        while expressions and expressions[-1] == "":
+            expressions.pop()
+        return [_trim(exp) for exp in expressions
+                if not _and_or_re.search(exp)]
+
+    def identify_expression(self, expr_type):
+        """
+        Converts the current classic expression based on its type.
+        expr_type - type of the classic expression
+        """
+        if expr_type == 1:
+            # HTTP Header Based Expressions.
+            # Example: "REQ.HTTP.HEADER Accept-Language == en-us"
+            match = _header_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            header_name = match.group(1)
+            self.expr_params = match.group(2)
+            if header_name[:1] == '"':
+                header_name = header_name[1:][:-1]
+                hqs = '\\\\\\"'
+            else:
+                hqs = ""
+            self.advanced = self.advanced.replace(
+                '"$"', _QU + hqs + header_name + hqs + _QU, 1)
+            match = _arg_re.match(self.expr_params)
+            if match:
+                self.expr_params = match.group(2)
+                self.parse_text_operator(match.group(1))
+        elif expr_type == 2:
+            # TEXT Based Expressions.
+            match = _operator_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            self.expr_params = match.group(2)
+            self.parse_text_operator(match.group(1))
+        elif expr_type == 3:
+            # Number Based Expressions.
+            match = _number_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            self.expr_params = match.group(3)
+            self.parse_numeric_operator(match.group(1), match.group(2))
+        elif expr_type == 4:
+            # TEXT based substitution. Replace $.
+            match = _operator_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            operator = match.group(1)
+            self.expr_params = match.group(2)
+            arg = self.extract_argument()
+            if operator not in ('==', '!='):
+                self.err_handle(ERR_OPERATOR_MSG)
+                return
+            if '"$"' in self.advanced:
+                self.advanced = self.advanced.replace(
+                    '"$"', _QU + arg + _QU, 1)
+            else:
+                self.advanced = self.advanced.replace('$', arg, 1)
+            if operator == '!=':
+                self.advanced += '.NOT'
+        elif expr_type == 5:
+            # Number based substitution. Replace $.
+            match = _greater_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            self.expr_params = match.group(2)
+            self.advanced = self.advanced.replace('$', match.group(1), 1)
+        elif expr_type == 6:
+            self.convert_ip_expr()
+        elif expr_type == 7:
+            self.convert_url_expr()
+        elif expr_type == 8:
+            # MAC Based Expressions.
+            match = _mac_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SUPPORT_MSG)
+                return
+            operator = match.group(1)
+            self.expr_params = match.group(3)
+            self.advanced += '.EQ(' + match.group(2) + ')'
+            if operator == '!=':
+                self.advanced += '.NOT'
+            elif operator != '==':
+                self.err_handle(ERR_OPERATOR_MSG)
+        elif expr_type == 9:
+            # "DAYOFWEEK" Expression. Example:- "DAYOFWEEK == SUNDAYGMT"
+            match = _weekday_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_DATE_MSG)
+                return
+            self.expr_params = match.group(3)
+            day = match.group(2).lower()
+            day = WEEKDAYS.get(day[:1].upper() + day[1:])
+            if day is None:
+                self.err_handle(ERR_DATE_MSG)
+                return
+            self.parse_numeric_operator(match.group(1), str(day))
+        elif expr_type == 10:
+            self.convert_date_expr()
+        elif expr_type == 11:
+            self.convert_time_expr()
+        elif expr_type == 12:
+            self.convert_cert_time_expr()
+        elif expr_type == 13:
+            # Simple replacement with the advanced expression.
+            self.advanced = self.advanced.replace('("', '(' + _QU)
+            self.advanced = self.advanced.replace('")', _QU + ')')
+        elif expr_type == 14:
+            # Port Based Expressions.
+            match = _number_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            self.expr_params = match.group(3)
+            if self.expr_params.startswith('-'):
+                self.parse_port_range_expr(match.group(1), match.group(2))
+            else:
+                self.parse_numeric_operator(match.group(1), match.group(2))
+        elif expr_type == 15:
+            self.convert_urltokens_expr()
+        elif expr_type == 16:
+            self.err_handle(ERR_FILE_BLOCKED_MSG)
+        elif expr_type == 17:
+            self.err_handle(ERR_CSEC_BLOCKED_MSG)
+
+    def convert_ip_expr(self):
+        """ IP Based Expressions. """
+        match = _ip_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SUPPORT_MSG)
+            return
+        operator = match.group(1)
+        ip_addr = match.group(2)
+        self.expr_params = match.group(3)
+        # Check for netmask
+        match = _netmask_re.match(self.expr_params)
+        if match:
+            self.expr_params = match.group(2)
+            netmask = self.parse_netmask(match.group(1))
+            if netmask:
+                self.advanced += ('.IN_SUBNET(' + ip_addr + '/' +
+                                  str(netmask) + ')')
+            else:
+                self.advanced = 'false'
+        else:
+            self.advanced += '.EQ(' + ip_addr + ')'
+        if operator == '!=':
+            self.advanced += '.NOT'
+        elif operator != '==':
+            self.err_handle(ERR_OPERATOR_MSG)
+
+    def convert_url_expr(self):
+        """
+        URL based Expression. This case is different because of * character
+        in argument.
+        """
+        match = _operator_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SUPPORT_MSG)
+            return
+        operator = match.group(1)
+        self.expr_params = match.group(2)
+        if operator not in ('==', '!='):
+            self.parse_text_operator(operator)
+            return
+        arg = self.extract_argument()
+        url_after_last_slash = arg[arg.rfind("/") + 1:]
+        last_char = arg[-1:]
+        if (url_after_last_slash == '' or
+                ('.' not in url_after_last_slash and
+                 ('*' not in url_after_last_slash or last_char != '*'))):
+            self.advanced = ('HTTP.REQ.URL.PATH.EQ((' + _QU + arg + '.' +
+                             _QU + ' + HTTP.REQ.URL.SUFFIX).STRIP_END_CHARS(' +
+                             _QU + '.' + _QU + '))')
+        else:
+            self.advanced = 'HTTP.REQ.URL.PATH.EQ(' + _QU + arg + _QU + ')'
+            if last_char == '.':
+                self.advanced = 'false'
+            elif last_char == '*':
+                if arg[-3:] == '*.*':
+                    self.advanced = ('HTTP.REQ.URL.PATH.STARTSWITH(' + _QU +
+                                     arg[:-3] + _QU + ')')
+                elif arg[-2:] == '.*':
+                    self.advanced = ('HTTP.REQ.URL.PATH.EQ((' + _QU +
+                                     arg[:-1] + _QU +
+                                     ' + HTTP.REQ.URL.SUFFIX).STRIP_END_CHARS('
+                                     + _QU + '.' + _QU + '))')
+                elif arg == '/*':
+                    self.advanced = 'true'
+                else:
+                    self.advanced = ('HTTP.REQ.URL.PATH.STARTSWITH(' + _QU +
+                                     arg[:-1] + _QU + ')')
+            else:
+                last_index_of_dot = arg.rfind(".")
+                prefix = arg[:last_index_of_dot]
+                suffix = arg[last_index_of_dot + 1:]
+                if prefix == "/":
+                    self.advanced = ('HTTP.REQ.URL.SUFFIX.EQ(' + _QU +
+                                     suffix + _QU + ')')
+                elif prefix[-1:] == "*":
+                    self.advanced = ('(HTTP.REQ.URL.PATH.STARTSWITH(' + _QU +
+                                     prefix[:-1] + _QU +
+                                     ') && HTTP.REQ.URL.SUFFIX.EQ(' + _QU +
+                                     suffix + _QU + '))')
+        if operator == '!=':
+            self.advanced += '.NOT'
+
+    def convert_date_expr(self):
+        """ "DATE" Expression. Example:- "DATE == '2010-05-24GMT'" """
+        match = _operator_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SYNTAX_MSG)
+            return
+        operator = match.group(1)
+        self.expr_params = match.group(2)
+        arg = self.extract_argument()
+        if operator.upper() == "BETWEEN":
+            match = _date_between_re.match(arg)
+            if not match:
+                self.err_handle(ERR_DATE_MSG)
+                return
+            date = match.groups()
+            arg = " ".join([date[3], date[0], _month(date[1]), date[2]])
+            arg2 = " ".join([date[7], date[4], _month(date[5]), date[6]])
+            self.advanced += ".BETWEEN(" + arg + "," + arg2 + ")"
+        else:
+            match = _date_re.match(arg)
+            if not match:
+                self.err_handle(ERR_OPERATOR_MSG)
+                return
+            date = match.groups()
+            arg = " ".join([date[3], date[0], _month(date[1]), date[2]])
+            self.parse_numeric_operator(operator, arg)
+
+    def convert_time_expr(self):
+        """ "TIME" Expression. Example:- "TIME != '2010-05-26-13:31:37GMT'" """
+        match = _operator_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SYNTAX_MSG)
+            return
+        operator = match.group(1)
+        self.expr_params = match.group(2)
+        arg = self.extract_argument()
+        if operator.upper() == "BETWEEN":
+            match = _time_between_re.match(arg)
+            if not match:
+                self.err_handle(ERR_DATE_MSG)
+                return
+            time = match.groups()
+            arg = "{} {} {} {} {}h {}m {}s".format(
+                time[6], time[0], _month(time[1]), time[2], time[3], time[4],
+                time[5])
+            arg2 = "{} {} {} {} {}h {}m {}s".format(
+                time[13], time[7], _month(time[8]), time[9], time[10],
+                time[11], time[12])
+            self.advanced += ".BETWEEN(" + arg + "," + arg2 + ")"
+        else:
+            match = _time_re.match(arg)
+            if not match:
+                self.err_handle(ERR_DATE_MSG)
+                return
+            time = match.groups()
+            arg = "{} {} {} {} {}h {}m {}s".format(
+                time[6], time[0], _month(time[1]), time[2], time[3], time[4],
+                time[5])
+            self.parse_numeric_operator(operator, arg)
+
+    def convert_cert_time_expr(self):
+        """
+        Different "Time" format used in Client-Cert Expressions.
+        Example: 'Thu, 27 May 2010 16:10:15 GMT'
+        """
+        match = _operator_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SYNTAX_MSG)
+            return
+        operator = match.group(1)
+        self.expr_params = match.group(2)
+        arg = self.extract_argument()
+        fmt = "{6} {2} {1} {0} {3}h {4}m {5}s"
+        # RFC822 format: Tue, 05 Nov 1994 08:12:31 GMT
+        match = _rfc822_re.match(arg)
+        if not match:
+            # Cookie format: Tue, 05-Nov-1994 08:12:31 GMT
+            match = _cookie_re.match(arg)
+        if not match:
+            # asctime format: Tue Nov 4 08:12:31 1994 GMT
+            fmt = "{6} {5} {0} {1} {2}h {3}m {4}s"
+            match = _asctime_gmt_re.match(arg)
+        if not match:
+            # asctime format: Tue Nov 4 08:12:31 1994
+            fmt = "GMT {5} {0} {1} {2}h {3}m {4}s"
+            match = _asctime_re.match(arg)
+        if match:
+            self.parse_numeric_operator(operator, fmt.format(*match.groups()))
+            return
+        # RFC850 format: Tuesday, 05-Nov-94 08:12:31 GMT
+        match = _rfc850_re.match(arg)
+        if not match:
+            self.err_handle(ERR_OPERATOR_MSG)
+            return
+        year = int(match.group(3))
+        year = 1900 + year if year > 70 else 2000 + year
+        # The tool uses minutes for hours as well.
+        arg = "GMT {} {} {} {}h {}m {}s".format(
+            year, match.group(2), match.group(1), match.group(5),
+            match.group(5), match.group(6))
+        self.parse_numeric_operator(operator, arg)
+
+    def convert_urltokens_expr(self):
+        """ URLTOKENS Based Expressions. Example: "URLTOKENS == '+,?,%'" """
+        match = _urltokens_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SYNTAX_MSG)
+            return
+        operator = match.group(1)
+        self.expr_params = _urltokens_strip_re.sub("", match.group(2))
+        tokens = self.expr_params.split(',')
+        # Perl split drops trailing empty fields
+        while tokens and tokens[-1] == "":
+            tokens.pop()
+        if tokens:
+            self.advanced = " || ".join(
+                self.advanced + '.CONTAINS(' + _QU + token + _QU + ')'
+                for token in tokens)
+        self.advanced = "(" + self.advanced + ")"
+        if operator == '!=':
+            self.advanced += ".NOT"
+
+    def extract_argument(self):
+        """
+        Returns the argument value of the current classic expression,
+        or empty string if there is no argument.
+        """
+        match = _arg_re.match(self.expr_params)
+        if not match:
+            return ""
+        arg_value = match.group(1)
+        self.expr_params = match.group(2)
+        match = _arg_quote_re.match(arg_value)
+        if match:
+            # Argument ends at the same quote which is not escaped
+            quote = match.group(1)
+            arg_value = match.group(2)
+            escaped_quote = "\\\\" + quote
+            end_quote_re = _compile('(.*?)' + re.escape(quote) + '(.*)')
+            continue_search = True
+            match = end_quote_re.search(arg_value)
+            if match:
+                arg_value = match.group(1)
+                continue_search = False
+                self.expr_params = match.group(2) + self.expr_params
+                if arg_value[-1:] == "\\":
+                    arg_value += escaped_quote
+                    continue_search = True
+            while continue_search:
+                match = end_quote_re.search(self.expr_params)
+                if not match:
+                    break
+                arg_value += match.group(1)
+                self.expr_params = match.group(2)
+                if arg_value[-1:] != "\\":
+                    break
+                arg_value += escaped_quote
+        else:
+            match = _arg_paren_re.match(arg_value)
+            if match:
+                arg_value = match.group(1)
+                self.expr_params = match.group(2) + self.expr_params
+        return arg_value
+
+    def parse_text_operator(self, operator):
+        """
+        Converts the text operation.
+        operator - classic text operator
+        """
+        if operator == '==':
+            arg = self.extract_argument()
+            self.advanced += '.EQ(' + _QU + arg + _QU + ')'
+        elif operator == '!=':
+            arg = self.extract_argument()
+            self.advanced += '.EQ(' + _QU + arg + _QU + ').NOT'
+        elif _exists_re.match(operator):
+            self.expr_params = (_exists_rest_re.search(operator).group(1) +
+                                self.expr_params)
+            self.advanced += '.EXISTS'
+        elif _notexists_re.match(operator):
+            self.expr_params = (_notexists_rest_re.search(operator).group(1) +
+                                self.expr_params)
+            self.advanced += '.EXISTS.NOT'
+        elif _contains_re.search(operator):
+            arg = self.extract_argument()
+            advanced2 = ('.SET_TEXT_MODE(IGNORECASE).CONTAINS(' + _QU + arg +
+                         _QU + ')')
+            # To handle the LENGTH and OFFSET params.
+            seen = set()
+            while True:
+                match = _len_or_off_re.match(self.expr_params)
+                if not match:
+                    break
+                name = match.group(1).lower()
+                if len(name) > 7:
+                    self.err_handle(ERR_SYNTAX_MSG)
+                    return
+                if name == "-length"[:len(name)] and "length" not in seen:
+                    advanced2 = '.SUBSTR(0,' + match.group(2) + ')' + advanced2
+                    seen.add("length")
+                elif name == "-offset"[:len(name)] and "offset" not in seen:
+                    advanced2 = '.SKIP(' + match.group(2) + ')' + advanced2
+                    seen.add("offset")
+                else:
+                    break
+                self.expr_params = match.group(3)
+            self.advanced += advanced2
+            if _notcontains_re.match(operator):
+                self.advanced += '.NOT'
+        elif _contents_re.match(operator):
+            advanced2 = ""
+            # To handle the LENGTH and OFFSET params.
+            seen = set()
+            while True:
+                match = _len_or_off_re.match(self.expr_params)
+                if not match:
+                    break
+                name = match.group(1).lower()
+                if len(name) > 7:
+                    self.err_handle(ERR_SYNTAX_MSG)
+                    return
+                if name == "-length"[:len(name)] and "length" not in seen:
+                    advanced2 = '.SUBSTR(0,' + match.group(2) + ')'
+                    seen.add("length")
+                elif name == "-offset"[:len(name)] and "offset" not in seen:
+                    self.advanced += '.SKIP(' + match.group(2) + ')'
+                    seen.add("offset")
+                else:
+                    break
+                self.expr_params = match.group(3)
+            self.advanced += advanced2 + ".LENGTH.GT(0)"
+        else:
+            self.err_handle(ERR_OPERATOR_MSG)
+
+    def parse_port_range_expr(self, operator, arg):
+        """
+        Converts the port range expression.
+        operator - classic numeric operator
+        arg - start of the port range
+        """
+        match = _range_end_re.match(self.expr_params)
+        if not match:
+            self.err_handle(ERR_SYNTAX_MSG)
+            return
+        arg2 = match.group(1)
+        self.expr_params = match.group(2)
+        if operator in ('==', '!=') or _between_re.match(operator):
+            # Same as List::Util min and max, which return the given values
+            low = arg2 if _to_uv(arg2) < _to_uv(arg) else arg
+            high = arg2 if _to_uv(arg2) > _to_uv(arg) else arg
+            self.advanced += ".BETWEEN(" + low + ", " + high + ")"
+            if operator == '!=':
+                self.advanced += ".NOT"
+        elif operator in ('>=', '>', '<=', '<'):
+            method, join = {'>=': ['.GE(', ' || '], '>': ['.GT(', ' || '],
+                            '<=': ['.LE(', ' && '], '<': ['.LT(', ' && ']
+                            }[operator]
+            self.advanced = (self.advanced + method + arg + ')' + join +
+                             self.advanced + method + arg2 + ')')
+        else:
+            self.err_handle(ERR_OPERATOR_MSG)
+
+    def parse_numeric_operator(self, operator, arg):
+        """
+        Converts the numeric operation.
+        operator - classic numeric operator
+        arg - argument of the operator
+        """
+        methods = {'==': '.EQ(', '>=': '.GE(', '>': '.GT(', '<=': '.LE(',
+                   '<': '.LT('}
+        if operator in methods:
+            self.advanced += methods[operator] + arg + ')'
+        elif operator == '!=':
+            self.advanced += '.EQ(' + arg + ').NOT'
+        elif _between_re.match(operator):
+            match = _range_end_re.match(self.expr_params)
+            if not match:
+                self.err_handle(ERR_SYNTAX_MSG)
+                return
+            self.expr_params = match.group(2)
+            self.advanced += ".BETWEEN(" + arg + "," + match.group(1) + ")"
+        else:
+            self.err_handle(ERR_OPERATOR_MSG)
+
+    def parse_netmask(self, netmask):
+        """
+        Returns the number of leading one bits in the netmask.
+        netmask - netmask in dotted decimal notation
+        """
+        octets = [_to_uv(octet) for octet in
+                  _netmask_octets_re.search(netmask).groups()]
+        bit_count = 0
+        index = 0
+        bit = 1 << 7
+        while True:
+            if index == 4:
+                # Tool warns when reading past the last octet
+                raise _NotTranslated()
+            if (octets[index] & bit) == 0:
+                break
+            bit = bit >> 1
+            if bit == 0:
+                bit = 1 << 7
+                index += 1
+            bit_count += 1
+        return bit_count
@@ -9,6 +9,41 @@
 """
 
 import logging
+import re
+from collections import OrderedDict
+
+# Whitespace that separates the tokens
+_blank_re = re.compile(r"[ \t\n]*")
+# Rest of a keyword name
+_key_arg_re = re.compile(r"[^ \t\n]*")
+# Run of characters that need no handling outside quotes
+_plain_re = re.compile(r"[^\"' \t\n()\\]*")
+# Run of characters that need no handling inside quotes
+_quoted_re = {
+    '"': re.compile(r'[^"\\]*'),
+    "'": re.compile(r"[^'\\]*"),
+}
+# First three words of a command, for command_header_key()
+_header_re = re.compile(r"[ \t\n]*([^ \t\n]*)[ \t\n]*([^ \t\n]*)"
+                        r"[ \t\n]*([^ \t\n]*)")
+# Characters of tokens that may need more than splitting at whitespace
+_special_re = re.compile(r"[\"'()]")
+# Characters that start a q quote after "q"
+_qquote_start_delims = "/{<|~$^+=&%@`?"
+# Escape sequences replaced inside quotes
+_escapes = {"t": "\t", "n": "\n", "r": "\r",
+            "'": "'", '"': '"', "\\": "\\"}
+# Whitespace that separates the Advanced expression tokens
+_adv_blank_re = re.compile(r"[ \t\r\n]*")
+# ASCII identifier characters
+_adv_ident_re = re.compile(r"[A-Za-z0-9_]*")
+# ASCII characters that continue an "other" token
+_adv_other_re = re.compile(
+    r"[\x00-\x08\x0b\x0c\x0e-\x1f!#-&(-@\[-^`{-\x7f]*")
+
+# Token lists of Advanced expressions, most recently used last
+adv_token_cache = OrderedDict()
+adv_token_cache_size = 4096
 
 
 class LexToken(object):
@@ -20,7 +55,9 @@ class LexToken(object):
             lineno - line number where the
                         token value is in the data parsed
             lexpos - Points to the token end position
+            lexer  - Set by PLY on the token of a syntax error
     """
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'lexer')
 
     def __init__(self, token_type, token_value, lineno, lex_pos):
         self.type = token_type
@@ -71,147 +108,144 @@ class Lexer(object):
         """
         Returns next token in a CLI command as a LexToken object.
         If there is no more data to be parsed, returns None.
+        Token boundaries are found with compiled regular expressions
+        and the token value is a slice of the data; a new string is
+        only built when escape sequences inside quotes are replaced.
         """
-        start_pos = self._lex_pos
-
+        data = self._data
+        data_len = len(data)
         # Handling spaces that comes around the tokens
-        while self._length > 0 and (self._data[self._lex_pos] in " \t\n"):
-            self.advance_token()
+        pos = _blank_re.match(data, self._lex_pos).end()
 
         # Ignoring comments
-        if self._length > 0 and self._data[self._lex_pos] == '#':
-            self.advance_token(self._length)
+        if pos < data_len and data[pos] == '#':
+            pos = data_len
 
         # When there is no more input to be parsed, returns None
-        if self._length <= 0:
+        if pos >= data_len:
+            self.advance_token(pos - self._lex_pos)
             return None
 
-        # Identifies Token type
-        token_type = None
-        if self._data[self._lex_pos] == '-':
-            token_type = "KEY_ARG"
-            # Removing '-' from the starting of the keyword
-            self.advance_token()
-
+        if data[pos] == '-':
+            # Removing '-' from the starting of the keyword,
             # quotes are not allowed in keywords
-            self._token_value = ""
-            while self._length > 0:
-                if self._data[self._lex_pos] in " \t\n":
-                    return LexToken(token_type, self._token_value, 1,
-                                    self._lex_pos - 1)
-                else:
-                    self.advance_and_append_token(self._data[self._lex_pos])
-            return LexToken(token_type, self._token_value, 1,
-                            self._lex_pos - 1)
-        else:
-            token_type = "NON_KEY"
+            end = _key_arg_re.match(data, pos + 1).end()
+            self.advance_token(end - self._lex_pos)
+            self._token_value = data[pos + 1:end]
+            return LexToken("KEY_ARG", self._token_value, 1, end - 1)
 
-        start_pos = self._lex_pos
+        self.advance_token(pos - self._lex_pos)
+        start_pos = pos
 
         # Handling q quote
-        qquote_start_delims = "/{<|~$^+=&%@`?"
         qquote_end_delims = {"{": "}", "<": ">"}
 
-        if (self._length > 2 and self._data[start_pos] == 'q' and
-           self._data[start_pos + 1] in qquote_start_delims):
-            qquote_end_char = qquote_end_delims.get(self._data[start_pos + 1],
-                                                    self._data[start_pos + 1])
-            qquote_end_index = self._data.find(qquote_end_char, start_pos + 2)
+        if (self._length > 2 and data[start_pos] == 'q' and
+           data[start_pos + 1] in _qquote_start_delims):
+            qquote_end_char = qquote_end_delims.get(data[start_pos + 1],
+                                                    data[start_pos + 1])
+            qquote_end_index = data.find(qquote_end_char, start_pos + 2)
             if (qquote_end_index != -1 and
-                (qquote_end_index == len(self._data) - 1 or
-                 self._data[qquote_end_index + 1] in " \t\n")):
+                (qquote_end_index == len(data) - 1 or
+                 data[qquote_end_index + 1] in " \t\n")):
                 next_token = LexToken("NON_KEY",
-                                      self._data[start_pos + 2:
-                                                 qquote_end_index],
+                                      data[start_pos + 2:qquote_end_index],
                                       1, qquote_end_index)
                 self.advance_token(len(next_token.value) + 3)
                 return next_token
 
+        token_type = "NON_KEY"
         state = " "
         parenthesis_counter = 0
-        self._token_value = ""
-        while self._length > 0:
-            if self._data[self._lex_pos] in "\"'":
-                if self._data[self._lex_pos] == state:
-                    # end of quotes
-                    state = " "
-                    """
-                    If token starts with quotes and the corresponding ending
-                        quotes appear, then this will be the end of the token.
-                    If token doesn't start with the quote,
-                        then this will be the end of the quote but not the
-                        end of the token.
-                    """
-                    if self._data[self._lex_pos] == self._data[start_pos]:
-                        # Removing end quotes by not appending the character
-                        self.advance_token()
-                        break
-                    self.advance_and_append_token(self._data[self._lex_pos])
-                elif state in "\"'":
-                    # single quote within double quote or vice versa
-                    self.advance_and_append_token(self._data[self._lex_pos])
-                else:
-                    # now inside quotes
-                    state = self._data[self._lex_pos]
-                    # Removing starting quotes
-                    if self._lex_pos != start_pos:
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos])
-                    else:
-                        self.advance_token()
-            elif self._data[self._lex_pos] in " \t\n":
-                if state == " " and parenthesis_counter == 0:
+        # Unescaped pieces of the token value; the value is
+        # pieces + data[seg_start:value_end]
+        pieces = []
+        seg_start = start_pos
+        value_end = None
+        while True:
+            if state == " ":
+                pos = _plain_re.match(data, pos).end()
+            else:
+                pos = _quoted_re[state].match(data, pos).end()
+            if pos >= data_len:
+                break
+            ch = data[pos]
+            if ch == state and state != " ":
+                # end of quotes
+                state = " "
+                """
+                If token starts with quotes and the corresponding ending
+                    quotes appear, then this will be the end of the token.
+                If token doesn't start with the quote,
+                    then this will be the end of the quote but not the
+                    end of the token.
+                """
+                if ch == data[start_pos]:
+                    # Removing end quotes by not including the character
+                    value_end = pos
+                    pos += 1
                     break
-                # This case occurs when whitespace appears inside quotes
-                self.advance_and_append_token(self._data[self._lex_pos])
-            elif self._data[self._lex_pos] == "(":
-                self.advance_and_append_token(self._data[self._lex_pos])
-                if state not in "\"'":
-                    parenthesis_counter += 1
-            elif self._data[self._lex_pos] == ")":
-                self.advance_and_append_token(self._data[self._lex_pos])
-                if state not in "\"'":
-                    if parenthesis_counter > 0:
-                        parenthesis_counter -= 1
-                    else:
-                        self.advance_token(self._length)
-                        token_type = "ERROR"
-                        logging.error("Data: {}".format(self._data))
-                        logging.error("Unbalanced closed parenthesis")
-                        break
-            elif self._data[self._lex_pos] == "\\":
+                pos += 1
+            elif ch == "\\":
+                if state == " ":
+                    pos += 1
+                    continue
                 # backslashes are escapes inside quotes
-                if state in "\"'":
-                    if self._length == 1:
-                        # \\ followed by end of the command
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos])
-                        token_type = "ERROR"
-                        logging.error("Data: {}".format(self._data))
-                        logging.error("Blackslashes inside quotes are "
-                                      "followed by end of the command")
-                        break
-                    if self._data[self._lex_pos + 1] == 't':
-                        self.advance_and_append_token('\t', 2)
-                    elif self._data[self._lex_pos + 1] == 'n':
-                        self.advance_and_append_token('\n', 2)
-                    elif self._data[self._lex_pos + 1] == 'r':
-                        self.advance_and_append_token('\r', 2)
-                    elif self._data[self._lex_pos + 1] in "'\"\\":
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos + 1], 2)
-                    else:
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos])
+                if pos == data_len - 1:
+                    # \\ followed by end of the command
+                    pos += 1
+                    token_type = "ERROR"
+                    logging.error("Data: {}".format(data))
+                    logging.error("Blackslashes inside quotes are "
+                                  "followed by end of the command")
+                    break
+                escaped = _escapes.get(data[pos + 1])
+                if escaped is None:
+                    pos += 1
+                else:
+                    pieces.append(data[seg_start:pos])
+                    pieces.append(escaped)
+                    pos += 2
+                    seg_start = pos
+            elif ch in "\"'":
+                # now inside quotes
+                state = ch
+                if pos == start_pos:
+                    # Removing starting quotes
+                    seg_start = pos + 1
+                pos += 1
+            elif ch == "(":
+                parenthesis_counter += 1
+                pos += 1
+            elif ch == ")":
+                pos += 1
+                if parenthesis_counter > 0:
+                    parenthesis_counter -= 1
                 else:
-                    self.advance_and_append_token(self._data[self._lex_pos])
+                    value_end = pos
+                    pos = data_len
+                    token_type = "ERROR"
+                    logging.error("Data: {}".format(data))
+                    logging.error("Unbalanced closed parenthesis")
+                    break
+            elif parenthesis_counter == 0:
+                # whitespace ends the token
+                break
             else:
-                self.advance_and_append_token(self._data[self._lex_pos])
+                # whitespace inside parenthesis
+                pos += 1
+        if value_end is None:
+            value_end = pos
+        self._token_value = data[seg_start:value_end]
+        if pieces:
+            pieces.append(self._token_value)
+            self._token_value = "".join(pieces)
+        self.advance_token(pos - self._lex_pos)
 
         if state in "\"'" or parenthesis_counter > 0:
             # error token for not matching with any rule
             token_type = "ERROR"
-            logging.error("Data: {}".format(self._data))
+            logging.error("Data: {}".format(data))
             logging.error("Unbalanced parenthesis or quotes")
         next_token = LexToken(token_type, self._token_value, 1,
                               self._lex_pos - 1)
@@ -255,115 +289,210 @@ class Lexer(object):
         Returns next token as LexToken object.
         If there is no more data to be parsed, returns None.
         """
+        errors = []
+        next_token = self._adv_expr_token(errors)
+        for message in errors:
+            logging.error(message)
+        return next_token
+
+    def _adv_expr_token(self, errors):
+        """
+        Returns next token in an Advanced expression as a LexToken
+        object, or None if there is no more data to be parsed.
+        Runs of characters are consumed with compiled regular
+        expressions and the token value is built from slices.
+        errors - list to which error messages are appended
+                 instead of logging them
+        """
+        data = self._data
+        data_len = len(data)
         # Handling spaces that comes around the tokens
-        while self._length > 0 and (self._data[self._lex_pos] in " \t\r\n"):
-            self.advance_token()
+        pos = _adv_blank_re.match(data, self._lex_pos).end()
 
         # When there is no more input to be parsed, returns None
-        if self._length <= 0:
+        if pos >= data_len:
+            self.advance_token(pos - self._lex_pos)
             return None
 
         # Identifies Token type
         token_type = "OTHER"
-
-        start_pos = self._lex_pos
-
+        start_pos = pos
+        # Value of the token before a quote or regex started
+        prefix = ""
         state = " "
-        self._token_value = ""
-        while self._length > 0:
-            if state == "REGEX" and self._data[self._lex_pos] == regex_end:
-                # End of regex
-                state = " "
-                self.advance_token()
-                break
-            elif self._data[self._lex_pos] in "\"'":
-                if self._data[self._lex_pos] == state:
-                    # end of quotes
-                    state = " "
-                    # Removing end quotes by not appending the character
-                    self.advance_token()
+        while pos < data_len:
+            ch = data[pos]
+            if state == "IDENTIFIER":
+                pos = _adv_ident_re.match(data, pos).end()
+                if pos >= data_len:
                     break
-                elif state in "\"'":
-                    # single quote within double quote or vice versa
-                    self.advance_and_append_token(self._data[self._lex_pos])
-                elif state == "REGEX":
-                    self.advance_and_append_token(self._data[self._lex_pos])
-                else:
+                ch = data[pos]
+                if ch in "\"'":
                     # now inside quotes
-                    state = self._data[self._lex_pos]
-                    # Removing starting quotes
-                    self.advance_token()
+                    prefix = data[start_pos:pos]
+                    state = ch
                     token_type = "STRING"
-            elif state == " " and self._data[self._lex_pos] in " \t\r\n":
+                    break
+                if not Lexer.adv_ident_char(ch):
+                    state = " "
+                    break
+                # More of identifier
+                pos += 1
+            elif ch in "\"'":
+                # now inside quotes
+                prefix = data[start_pos:pos]
+                state = ch
+                token_type = "STRING"
+                break
+            elif ch in " \t\r\n":
                 # Whitespace ends most tokens
                 break
-            elif (state == " " and self._length >= 5 and
-                    self._data[self._lex_pos:self._lex_pos+2].lower() == 're'
-                    and not Lexer.adv_ident_char(self._data[self._lex_pos+2])):
+            elif (data_len - pos >= 5 and ch in "rR" and
+                    data[pos + 1] in "eE" and
+                    not Lexer.adv_ident_char(data[pos + 2])):
                 # Start of regex
+                prefix = data[start_pos:pos]
                 state = "REGEX"
                 token_type = "REGEX"
-                regex_end = self._data[self._lex_pos+2]
-                self.advance_token(3)
-            elif ((self._data[self._lex_pos] == "_") or
-                  (self._data[self._lex_pos].isalpha())):
-                if ((state not in "\"'" and state != "IDENTIFIER" and
-                     state != "REGEX" and self._lex_pos != start_pos)):
+                break
+            elif ch == "_" or ch.isalpha():
+                if pos != start_pos:
                     # End of "other"
                     break
-                elif state not in "\"'" and state != "REGEX":
-                    # start of an identifier
-                    state = "IDENTIFIER"
-                    token_type = "IDENTIFIER"
-                    self.advance_and_append_token(self._data[self._lex_pos])
-                else:
-                    self.advance_and_append_token(self._data[self._lex_pos])
-            elif (not Lexer.adv_ident_char(self._data[self._lex_pos])):
-                if state == "IDENTIFIER":
-                    state = " "
-                    break
-                else:
-                    # More of identifier
-                    self.advance_and_append_token(self._data[self._lex_pos])
-            elif self._data[self._lex_pos] == "\\":
-                # backslashes are escapes inside quotes
-                if state in "\"'":
-                    if self._length == 1:
-                        # \\ followed by end of the expression
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos])
-                        token_type = "ERROR"
-                        logging.error("Data: {}".format(self._data))
-                        logging.error("Blackslashes inside quotes are "
-                                      "followed by end of the expression")
-                        break
-                    if self._data[self._lex_pos + 1] == 't':
-                        self.advance_and_append_token('\t', 2)
-                    elif self._data[self._lex_pos + 1] == 'n':
-                        self.advance_and_append_token('\n', 2)
-                    elif self._data[self._lex_pos + 1] == 'r':
-                        self.advance_and_append_token('\r', 2)
-                    elif self._data[self._lex_pos + 1] in "'\"\\":
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos + 1], 2)
-                    else:
-                        self.advance_and_append_token(
-                                        self._data[self._lex_pos])
-                else:
-                    self.advance_and_append_token(self._data[self._lex_pos])
+                # start of an identifier
+                state = "IDENTIFIER"
+                token_type = "IDENTIFIER"
+                pos += 1
             else:
-                self.advance_and_append_token(self._data[self._lex_pos])
+                pos = _adv_other_re.match(data, pos + 1).end()
 
-        if state in "\"'":
-            # error token for not matching with any rule
-            token_type = "ERROR"
-            logging.error("Data: {}".format(self._data))
-            logging.error("Unbalanced quotes")
-        elif state == "REGEX":
-            # error token for not matching with any rule
-            token_type = "ERROR"
-            logging.error("Data: {}".format(self._data))
-            logging.error("Unterminated regex")
+        if state == " " or state == "IDENTIFIER":
+            self._token_value = data[start_pos:pos]
+        else:
+            if state == "REGEX":
+                end_char = data[pos + 2]
+                pos += 3
+            else:
+                end_char = state
+                # Removing starting quotes
+                pos += 1
+            end_pos = data.find(end_char, pos)
+            if end_pos == -1:
+                self._token_value = prefix + data[pos:]
+                pos = data_len
+                # error token for not matching with any rule
+                token_type = "ERROR"
+                errors.append("Data: {}".format(data))
+                if state == "REGEX":
+                    errors.append("Unterminated regex")
+                else:
+                    errors.append("Unbalanced quotes")
+            else:
+                # Removing the end quotes or regex delimiter
+                self._token_value = prefix + data[pos:end_pos]
+                pos = end_pos + 1
+        self.advance_token(pos - self._lex_pos)
         next_token = LexToken(token_type, self._token_value, 1,
                               self._lex_pos - 1)
         return next_token
+
+
+def command_header_key(command):
+    """
+    Returns the command type of a CLI command, read from its first three
+    words without tokenizing the whole command.
+    The command type is known only when the command has no quotes or
+    parentheses, and its first two words are neither keywords nor q
+    quotes: then the parser gets the same words and logs no errors.
+    command - the CLI command
+    Returns "" for an empty or comment line, which parses to no command,
+    "<op> <group> <ot>" in lowercase as " ".join(get_command_type()) of
+    the parse tree, or None if only the parser can tell.
+    """
+    op, group, ot = _header_re.match(command).groups()
+    if not op or op[0] == "#":
+        return ""
+    if (not group or op[0] == "-" or group[0] in "-#" or
+            _special_re.search(command) is not None):
+        return None
+    if ot and ot[0] in "-#":
+        # keyword or comment, the command has no object type
+        ot = ""
+    for word in (op, group, ot):
+        if (len(word) > 1 and word[0] == "q" and
+                word[1] in _qquote_start_delims):
+            return None
+    return " ".join((op, group, ot)).lower()
+
+
+def header_scan_patterns(command_types):
+    """
+    Returns compiled regular expressions over the bytes of a config which
+    together find the lines for which command_header_key() returns None or
+    one of command_types, so that the other lines need not be looked at
+    one by one: the first one matches the newline before such a line by
+    its first words, the second one a quote, a parenthesis or a non-ASCII
+    character, whose lowercase may be ASCII, anywhere in a line.
+    The first line of the config is not found by the first one.
+    command_types - command types "<op> <group> <ot>" in lowercase
+    """
+    def escape(word):
+        return re.escape(word).encode("ascii")
+    types = OrderedDict()
+    for command_type in sorted(command_types):
+        op, group, ot = command_type.split(" ")
+        types.setdefault(op, OrderedDict()).setdefault(
+            group, []).append(ot)
+    # The command types as a tree of op, group and ot alternatives.
+    type_re = b"|".join(
+        escape(op) + b"[ \t]+(?:" + b"|".join(
+            escape(group) + b"[ \t]+(?:" +
+            b"|".join(escape(ot) for ot in ots) + b")"
+            for group, ots in groups.items()) + b")"
+        for op, groups in types.items())
+    qquote_re = b"q[" + escape(_qquote_start_delims) + b"]"
+    header_re = re.compile(
+        b"\n(?=[ \t]*(?:"
+        # keyword as first word, or q quote in the first three words
+        b"-|" + qquote_re + b"|[^ \t\n#]+(?:"
+        # a single word
+        b"[ \t]*(?:\n|$)"
+        # keyword or comment as second word
+        b"|[ \t]+(?:[-#]|" + qquote_re +
+        b"|[^ \t\n]+[ \t]+" + qquote_re + b"))"
+        b"|(?i:" + type_re + b")(?:[ \t\n]|$)))")
+    return [header_re, re.compile(b"[\"'()\x80-\xff]")]
+
+
+def adv_expr_tokens(expr):
+    """
+    Generates the tokens of an Advanced expression, as
+    Lexer.adv_expr_token() returns them.
+    The token lists are kept in a bounded LRU cache keyed by the
+    expression text, so the same expression is tokenized only once;
+    the returned tokens are shared and must not be modified.
+    Errors are logged when the erroneous token is reached, as
+    adv_expr_token() does.
+    expr - Advanced expression to tokenize
+    """
+    entry = adv_token_cache.pop(expr, None)
+    if entry is None:
+        lexer = Lexer()
+        lexer.input(expr)
+        tokens = []
+        errors = []
+        while True:
+            next_token = lexer._adv_expr_token(errors)
+            if not next_token:
+                break
+            tokens.append(next_token)
+        entry = (tuple(tokens), tuple(errors))
+        if len(adv_token_cache) >= adv_token_cache_size:
+            adv_token_cache.popitem(last=False)
+    adv_token_cache[expr] = entry
+    tokens, errors = entry
+    for next_token in tokens:
+        if next_token.type == "ERROR":
+            for message in errors:
+                logging.error(message)
+        yield next_token
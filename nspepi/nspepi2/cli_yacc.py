@@ -4,10 +4,12 @@
 # Use of this software is governed by the license terms, if any,
 # which accompany or are included with this software.
 
-import ply.yacc as yacc
 import cli_lex
 from nspepi_parse_tree import *
 import logging
+import os
+import sys
+import nspepi_common as common
 
 tokens = ('NON_KEY', 'KEY_ARG')
 
@@ -36,19 +38,22 @@ def p_command_name_no_ot(p):
 
 def p_op(p):
     'op : NON_KEY'
-    logging.debug("CLI lex op: " + p[1])
+    if common.debug_trace:
+        logging.debug("CLI lex op: " + p[1])
     p[0] = p[1]
 
 
 def p_group(p):
     'group : NON_KEY'
-    logging.debug("CLI lex group: " + p[1])
+    if common.debug_trace:
+        logging.debug("CLI lex group: " + p[1])
     p[0] = p[1]
 
 
 def p_ot(p):
     'ot : NON_KEY'
-    logging.debug("CLI lex ot: " + p[1])
+    if common.debug_trace:
+        logging.debug("CLI lex ot: " + p[1])
     p[0] = p[1]
 
 
@@ -59,7 +64,8 @@ def p_empty(p):
 
 def p_pos_params(p):
     'positional_parameters : positional_parameters NON_KEY'
-    logging.debug("CLI lex pos: " + p[2])
+    if common.debug_trace:
+        logging.debug("CLI lex pos: " + p[2])
     p[0] = p[1] + [CLIPositionalParameter(p[2])]
 
 
@@ -86,13 +92,15 @@ def p_key_param(p):
 
 def p_keyword(p):
     'keyword : KEY_ARG'
-    logging.debug("CLI lex key: " + p[1])
+    if common.debug_trace:
+        logging.debug("CLI lex key: " + p[1])
     p[0] = CLIKeywordName(p[1])
 
 
 def p_key_val(p):
     'keyword_value : keyword_value NON_KEY'
-    logging.debug("CLI lex key val: " + p[2])
+    if common.debug_trace:
+        logging.debug("CLI lex key val: " + p[2])
     p[0] = p[1] + [p[2]]
 
 
@@ -108,8 +116,138 @@ def p_error(p):
     logging.error("CLI syntax error at " + str(p))
 
 
+class _CLISyntaxError(Exception):
+    """ Token not allowed by the grammar, None for end of command. """
+
+    def __init__(self, token):
+        super(_CLISyntaxError, self).__init__()
+        self.token = token
+
+
+class CLIParser(object):
+    """
+    Parser for the grammar above which builds the parse tree directly from
+    the lexer tokens. It gives the same trees and log messages as the PLY
+    parser, and reads tokens and runs the rules in the same order.
+    Like PLY, after a syntax error it parses the tokens that follow the
+    erroneous token as a new command, and does not report further errors
+    until three tokens have been shifted.
+    """
+
+    # Tokens to shift after an error before errors are reported again.
+    error_count = 3
+
+    def __init__(self, lexer):
+        self._lexer = lexer
+        self._lookahead = None
+        self._errorcount = 0
+
+    def parse(self, cmd):
+        """ Parse a CLI command.
+        cmd - the CLI command
+        returns the parse tree or None if either "empty" line or syntax
+        error
+        """
+        self._lexer.input(cmd)
+        self._errorcount = 0
+        while True:
+            try:
+                return self._command()
+            except _CLISyntaxError as exc:
+                if self._errorcount == 0:
+                    p_error(exc.token)
+                self._errorcount = self.error_count
+                if exc.token is None:
+                    return None
+
+    def _read(self, allowed=("NON_KEY", "KEY_ARG")):
+        """ Reads the next token, which must be end of command or of one of
+        the allowed types.
+        """
+        self._lookahead = self._lexer.token()
+        if (self._lookahead is not None and
+                self._lookahead.type not in allowed):
+            raise _CLISyntaxError(self._lookahead)
+
+    def _at(self, token_type):
+        """ Whether the lookahead token is of the given type. """
+        return (self._lookahead is not None and
+                self._lookahead.type == token_type)
+
+    def _shift(self):
+        """ Consumes the lookahead token and returns its value. """
+        if self._errorcount:
+            self._errorcount -= 1
+        return self._lookahead.value
+
+    def _command(self):
+        self._read(("NON_KEY",))
+        if self._lookahead is None:
+            return None
+        op = self._shift()
+        if common.debug_trace:
+            logging.debug("CLI lex op: " + op)
+        self._read(("NON_KEY",))
+        if self._lookahead is None:
+            raise _CLISyntaxError(None)
+        group = self._shift()
+        self._read()
+        if common.debug_trace:
+            logging.debug("CLI lex group: " + group)
+        if self._at("NON_KEY"):
+            ot = self._shift()
+            self._read()
+            if common.debug_trace:
+                logging.debug("CLI lex ot: " + ot)
+            command = CLICommand(op, group, ot)
+        else:
+            command = CLICommand(op, group, "")
+        positionals = []
+        while self._at("NON_KEY"):
+            value = self._shift()
+            self._read()
+            if common.debug_trace:
+                logging.debug("CLI lex pos: " + value)
+            positionals.append(CLIPositionalParameter(value))
+        keywords = []
+        while self._at("KEY_ARG"):
+            name = self._shift()
+            self._read()
+            if common.debug_trace:
+                logging.debug("CLI lex key: " + name)
+            keyword = CLIKeywordName(name)
+            values = []
+            while self._at("NON_KEY"):
+                value = self._shift()
+                self._read()
+                if common.debug_trace:
+                    logging.debug("CLI lex key val: " + value)
+                values.append(value)
+            keyword_param = CLIKeywordParameter(keyword)
+            keyword_param.add_value_list(values)
+            keywords.append(keyword_param)
+        command.add_positional_list(positionals)
+        command.add_keyword_list(keywords)
+        return command
+
+
+# Set to parse commands with the PLY parser built from the grammar above
+# instead of CLIParser.
+use_ply = False
 _lexer = None
 _parser = None
+for _name, _factory in (("use_ply", lambda: False), ("_lexer", lambda: None),
+                        ("_parser", lambda: None)):
+    common.register_run_state(sys.modules[__name__], _name, _factory)
+
+
+# PLY parser, built once per process as it does not keep state between
+# commands.
+_ply_parser = None
+# File where PLY keeps the parser tables between runs. PLY rebuilds the
+# tables when the grammar changes.
+_ply_tables_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "__pycache__", "cli_parsetab.pickle")
 
 
 def cli_yacc_init():
@@ -117,8 +255,29 @@ def cli_yacc_init():
     """
     global _lexer
     global _parser
+    global _ply_parser
     _lexer = cli_lex.Lexer()
-    _parser = yacc.yacc(debug=False, write_tables=False)
+    if use_ply:
+        if _ply_parser is None:
+            try:
+                import ply.yacc as yacc
+            except ImportError:
+                sys.exit("As required module PLY is not present, we can't"
+                         " run the NSPEPI tool with --usePly")
+            tables_dir = os.path.dirname(_ply_tables_file)
+            try:
+                if not os.path.isdir(tables_dir):
+                    os.makedirs(tables_dir)
+            except OSError:
+                # The tables are then built without being kept.
+                pass
+            # Failures to write the tables are only warnings, which are
+            # not shown.
+            _ply_parser = yacc.yacc(debug=False, picklefile=_ply_tables_file,
+                                    errorlog=yacc.NullLogger())
+        _parser = _ply_parser
+    else:
+        _parser = CLIParser(_lexer)
 
 
 def cli_yacc_parse(cmd, lineno):
@@ -127,7 +286,10 @@ def cli_yacc_parse(cmd, lineno):
     lineno - the line number of the command
     returns the parse tree or None if either "empty" line or syntax error
     """
-    tree = _parser.parse(cmd, lexer=_lexer)
+    if use_ply:
+        tree = _parser.parse(cmd, lexer=_lexer)
+    else:
+        tree = _parser.parse(cmd)
     if tree is not None:
         tree.original_line = cmd
         tree.lineno = lineno
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Microbenchmark of CLI value quoting and of string literal decoding, through
+CLIParseTreeNode.normalize() and PILex.get_pi_string(), on long values as
+found in responder and rewrite policies.
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import argparse
+
+import benchmark_common
+
+
+def respondwith_body():
+    """ Returns an HTTP response of about 8 KB as a respondwith value. """
+    header = ('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n'
+              'Set-Cookie: id="a\\b"; path=/\r\n\r\n')
+    line = '<p class="note">Request for (URL) was \t"blocked"</p>\n'
+    return header + line * (8192 // len(line))
+
+
+def rewrite_rule():
+    """ Returns an Advanced expression of about 4.5 KB. """
+    term = 'HTTP.REQ.HEADER("X-Forwarded-For").CONTAINS("10.1.1.1") || '
+    return (term * (4608 // len(term))) + "true"
+
+
+def string_literal():
+    """ Returns a string literal of about 9 KB with escapes, and a tail. """
+    chunk = 'abc \\"def\\" \\t\\x41\\101 \\\\ path/to/file.html '
+    return '"' + chunk * (9216 // len(chunk)) + '") && true'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure CLI value quoting and string literal"
+                    " decoding.")
+    benchmark_common.add_arguments(arg_parser, runs=101)
+    args = arg_parser.parse_args()
+    benchmark_common.use_nspepi_dir(args.nspepi_dir)
+    from nspepi_parse_tree import CLIParseTreeNode
+    from pi_lex import PILex
+    node = CLIParseTreeNode()
+    body = respondwith_body()
+    rule = rewrite_rule()
+    literal = string_literal()
+    benchmark_common.report(
+        "normalize, {} B respondwith body".format(len(body)),
+        benchmark_common.median_time(lambda: node.normalize(body, True),
+                                     args.runs, 10))
+    benchmark_common.report(
+        "normalize, {} B rule".format(len(rule)),
+        benchmark_common.median_time(lambda: node.normalize(rule),
+                                     args.runs, 10))
+    benchmark_common.report(
+        "get_pi_string, {} B literal".format(len(literal)),
+        benchmark_common.median_time(lambda: PILex.get_pi_string(literal),
+                                     args.runs, 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,7 @@
 Checks whether config file contains invalid
 epressions and features.
 
-Dependency packages: PLY, pytest
+Dependency packages: pytest, PLY (optional, for --usePly)
 """
 
 # Ensure that the version string conforms to PEP 440:
@@ -29,6 +29,8 @@ import inspect
 
 import cli_yacc
 import nspepi_common as common
+import nspepi_input
+import nspepi_output
 
 import check_classic_configs
 
@@ -123,6 +125,10 @@ def check_config_file(infile, outfile, verbose):
                     output = m.method(m.obj, parsed_tree)
                     if len(output) != 0:
                          output_line(cmd, outfile, verbose)
+    logging.debug("nspepi tool output cache: {} hits, {} misses, {} of"
+        " them on disk".format(
+        common.nspepi_tool_cache_hits, common.nspepi_tool_cache_misses,
+        common.nspepi_tool_disk_cache_hits))
 
 
 
@@ -137,29 +143,54 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter)
     arg_parser.add_argument(
         "-f", "--infile", metavar="<path to ns config file>",
-        help="Checks whether invalid config is present in the input file",
+        help="Checks whether invalid config is present in the input file,"
+             " which can be gzip, bzip2 or xz compressed, or - to read it"
+             " from the standard input",
         required=True)
+    arg_parser.add_argument(
+        "-o", "--outfile", metavar="<path to issues file>",
+        help="write the commands using invalid config to this file, or to"
+             " the standard output for - (default: issues_<config file"
+             " name>, or the standard output when reading the standard"
+             " input)")
     arg_parser.add_argument(
         "-v", "--verbose", action="store_true", help="show verbose output")
     arg_parser.add_argument(
         '-V', '--version', action='version',
         version='%(prog)s {}'.format(__version__))
+    arg_parser.add_argument(
+        "--cache-dir", metavar="<path to cache directory>",
+        help="reuse expression conversions of earlier runs kept in this"
+             " directory")
     arg_parser.add_argument(
         '-B', '--buildVersion', default='13.1',
         help="Build version for which invalid commands"
 	" need to check")
+    arg_parser.add_argument('--usePly', action="store_true",
+        help=argparse.SUPPRESS)
     try:
         args = arg_parser.parse_args()
     except IOError as e:
         exit(str(e))
     # obtain logging parameters and setup logging
-    conf_file_path = os.path.dirname(args.infile)
-    conf_file_name = os.path.basename(args.infile)
+    conf_file_path = ''
+    if args.infile != nspepi_input.stdin_name:
+        conf_file_path = os.path.dirname(args.infile)
+    conf_file_name = nspepi_input.config_name(args.infile)
+    if args.cache_dir is not None:
+        common.open_nspepi_tool_disk_cache(args.cache_dir)
+    cli_yacc.use_ply = args.usePly
     check_classic_configs.check_configs_init()
     check_classic_configs.build_version = args.buildVersion
-    new_path = os.path.join(conf_file_path, "issues_" + conf_file_name)
-    with open(args.infile, 'r') as infile:
-        with open(new_path, 'w') as outfile:
+    new_path = args.outfile
+    if new_path is None:
+        if args.infile == nspepi_input.stdin_name:
+            new_path = "-"
+        else:
+            new_path = os.path.join(conf_file_path, "issues_" + conf_file_name)
+    with nspepi_input.open_config(args.infile) as infile:
+        with nspepi_output.OutputFile(
+                None if new_path == "-" else new_path) as outfile:
             check_config_file(infile, outfile, args.verbose)
 
 
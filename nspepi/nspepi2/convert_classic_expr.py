@@ -7,6 +7,7 @@
 import logging
 import subprocess
 import re
+import sys
 import convert_cli_commands as cli_commands
 import nspepi_common as common
 
@@ -37,18 +38,47 @@ q_s_expr = re.compile(r'\b((Q\.HOSTNAME)|(Q\.TRACKING)|'
                     r'(S\.CACHE_CONTROL)|(S\.TXID)|(S\.MEDIA))\b',
                     re.IGNORECASE)
 
+# Results of convert_classic_expr, including failures (None), keyed on the
+# expression, ignore_csec_expr and the named expression state, since named
+# expressions affect the result. Errors are logged only when the result is
+# computed.
+conversion_cache = {}
+conversion_cache_hits = 0
+conversion_cache_misses = 0
+common.register_run_state(sys.modules[__name__], "conversion_cache", dict)
+common.register_run_state(sys.modules[__name__], "conversion_cache_hits",
+                          lambda: 0)
+common.register_run_state(sys.modules[__name__], "conversion_cache_misses",
+                          lambda: 0)
+
 def convert_classic_expr(classic_expr, ignore_csec_expr = False):
+    """
+    Converts classic expression to advanced expression, looking up
+    conversion_cache first.
+    classic_expr - classic expression to convert
+    ignore_csec_expr - whether client security expressions are ignored
+    Returns None in case of any Error. Otherwise returns converted expression.
+    """
+    global conversion_cache_hits
+    global conversion_cache_misses
+    key = (classic_expr, ignore_csec_expr, cli_commands.named_expr_state())
+    if key in conversion_cache:
+        conversion_cache_hits += 1
+        return conversion_cache[key]
+    conversion_cache_misses += 1
+    result = convert_classic_expr_uncached(classic_expr, ignore_csec_expr)
+    conversion_cache[key] = result
+    return result
+
+def convert_classic_expr_uncached(classic_expr, ignore_csec_expr = False):
     tree_obj = CLIParseTreeNode()
     info_msg = 'INFO: Expression is not converted' + \
         ' - most likely it is a valid advanced expression'
     try:
-        nspepi_tool_path = common.get_nspepi_tool_path()
         """Error message will be in the staring of
         output, whereas warning and info messages
         will be present in the last."""
-        nspepi_tool_output = subprocess.check_output(
-            ['perl', nspepi_tool_path, '-e', classic_expr],
-            shell=False, stderr=subprocess.STDOUT)
+        nspepi_tool_output = common.run_nspepi_tool(classic_expr)
         """ old nspepi tool adds newline character at the end
         of the converted string, so remove that character."""
         nspepi_tool_output = nspepi_tool_output.rstrip()
@@ -90,6 +120,36 @@ def convert_classic_expr(classic_expr, ignore_csec_expr = False):
     nspepi_tool_output = tree_obj.normalize(nspepi_tool_output, True)
     return nspepi_tool_output
 
+def collect_classic_exprs(tree, classic_exprs):
+    """
+    Adds the classic expressions which converting the given command can run
+    through old nspepi tool: -rule value, rule of policies and
+    SYS.EVAL_CLASSIC_EXPR arguments in any parameter.
+    tree - parse tree of the command, before it is converted
+    classic_exprs - set to add the expressions to
+    """
+    rule = common.get_cmd_arg("rule", tree)
+    if rule is not None:
+        classic_exprs.add(rule)
+    command = " ".join(tree.get_command_type()).lower()
+    if command.endswith("policy") or command == "add policy expression":
+        rule = common.get_cmd_arg(1, tree)
+        if rule is not None:
+            classic_exprs.add(rule)
+    for value in tree.parameter_values():
+        if not eval_classic_expr.search(value):
+            continue
+        # Arguments as seen in both passes, Q and S prefixes are converted
+        # before SYS.EVAL_CLASSIC_EXPR in the second one.
+        for expr in (value,
+                     convert_q_s_expr(
+                         convert_body_expr_without_arg_present(value))):
+            for match in re.finditer(eval_classic_expr, expr):
+                classic_exp_info = PILex.get_pi_string(
+                    expr[match.end() - 1:])
+                if classic_exp_info is not None:
+                    classic_exprs.add(classic_exp_info[0])
+
 def convert_adv_expr(advanced_expr):
     """
     Converts Q and S prefixes.
@@ -196,7 +256,7 @@ def convert_sys_eval_classic_expr(advanced_expr):
         if cli_commands.no_conversion_collect_data:
             expr_list = cli_commands.get_classic_expr_list(classic_expr)
             for expr_info in expr_list:
-                cli_commands.classic_named_expr_in_use.append(expr_info[0].lower())
+                cli_commands.classic_named_expr_in_use.add(expr_info[0].lower())
         converted_expr = convert_classic_expr(classic_expr)
         if converted_expr is not None:
             # Result from convert_classic_expr will have enclosing quotes.
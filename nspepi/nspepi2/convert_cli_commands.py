@@ -6,6 +6,7 @@
 
 import collections
 import copy
+import re
 
 import cli_lex
 import nspepi_common as common
@@ -32,25 +33,19 @@ def convert_cli_init():
     named_expr = {}
     policy_entities_names = set()
     classic_entities_names = set()
+    global named_expr_generation
+    named_expr_generation = 0
+    convert_classic_expr.conversion_cache.clear()
     # Register built-in named expressions.
     NamedExpression.register_built_in_named_exprs()
-    global cli_global_binds
-    global cli_vserver_binds
-    global cli_user_binds
-    global cli_group_binds
-    global cli_service_binds
     global filter_policy_exists
     global no_conversion_collect_data
     global classic_named_expr_in_use
     global parsing_config_file
     global named_expr_reference_list
-    global process_expr_referece_list
+    global named_expr_line_numbers
     global tool_error_comment
-    cli_global_binds = OrderedDict()
-    cli_vserver_binds = OrderedDict()
-    cli_user_binds = OrderedDict()
-    cli_group_binds = OrderedDict()
-    cli_service_binds = OrderedDict()
+    common.pols_binds.binds.clear()
     # filter_policy_exists would be true
     # if any filter policy is configured.
     filter_policy_exists = False
@@ -61,10 +56,13 @@ def convert_cli_init():
     #Stores the name of the named expression
     # which is being used in the feature from
     # which classic support is removed
-    classic_named_expr_in_use = []
+    classic_named_expr_in_use = set()
     parsing_config_file = False
+    # Named expression reference graph built in the first pass:
+    # named expression name -> names of the classic named
+    # expressions it uses, and the line where it is defined
     named_expr_reference_list = OrderedDict()
-    process_expr_referece_list = []
+    named_expr_line_numbers = {}
     lb_ssl_vserver = []
     cs_ssl_vserver = []
     cr_ssl_vserver = []
@@ -74,6 +72,38 @@ def convert_cli_init():
     tool_error_comment = None
 
 
+def reset_entity_names():
+    """
+        Empties the policy and classic entity names, keeping the same set
+        objects, and registers the built-in named expressions again.
+        Used between the passes over the config file.
+    """
+    global named_expr_generation
+    while policy_entities_names:
+        policy_entities_names.pop()
+    while classic_entities_names:
+        classic_entities_names.pop()
+    named_expr_generation += 1
+    NamedExpression.register_built_in_named_exprs()
+
+
+def named_expr_state():
+    """
+        Returns a value identifying the named expression data used while
+        converting classic expressions. Within a generation, entity names
+        and named expression lists are only added, so their sizes are
+        enough to tell the data apart.
+    """
+    return (named_expr_generation, len(policy_entities_names),
+            len(classic_entities_names),
+            len(NamedExpression.named_expr_with_invalid_names),
+            len(NamedExpression.csec_expr_list))
+
+
+# Lexer reused by remove_quotes
+_quote_lexer = cli_lex.Lexer()
+
+
 def remove_quotes(val):
     """
         Helper function to remove the surrounding
@@ -83,9 +113,8 @@ def remove_quotes(val):
     """
     result = val
     if val.startswith('"') or val.startswith("'"):
-        lexer = cli_lex.Lexer()
-        lexer.input(val)
-        token = lexer.token()
+        _quote_lexer.input(val)
+        token = _quote_lexer.token()
         assert token.type == "NON_KEY"
         result = token.value
     return result
@@ -116,15 +145,10 @@ def get_classic_expr_list(expr):
             - start offset of token to replace
             - length of token to replace
     """
-    lexer = cli_lex.Lexer()
-    lexer.input(expr)
     classic_expr_info_list = []
     expr_info_list = OrderedDict()
     index_list = []
-    while True:
-        next_token = lexer.adv_expr_token()
-        if not next_token:
-            break
+    for next_token in cli_lex.adv_expr_tokens(expr):
         token_value = str(next_token)
         token_value_len = len(token_value)
         is_classic_expr = False
@@ -478,96 +502,25 @@ class ConvertConfig(object):
                            policy_module, priority_arg, goto_arg, position)
 
 
-       These methods save bind commands in the appropriate dictionaries.
+       These methods save bind commands in the bind table.
        These methods can be used for bindings of policies to
        global/vserver/user/group/service.
     """
 
-    class BindInfo(object):
-        """
-        Object to hold the bind command info.
-        """
-        def __init__(self):
-            """
-            Bind command information.
-            orig_cmd   - original bind command read from config.
-            parse_tree - bind command parse tree.
-            position   - position where the bind command
-                         has to be inserted. Possible
-                         values - before, inplace, after.
-            priority   - priority value.
-            goto       - gotopriorityexpression value.
-            bind_arg_priority - Provides the positional index
-                                or keyword name for the priority
-                                parameter.
-            bind_arg_goto - Provides the positional index or
-                            keyword name for the goto parameter.
-            policy_type - type of policy("classic" or "advanced")
-            flow_type_direction - bind type information("REQUEST" or
-                             "RESPONSE")
-            lineno   - original command line number.
-            """
-            self.orig_cmd = ""
-            self.parse_tree = None
-            self.position = ""    # "before", "inplace", or "after" insertion
-            self.priority = 0
-            self.goto = ""
-            self.bind_arg_priority = "priority"
-            self.bind_arg_goto = "gotoPriorityExpression"
-            self.policy_type = None
-            self.flow_type_direction = None
-            self.lineno = 0
-
-        def set(self, orig_cmd, parse_tree, position, priority, goto,
-                priority_arg, goto_arg, policy_type, flow_type_direction, lineno):
-            """
-            Sets the BindInfo class instance variables.
-            orig_cmd   - original bind command read from config.
-            parse_tree - bind comman parse tree.
-            position   - position of insertion.
-            priority   - priority
-            goto       - gotopriorityexpression value.
-            priority_arg - Positional index or keyword name
-                           for the priority argument.
-            goto_arg - positional index or keyword name
-                       for the goto argument.
-            flow_type_direction - bind type information( "REQUEST"
-                                  or "RESPONSE")
-            lineno   - original command line number.
-            """
-            self.orig_cmd = orig_cmd
-            self.parse_tree = parse_tree
-            self.position = position
-            self.priority = priority
-            self.goto = goto
-            self.bind_arg_priority = priority_arg
-            self.bind_arg_goto = goto_arg
-            self.policy_type = policy_type
-            self.flow_type_direction = flow_type_direction
-            self.lineno = lineno
-
-    def get_bind_dict(self, current_dict, key):
-        """
-        Return the dictionary selected by key in current_dict. If
-        this dictionary does not yet exist, it will be created.
-        current_dict - dictionary
-        key          - key name
-        """
-        if key not in current_dict:
-            current_dict[key] = OrderedDict()
-        return current_dict[key]
-
-    def save_bind_for_reprioritization_common(self, bind_dict, orig_tree, tree,
+    def save_bind_for_reprioritization_common(self, entity, entity_type,
+                                              entity_name, policy_name,
+                                              module, orig_tree, tree,
                                               position, priority, goto,
                                               bind_type, priority_arg,
                                               goto_arg, policy_type):
         """
-        Save a bind command in the relevant dictionary for later processing
-        bind_dict - is a dictionary which has list of
-                    BindInfo objects for commands for a bindpoint
-                    (e.g. GLOBAL REWRITE REQ_DEFAULT). A BindInfo
-                    object for the current command will be appended
-                    to the list.
+        Save a bind command in the bind table for analysis and later
+        processing.
+        entity - OT of the command (ex. global, vserver, user)
+        entity_type - Group of the command (ex. lb, cs, aaa)
+        entity_name - Name of the entity (None if global)
+        policy_name - name of the policy that is bound
+        module - module of the policy that is bound
         orig_tree - parsed command tree of bind command read from config.
         tree - processed and possibly modified command tree of bind command.
         position - indicates where the bind is to be inserted:
@@ -579,23 +532,16 @@ class ConvertConfig(object):
                        for the priority argument.
         goto_arg - Positional index or keyword name
                    for the goto argument.
+        policy_type - type of policy("classic" or "advanced")
         """
         # bind_type may be None in some cases.
-        # bind_type is used as key for dictionary,
-        # so making the bind_type equal to empty string
-        # when the bind_type is None.
         if bind_type is None:
             bind_type = ""
-        else:
-            bind_type = bind_type.lower()
-        if bind_type not in bind_dict:
-            bind_dict[bind_type] = []
-        bind_info = self.BindInfo()
-        flow_type_direction = self.flow_type_direction_default
-        bind_info.set(orig_tree.original_line, tree, position, int(priority),
-                      goto, priority_arg, goto_arg,
-                      policy_type, flow_type_direction, orig_tree.lineno)
-        bind_dict[bind_type].append(bind_info)
+        common.pols_binds.store_bind(
+            entity, entity_type, entity_name, policy_name, module,
+            bind_type, int(priority), orig_tree.original_line,
+            orig_tree.lineno, tree, position, goto, priority_arg, goto_arg,
+            policy_type, self.flow_type_direction_default)
 
     def update_tree_arg(self, tree, arg, value):
         """
@@ -648,17 +594,21 @@ class ConvertConfig(object):
     """
     flow_type_direction_default = "REQUEST"
 
+    """
+    Entities for which policy binds are saved, in the order in which their
+    binds are emitted after the global binds.
+    """
+    bind_entities = ("vserver", "user", "group", "service")
+
     def convert_global_bind(self, orig_tree, tree, policy_name, module,
                             priority_arg, goto_arg, position="inplace"):
         """
         Process a global bind command represented by
         the command parse tree and saves the required info:
             bind <module> global <other arguments>
-        Save the bind command in the cli_global_binds dictionary. Return empty
+        Save the bind command in the bind table. Return empty
         list to delete the command. It will later be emitted after
         reprioritization.
-        The dictionary path:
-            cli_global_binds[<module>][<bind_type>]
         Args:
         orig_tree - bind command parse tree of original command from ns.conf.
                     In case bind command is created newly then this argument
@@ -685,17 +635,13 @@ class ConvertConfig(object):
         policy_type = None
         if policy_name in common.pols_binds.policies:
             policy_type = common.pols_binds.policies[policy_name].policy_type
-        bind_dict = self.get_bind_dict(cli_global_binds, module.lower())
-        self.save_bind_for_reprioritization_common(bind_dict, orig_tree, tree,
-                                                   position, priority, goto,
-                                                   bind_type, priority_arg,
-                                                   goto_arg, policy_type)
-        # store original bind command for analysis
-        common.pols_binds.store_original_bind(
-            common.Bind(
-                "global", orig_tree.ot.lower(), None, policy_name,
-                module.lower(), bind_type if bind_type else "", str(priority),
-                orig_tree.original_line, lineno=orig_tree.lineno))
+        self.save_bind_for_reprioritization_common("global",
+                                                   orig_tree.ot.lower(), None,
+                                                   policy_name, module.lower(),
+                                                   orig_tree, tree, position,
+                                                   priority, goto, bind_type,
+                                                   priority_arg, goto_arg,
+                                                   policy_type)
         return []
 
     def convert_entity_policy_bind(self, orig_tree, tree, policy_name,
@@ -708,15 +654,9 @@ class ConvertConfig(object):
             bind <user_type> user <userName> <other arguments>
             bind <group_type> group <groupName> <other arguments>
             bind <service_type> service <serviceName> <other arguments>
-        Save the bind command in the cli_vserver_binds/cli_user_binds/
-        cli_group_binds/cli_service_binds dictionary. Return an empty
+        Save the bind command in the bind table. Return an empty
         parse tree to delete the command. It will later be emitted after
         reprioritization.
-        The dictionary path:
-            cli_vserver_binds[<vserver_type>][<vserver_name>][<module>][<bind_type>]
-            cli_user_binds[<user_type>][<user_name>][<module>][<bind_type>]
-            cli_group_binds[<group_type>][<group_name>][<module>][<bind_type>]
-            cli_service_binds[<service_type>][<service_name>][<module>][<bind_type>]
         orig_tree - bind command parse tree of original command from ns.conf.
                     In case bind command is created newly then this argument
                     should contain the bind command parse tree of original
@@ -745,33 +685,17 @@ class ConvertConfig(object):
         # get policy type
         if policy_name in common.pols_binds.policies:
             policy_type = common.pols_binds.policies[policy_name].policy_type
-        if entity == "vserver":
-            bind_dict = self.get_bind_dict(cli_vserver_binds,
-                                           entity_type.lower())
-        elif entity == "user":
-            bind_dict = self.get_bind_dict(cli_user_binds, entity_type.lower())
-        elif entity == "group":
-            bind_dict = self.get_bind_dict(cli_group_binds,
-                                           entity_type.lower())
-        elif entity == "service":
-            bind_dict = self.get_bind_dict(cli_service_binds,
-                                           entity_type.lower())
-        else:
+        if entity not in self.bind_entities:
             logging.critical("Unexpected command " + str(tree))
             sys.exit()
-        bind_dict = self.get_bind_dict(bind_dict, entity_name)
-        bind_dict = self.get_bind_dict(bind_dict, policy_module.lower())
-        self.save_bind_for_reprioritization_common(bind_dict, orig_tree, tree,
-                                                   position, priority, goto,
-                                                   bind_type, priority_arg,
-                                                   goto_arg, policy_type)
-        # store original bind command for analysis
-        common.pols_binds.store_original_bind(
-            common.Bind(
-                entity, entity_type.lower(), entity_name, policy_name,
-                policy_module.lower(), (bind_type if bind_type else ""),
-                str(priority), orig_tree.original_line,
-                lineno=orig_tree.lineno))
+        self.save_bind_for_reprioritization_common(entity,
+                                                   entity_type.lower(),
+                                                   entity_name, policy_name,
+                                                   policy_module.lower(),
+                                                   orig_tree, tree, position,
+                                                   priority, goto, bind_type,
+                                                   priority_arg, goto_arg,
+                                                   policy_type)
         return []
 
     def get_common_info(self, tree, priority_arg, goto_arg):
@@ -812,23 +736,25 @@ class ConvertConfig(object):
         """
         Sort the binds for the bindpoint and if necessary renumber their
         priorities.
-        - binds is a list of BindInfo objects
-        Return a list of reprioritized BindInfo objects.
+        - binds is a list of bind IDs in the bind table
+        Return a list of reprioritized bind IDs.
         """
+        t = common.pols_binds.binds
         # Sort the binds by their positions.
         new_binds = []
         for position in ("before", "inplace", "after"):
-            for bind_info in binds:
-                if bind_info.position == position:
-                    new_binds.append(bind_info)
+            for bind_id in binds:
+                if t.positions[bind_id] == position:
+                    new_binds.append(bind_id)
 
         # Check if the bind priorities are not in the required order and so
         # require renumbering. Also 0 priorities require renumbering.
         need_pri_renum = False
+        priorities = t.priorities
         for i in range(len(new_binds)):
-            if (new_binds[i].priority == 0) or ((i > 0) and
-                                                (new_binds[i-1].priority
-                                                 >= new_binds[i].priority)):
+            if (priorities[new_binds[i]] == 0) or (
+                    (i > 0) and (priorities[new_binds[i-1]]
+                                 >= priorities[new_binds[i]])):
                 need_pri_renum = True
                 break
 
@@ -845,40 +771,41 @@ class ConvertConfig(object):
         new_pri = self.PRIORITY_INCREMENT
 
         # Renumber the priorities in the binds.
-        for bind_info in new_binds:
-            old_to_new_pri[bind_info.position][bind_info.priority] = new_pri
+        for bind_id in new_binds:
+            old_to_new_pri[t.positions[bind_id]][priorities[bind_id]] = new_pri
             # Update priority in parse tree.
-            self.update_tree_arg(bind_info.parse_tree,
-                                 bind_info.bind_arg_priority, str(new_pri))
+            self.update_tree_arg(t.parse_trees[bind_id],
+                                 t.priority_args[bind_id], str(new_pri))
             new_pri += self.PRIORITY_INCREMENT
 
         # Check if any of the bind gotoPriorityExpressions have a priority
         # that needs to be modified. Also issue a error if any
         # gotoPriorityExpressions uses an expression.
-        for bind_info in new_binds:
-            goto = bind_info.goto
+        for bind_id in new_binds:
+            goto = t.gotos[bind_id]
+            position = t.positions[bind_id]
             if goto is None:
                 continue
             elif goto.isdigit():
                 old_goto = int(goto)
-                max_goto = max(old_to_new_pri[bind_info.position])
-                if old_goto in old_to_new_pri[bind_info.position]:
-                    new_goto = str(old_to_new_pri[bind_info.position]
-                                   [old_goto])
+                max_goto = max(old_to_new_pri[position])
+                if old_goto in old_to_new_pri[position]:
+                    new_goto = str(old_to_new_pri[position][old_goto])
                 elif old_goto > max_goto:
                     new_goto = "END"
                 else:
                     new_goto = "1"
                 # Update goto in parse tree.
-                self.update_tree_arg(bind_info.parse_tree,
-                                     bind_info.bind_arg_goto, new_goto)
+                self.update_tree_arg(t.parse_trees[bind_id],
+                                     t.goto_args[bind_id], new_goto)
             elif goto.upper() not in ("NEXT", "END", "USE_INVOCATION_RESULT"):
                 logging.error("Line({}): gotoPriorityExpression in {} uses an"
                               " expression. Since the priorities for this"
                               " bindpoint have been renumbered, this"
                               " expression will need to be modified manually."
-                              "".format(str(bind_info.lineno), str(bind_info.parse_tree)))
-                bind_info.parse_tree.set_invalid()
+                              "".format(str(t.linenos[bind_id]),
+                                        str(t.parse_trees[bind_id])))
+                t.parse_trees[bind_id].set_invalid()
         return new_binds
 
     def reprioritize_and_emit_global_binds(self):
@@ -886,108 +813,98 @@ class ConvertConfig(object):
         Renumber the priorities for policy binds to all global bindpoints
         and return a list of the command strings for those binds.
         """
+        t = common.pols_binds.binds
         bind_cmd_trees = []
-        for module in cli_global_binds:
-            module_bind_dict = cli_global_binds[module]
-            for bind_type in module_bind_dict:
-                binds = module_bind_dict[bind_type]
-                new_binds = self.reprioritize_binds(binds)
-                for bind_info in new_binds:
-                    if common.pols_binds.is_bind_unsupported(
-                            bind_info.orig_cmd):
-                        logging.error(
-                            "Line({}): Bind command [{}] is commented out because it"
-                            " can't be converted to be under a valid advanced"
-                            " bindpoint as priority needs to be changed"
-                            " manually. However, the command is partially"
-                            " converted as [{}]. If the command is required"
-                            " please take a backup because comments are not"
-                            " saved in ns.conf after triggering"
-                            "'save ns config'.{}"
-                            "".format(str(bind_info.lineno), bind_info.orig_cmd.strip(),
-                                      str(bind_info.parse_tree).strip(),
-                                      common.CMD_MOD_ERR_MSG))
-                        bind_info.parse_tree.set_invalid()
-                        bind_cmd_trees.append(
-                            "# {}".format(str(bind_info.parse_tree)))
-                    else:
-                        type_key_value = None
-                        # Combine bind type side information and global_type
-                        # information to determine the type keyword value.
-                        # Possible values - REQ_DEFAULT, REQ_OVERRIDE,
-                        #                   RES_DEFAULT, RES_OVERRIDE.
-                        global_type = (
-                            common.pols_binds.get_global_type_for_bind(
-                                bind_info.orig_cmd))
-                        if (module == "ssl" and
-                                bind_info.policy_type == "classic"):
-                            bind_cmd_trees.append(bind_info.parse_tree)
-                            continue
-                        if (bind_info.flow_type_direction and global_type and
-                                bind_info.flow_type_direction in
-                                ("REQUEST", "RESPONSE") and
-                                bind_info.policy_type == "classic"):
-                            type_key_value = (
-                                bind_info.flow_type_direction[0:3]
-                                + '_' + global_type)
-                            self.update_tree_arg(
-                                bind_info.parse_tree, "type",
-                                type_key_value.upper())
-                        if (module == "rewrite" and
-                                bind_info.policy_type == "classic"):
-                            type_key_value = (
-                                bind_type[0:3] + '_' + global_type)
-                            self.update_tree_arg(
-                                bind_info.parse_tree, "type",
-                                type_key_value.upper())
-                        bind_cmd_trees.append(bind_info.parse_tree)
+        for key in t.bindpoints.keys():
+            entity, _, _, module, bind_type = key
+            if entity != "global":
+                continue
+            new_binds = self.reprioritize_binds(t.bindpoints[key])
+            for bind_id in new_binds:
+                parse_tree = t.parse_trees[bind_id]
+                policy_type = t.policy_types[bind_id]
+                if common.pols_binds.is_bind_unsupported(bind_id):
+                    logging.error(
+                        "Line({}): Bind command [{}] is commented out because it"
+                        " can't be converted to be under a valid advanced"
+                        " bindpoint as priority needs to be changed"
+                        " manually. However, the command is partially"
+                        " converted as [{}]. If the command is required"
+                        " please take a backup because comments are not"
+                        " saved in ns.conf after triggering"
+                        "'save ns config'.{}"
+                        "".format(str(t.linenos[bind_id]),
+                                  t.cmd_str(bind_id).strip(),
+                                  str(parse_tree).strip(),
+                                  common.CMD_MOD_ERR_MSG))
+                    parse_tree.set_invalid()
+                    bind_cmd_trees.append("# {}".format(str(parse_tree)))
+                else:
+                    type_key_value = None
+                    # Combine bind type side information and global_type
+                    # information to determine the type keyword value.
+                    # Possible values - REQ_DEFAULT, REQ_OVERRIDE,
+                    #                   RES_DEFAULT, RES_OVERRIDE.
+                    global_type = (
+                        common.pols_binds.get_global_type_for_bind(bind_id))
+                    if (module == "ssl" and policy_type == "classic"):
+                        bind_cmd_trees.append(parse_tree)
+                        continue
+                    flow_type_direction = t.flow_type_directions[bind_id]
+                    if (flow_type_direction and global_type and
+                            flow_type_direction in ("REQUEST", "RESPONSE") and
+                            policy_type == "classic"):
+                        type_key_value = (
+                            flow_type_direction[0:3] + '_' + global_type)
+                        self.update_tree_arg(
+                            parse_tree, "type", type_key_value.upper())
+                    if (module == "rewrite" and policy_type == "classic"):
+                        type_key_value = (
+                            bind_type[0:3] + '_' + global_type)
+                        self.update_tree_arg(
+                            parse_tree, "type", type_key_value.upper())
+                    bind_cmd_trees.append(parse_tree)
         return bind_cmd_trees
 
-    def reprioritize_and_emit_4_level_dict(self, bind_dict):
+    def reprioritize_and_emit_entity_binds(self, entity):
         """
-        Renumber the priorities for all policy binds in bind_dict
-        and return a list of the command strings for those binds.
-        bind_dict - dictionary in which parse trees are saved.
-        dictionary path:
-            bind_dict[<entity_type>][<entity_name>][<module>][<bind_type>]
+        Renumber the priorities for all policy binds to the bindpoints of
+        the entities of a kind and return a list of the command strings for
+        those binds.
+        entity - kind of the entities (ex. vserver, user, group, service)
         """
+        t = common.pols_binds.binds
         bind_cmd_trees = []
-        for entity_type in bind_dict:
-            entity_type_bind_dict = bind_dict[entity_type]
-            for entity_name in entity_type_bind_dict:
-                entity_name_bind_dict = entity_type_bind_dict[entity_name]
-                for module in entity_name_bind_dict:
-                    module_bind_dict = entity_name_bind_dict[module]
-                    for bind_type in module_bind_dict:
-                        binds = module_bind_dict[bind_type]
-                        new_binds = self.reprioritize_binds(binds)
-                        for bind_info in new_binds:
-                            if (bind_info.flow_type_direction and
-                                    bind_info.policy_type == "classic"):
-                                self.update_tree_arg(
-                                    bind_info.parse_tree, "type",
-                                    bind_info.flow_type_direction.upper())
-                            if common.pols_binds.is_bind_unsupported(
-                                    bind_info.orig_cmd):
-                                logging.error(
-                                    "Line({}): Bind command [{}] is commented out"
-                                    " because it can't be converted to be"
-                                    " under a valid advanced bindpoint as"
-                                    " priority needs to be changed manually."
-                                    " However, the command is partially"
-                                    " converted as [{}]. If the command is"
-                                    " required please take a backup because"
-                                    " comments are not saved in ns.conf"
-                                    " after triggering 'save ns config'."
-                                    "{}".format(str(bind_info.lineno),
-                                        bind_info.orig_cmd.strip(),
-                                        str(bind_info.parse_tree).strip(),
-                                        common.CMD_MOD_ERR_MSG))
-                                bind_info.parse_tree.set_invalid()
-                                bind_cmd_trees.append(
-                                    "# {}".format(str(bind_info.parse_tree)))
-                            else:
-                                bind_cmd_trees.append(bind_info.parse_tree)
+        for key in t.bindpoints.keys():
+            if key[0] != entity:
+                continue
+            new_binds = self.reprioritize_binds(t.bindpoints[key])
+            for bind_id in new_binds:
+                parse_tree = t.parse_trees[bind_id]
+                flow_type_direction = t.flow_type_directions[bind_id]
+                if (flow_type_direction and
+                        t.policy_types[bind_id] == "classic"):
+                    self.update_tree_arg(
+                        parse_tree, "type", flow_type_direction.upper())
+                if common.pols_binds.is_bind_unsupported(bind_id):
+                    logging.error(
+                        "Line({}): Bind command [{}] is commented out"
+                        " because it can't be converted to be"
+                        " under a valid advanced bindpoint as"
+                        " priority needs to be changed manually."
+                        " However, the command is partially"
+                        " converted as [{}]. If the command is"
+                        " required please take a backup because"
+                        " comments are not saved in ns.conf"
+                        " after triggering 'save ns config'."
+                        "{}".format(str(t.linenos[bind_id]),
+                            t.cmd_str(bind_id).strip(),
+                            str(parse_tree).strip(),
+                            common.CMD_MOD_ERR_MSG))
+                    parse_tree.set_invalid()
+                    bind_cmd_trees.append("# {}".format(str(parse_tree)))
+                else:
+                    bind_cmd_trees.append(parse_tree)
         return bind_cmd_trees
 
     def reprioritize_and_emit_binds(self):
@@ -997,14 +914,8 @@ class ConvertConfig(object):
         """
         bind_cmd_trees = []
         bind_cmd_trees += self.reprioritize_and_emit_global_binds()
-        bind_cmd_trees += \
-            self.reprioritize_and_emit_4_level_dict(cli_vserver_binds)
-        bind_cmd_trees += \
-            self.reprioritize_and_emit_4_level_dict(cli_user_binds)
-        bind_cmd_trees += \
-            self.reprioritize_and_emit_4_level_dict(cli_group_binds)
-        bind_cmd_trees += \
-            self.reprioritize_and_emit_4_level_dict(cli_service_binds)
+        for entity in self.bind_entities:
+            bind_cmd_trees += self.reprioritize_and_emit_entity_binds(entity)
         return bind_cmd_trees
 
 
@@ -1084,7 +995,7 @@ class CacheRedirection(ConvertConfig):
             if commandParseTree.upgraded:
                 expr_list = get_classic_expr_list(expr_value)
                 for expr_info in expr_list:
-                    classic_named_expr_in_use.append(expr_info[0].lower())
+                    classic_named_expr_in_use.add(expr_info[0].lower())
             return []
         policy_name = commandParseTree.positional_value(0).value
         lower_policy_name = policy_name.lower()
@@ -1596,7 +1507,7 @@ class APPFw(ConvertConfig):
             if commandParseTree.upgraded:
                 expr_list = get_classic_expr_list(expr_value)
                 for expr_info in expr_list:
-                    classic_named_expr_in_use.append(expr_info[0].lower())
+                    classic_named_expr_in_use.add(expr_info[0].lower())
             return []
 
         policy_name = commandParseTree.positional_value(0).value
@@ -2040,6 +1951,8 @@ class NamedExpression(ConvertConfig):
                 if (len(expr_list) != 0):
                     if lower_expr_name not in named_expr_reference_list:
                         named_expr_reference_list[lower_expr_name] = []
+                    named_expr_line_numbers[lower_expr_name] = \
+                        commandParseTree.lineno
 
                 for used_expr_name in expr_list:
                     named_expr_reference_list[lower_expr_name].append(used_expr_name[0].lower())
@@ -2132,30 +2045,63 @@ class NamedExpression(ConvertConfig):
         return tree_list
 
     @staticmethod
-    def add_all_refernce_expr(expr_name):
-        expr_list = []
-        if expr_name in named_expr_reference_list:
-            expr_list.append(expr_name)
-            for expr in named_expr_reference_list[expr_name]:
-                expr_list.append(expr)
-                if expr not in process_expr_referece_list:
-                    for expr1 in NamedExpression.add_all_refernce_expr(expr):
-                        expr_list.append(expr1)
-                    process_expr_referece_list.append(expr)
-        return expr_list
+    def report_reference_cycles():
+        """
+            Logs an error for each cycle in the named expression
+            reference graph, with the lines of the named expressions
+            in the cycle.
+            Uses an iterative depth first search, so deep chains of
+            named expressions don't hit the recursion limit.
+        """
+        # 1 - named expression is on the search path, 2 - done
+        visit_state = {}
+        for root_name in named_expr_reference_list:
+            if root_name in visit_state:
+                continue
+            visit_state[root_name] = 1
+            path = [root_name]
+            # Each reference is followed once, even if a named
+            # expression uses the same name more than once.
+            ref_iters = [iter(OrderedDict.fromkeys(
+                named_expr_reference_list[root_name]))]
+            while ref_iters:
+                for ref_name in ref_iters[-1]:
+                    ref_state = visit_state.get(ref_name)
+                    if ref_state is None:
+                        visit_state[ref_name] = 1
+                        path.append(ref_name)
+                        ref_iters.append(iter(OrderedDict.fromkeys(
+                            named_expr_reference_list.get(ref_name, []))))
+                        break
+                    if ref_state == 1:
+                        cycle = path[path.index(ref_name):]
+                        logging.error(("Line({}): Named expressions {} have"
+                                       " a circular reference (lines {})")
+                                      .format(named_expr_line_numbers[ref_name],
+                                              " -> ".join(cycle + [ref_name]),
+                                              ", ".join(str(
+                                                  named_expr_line_numbers[name])
+                                                  for name in cycle)))
+                else:
+                    visit_state[path.pop()] = 2
+                    ref_iters.pop()
 
     @staticmethod
     def add_reference_named_exprs():
-        temp_list = []
-        for expr_name in named_expr_reference_list:
-            temp_list.append(expr_name)
-        for expr_name in temp_list:
-            if expr_name in classic_named_expr_in_use:
-                if expr_name not in process_expr_referece_list:
-                    process_expr_referece_list.append(expr_name)
-                    for expr1 in NamedExpression.add_all_refernce_expr(expr_name):
-                        if expr1 not in classic_named_expr_in_use:
-                            classic_named_expr_in_use.append(expr1)
+        """
+            Adds the classic named expressions used by the named
+            expressions in classic_named_expr_in_use, directly or
+            through other named expressions, to
+            classic_named_expr_in_use.
+        """
+        NamedExpression.report_reference_cycles()
+        pending_names = list(classic_named_expr_in_use)
+        while pending_names:
+            expr_name = pending_names.pop()
+            for ref_name in named_expr_reference_list.get(expr_name, []):
+                if ref_name not in classic_named_expr_in_use:
+                    classic_named_expr_in_use.add(ref_name)
+                    pending_names.append(ref_name)
 
 
 @common.register_class_methods
@@ -2299,7 +2245,7 @@ class ContentSwitching(ConvertConfig):
                 if commandParseTree.upgraded:
                     expr_list = get_classic_expr_list(expr_value)
                     for expr_info in expr_list:
-                        classic_named_expr_in_use.append(expr_info[0].lower())
+                        classic_named_expr_in_use.add(expr_info[0].lower())
             return []
         policy_name = commandParseTree.positional_value(0).value
         pol_obj = common.Policy(policy_name, self.__class__.__name__)
@@ -2324,7 +2270,7 @@ class ContentSwitching(ConvertConfig):
                 if commandParseTree.upgraded:
                     expr_list = get_classic_expr_list(expr_value)
                     for expr_info in expr_list:
-                        classic_named_expr_in_use.append(expr_info[0].lower())
+                        classic_named_expr_in_use.add(expr_info[0].lower())
                 return []
             is_rule = True
             if commandParseTree.keyword_exists('domain'):
@@ -3152,7 +3098,7 @@ class SSL(ConvertConfig):
             if commandParseTree.upgraded:
                 expr_list = get_classic_expr_list(expr_value)
                 for expr_info in expr_list:
-                    classic_named_expr_in_use.append(expr_info[0].lower())
+                    classic_named_expr_in_use.add(expr_info[0].lower())
             return []
 
         policy_name = commandParseTree.positional_value(0).value
@@ -3707,3 +3653,22 @@ class NSFeatures(ConvertConfig):
                 new_feature_command.add_positional(pos)
 
         return [new_feature_command]
+
+
+# Per-run state of this module, initialized by convert_cli_init().
+for _name in ("vserver_protocol_dict", "vpn_ssl_vserver", "cs_ssl_vserver",
+              "cr_ssl_vserver", "authentication_ssl_vserver",
+              "lb_ssl_vserver", "gslb_ssl_vserver", "policy_entities_names",
+              "classic_entities_names", "named_expr",
+              "named_expr_generation", "filter_policy_exists",
+              "no_conversion_collect_data", "classic_named_expr_in_use",
+              "parsing_config_file", "named_expr_reference_list",
+              "named_expr_line_numbers", "tool_error_comment"):
+    common.register_run_state(sys.modules[__name__], _name, lambda: None)
+common.register_run_state(NamedExpression, "csec_expr_list", OrderedDict)
+common.register_run_state(NamedExpression, "named_expr_with_invalid_names",
+                          list)
+common.register_run_state(CacheRedirection, "_cr_vserver_info_precedence",
+                          list)
+# Changed by the filter conversion when rewrite or responder binds use END.
+common.register_run_state(ConvertConfig, "bind_default_goto", lambda: "END")
@@ -190,7 +190,7 @@ class CMP(cli_cmds.ConvertConfig):
             if cmp_policy_tree.upgraded:
                 expr_list = cli_cmds.get_classic_expr_list(expr_value)
                 for expr_info in expr_list:
-                    cli_cmds.classic_named_expr_in_use.append(expr_info[0].lower())
+                    cli_cmds.classic_named_expr_in_use.add(expr_info[0].lower())
             return []
         policy_name = cmp_policy_tree.positional_value(0).value
         pol_obj = common.Policy(policy_name, self.__class__.__name__)
@@ -618,7 +618,7 @@ class CLITransformFilter(cli_cmds.ConvertConfig):
             if policy_parse_tree.upgraded:
                 expr_list = cli_cmds.get_classic_expr_list(expr_value)
                 for expr_info in expr_list:
-                    cli_cmds.classic_named_expr_in_use.append(expr_info[0].lower())
+                    cli_cmds.classic_named_expr_in_use.add(expr_info[0].lower())
             if policy_parse_tree.keyword_exists("reqAction"):
                 policy_action = policy_parse_tree.keyword_value(
                     "reqAction")[0].value.lower()
@@ -1178,3 +1178,7 @@ class CLITransformFilter(cli_cmds.ConvertConfig):
         self.complete_convert_bind_cmd(bind_cmd,
             policy_name, "rewrite", 1, 2, "before")
 
+
+
+common.register_run_state(CLITransformFilter, "req_action_list", list)
+common.register_run_state(CLITransformFilter, "res_action_list", list)
@@ -98,7 +98,7 @@ class LB(cli_cmds.ConvertConfig):
             if add_lbvserver_parse_tree.upgraded:
                 expr_list = cli_cmds.get_classic_expr_list(expr_value)
                 for expr_info in expr_list:
-                    cli_cmds.classic_named_expr_in_use.append(expr_info[0].lower())
+                    cli_cmds.classic_named_expr_in_use.add(expr_info[0].lower())
             return []
         lb_protocol = add_lbvserver_parse_tree.positional_value(1).value
         lbv_name = add_lbvserver_parse_tree.positional_value(0).value.lower()
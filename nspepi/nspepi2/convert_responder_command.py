@@ -150,3 +150,9 @@ class Responder(cli_cmds.ConvertConfig):
             return []
         return [bind_parse_tree]
 
+
+
+common.register_run_state(Responder, "resp_global_goto_exists",
+                          lambda: False)
+common.register_run_state(Responder, "resp_vserver_goto_exists",
+                          lambda: False)
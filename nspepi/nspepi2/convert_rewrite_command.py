@@ -166,3 +166,8 @@ class Rewrite(cli_cmds.ConvertConfig):
                 module, priority_arg, goto_arg)
             return []
         return [bind_parse_tree]
+
+
+for _name in ("rw_req_global_goto_exists", "rw_res_global_goto_exists",
+              "rw_req_vserver_goto_exists", "rw_res_vserver_goto_exists"):
+    common.register_run_state(Rewrite, _name, lambda: False)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Manifest of the converter modules: the module handling each command type
+and each built-in policy, so that only the modules needed by the commands
+of a config are imported and have their handlers created.
+Run this file to check the manifest against the handlers registered by the
+modules, after adding or changing handlers.
+
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import glob
+import importlib
+import os
+import sys
+
+# Converter modules, in the order their handlers are registered, which is
+# the order their init and final methods are called in.
+HANDLER_MODULES = [
+    "convert_cli_commands",
+    "convert_rewrite_command",
+    "convert_lb_cmd",
+    "convert_responder_command",
+    "convert_filter_command",
+    "convert_patclass_commands",
+    "convert_cmp_cmd",
+    "convert_auth_cmd",
+]
+
+# Modules whose handlers are always loaded. They have the infrastructure
+# used by the other modules and handle most of the commands.
+CORE_MODULES = ["convert_cli_commands"]
+
+# key: command type "<op> <group> <ot>" in lowercase, as the key of
+#      common.dispatchtable
+# value: module registering the handler for the command type
+COMMAND_HANDLERS = {
+    "add aaa group": "convert_cli_commands",
+    "add appflow policy": "convert_cli_commands",
+    "add appfw policy": "convert_cli_commands",
+    "add appqoe action": "convert_cli_commands",
+    "add appqoe policy": "convert_cli_commands",
+    "add audit messageaction": "convert_cli_commands",
+    "add audit nslogpolicy": "convert_cli_commands",
+    "add audit syslogpolicy": "convert_cli_commands",
+    "add authentication loginschema": "convert_cli_commands",
+    "add authentication loginschemapolicy": "convert_cli_commands",
+    "add authentication oauthidppolicy": "convert_cli_commands",
+    "add authentication policy": "convert_cli_commands",
+    "add authentication samlidppolicy": "convert_cli_commands",
+    "add authentication samlidpprofile": "convert_cli_commands",
+    "add authentication vserver": "convert_auth_cmd",
+    "add authentication webauthaction": "convert_cli_commands",
+    "add authorization policy": "convert_cli_commands",
+    "add autoscale policy": "convert_cli_commands",
+    "add cache policy": "convert_cli_commands",
+    "add cache selector": "convert_cli_commands",
+    "add cmp policy": "convert_cmp_cmd",
+    "add contentinspection policy": "convert_cli_commands",
+    "add cr policy": "convert_cli_commands",
+    "add cr vserver": "convert_cli_commands",
+    "add cs action": "convert_cli_commands",
+    "add cs policy": "convert_cli_commands",
+    "add cs vserver": "convert_cli_commands",
+    "add dns action64": "convert_cli_commands",
+    "add dns policy": "convert_cli_commands",
+    "add dns policy64": "convert_cli_commands",
+    "add dos policy": "convert_cli_commands",
+    "add feo policy": "convert_cli_commands",
+    "add filter action": "convert_filter_command",
+    "add filter htmlinjectionvariable": "convert_filter_command",
+    "add filter policy": "convert_filter_command",
+    "add gslb vserver": "convert_cli_commands",
+    "add ica policy": "convert_cli_commands",
+    "add lb group": "convert_cli_commands",
+    "add lb vserver": "convert_lb_cmd",
+    "add ns assignment": "convert_cli_commands",
+    "add ns encryptionkey": "convert_cli_commands",
+    "add ns hmackey": "convert_cli_commands",
+    "add ns httpprofile": "convert_cli_commands",
+    "add ns variable": "convert_cli_commands",
+    "add policy dataset": "convert_cli_commands",
+    "add policy expression": "convert_cli_commands",
+    "add policy httpcallout": "convert_cli_commands",
+    "add policy patclass": "convert_patclass_commands",
+    "add policy patset": "convert_cli_commands",
+    "add policy stringmap": "convert_cli_commands",
+    "add pq policy": "convert_cli_commands",
+    "add responder action": "convert_responder_command",
+    "add responder policy": "convert_responder_command",
+    "add rewrite action": "convert_rewrite_command",
+    "add rewrite policy": "convert_rewrite_command",
+    "add sc policy": "convert_cli_commands",
+    "add spillover policy": "convert_cli_commands",
+    "add ssl action": "convert_cli_commands",
+    "add ssl policy": "convert_cli_commands",
+    "add stream selector": "convert_cli_commands",
+    "add tm formssoaction": "convert_cli_commands",
+    "add tm samlssoprofile": "convert_cli_commands",
+    "add tm sessionpolicy": "convert_cli_commands",
+    "add tm trafficpolicy": "convert_cli_commands",
+    "add transform policy": "convert_cli_commands",
+    "add tunnel trafficpolicy": "convert_cli_commands",
+    "add videooptimization detectionpolicy": "convert_cli_commands",
+    "add videooptimization pacingpolicy": "convert_cli_commands",
+    "add vpn clientlessaccesspolicy": "convert_cli_commands",
+    "add vpn sessionpolicy": "convert_cli_commands",
+    "add vpn trafficaction": "convert_cli_commands",
+    "add vpn trafficpolicy": "convert_cli_commands",
+    "add vpn vserver": "convert_cli_commands",
+    "bind aaa group": "convert_cli_commands",
+    "bind aaa user": "convert_cli_commands",
+    "bind appfw global": "convert_cli_commands",
+    "bind authentication vserver": "convert_auth_cmd",
+    "bind cmp global": "convert_cmp_cmd",
+    "bind cr vserver": "convert_cli_commands",
+    "bind cs vserver": "convert_cli_commands",
+    "bind filter global": "convert_filter_command",
+    "bind lb vserver": "convert_lb_cmd",
+    "bind policy patclass": "convert_patclass_commands",
+    "bind responder global": "convert_responder_command",
+    "bind rewrite global": "convert_rewrite_command",
+    "bind ssl global": "convert_cli_commands",
+    "bind ssl vserver": "convert_cli_commands",
+    "bind vpn global": "convert_cli_commands",
+    "bind vpn vserver": "convert_cli_commands",
+    "enable ns feature": "convert_cli_commands",
+    "set authentication webauthaction": "convert_cli_commands",
+    "set cmp parameter": "convert_cmp_cmd",
+    "set cmp policy": "convert_cmp_cmd",
+    "set filter htmlinjectionparameter": "convert_filter_command",
+    "set filter htmlinjectionvariable": "convert_filter_command",
+    "set filter postbodyinjection": "convert_filter_command",
+    "set filter prebodyinjection": "convert_filter_command",
+    "set ns httpprofile": "convert_cli_commands",
+    "set sc parameter": "convert_cli_commands",
+    "set uiinternal expression": "convert_cli_commands",
+}
+
+# key: name of a built-in policy stored by the init method of a module
+#      other than the core modules
+# value: module handling binds of the policy
+BUILTIN_POLICY_HANDLERS = {
+    "ns_adv_cmp_content_type": "convert_cmp_cmd",
+    "ns_adv_cmp_msapp": "convert_cmp_cmd",
+    "ns_adv_cmp_mscss": "convert_cmp_cmd",
+    "ns_adv_nocmp_mozilla_47": "convert_cmp_cmd",
+    "ns_adv_nocmp_xml_ie": "convert_cmp_cmd",
+    "ns_cmp_content_type": "convert_cmp_cmd",
+    "ns_cmp_msapp": "convert_cmp_cmd",
+    "ns_cmp_mscss": "convert_cmp_cmd",
+    "ns_nocmp_mozilla_47": "convert_cmp_cmd",
+    "ns_nocmp_xml_ie": "convert_cmp_cmd",
+}
+
+
+def check_manifest():
+    """
+    Compares the manifest with the handlers that the converter modules
+    register.
+
+    Returns:
+        List of messages describing the differences
+    """
+    import nspepi_common as common
+    errors = []
+    currentdir = os.path.dirname(os.path.abspath(__file__))
+    converter_modules = [
+        os.path.splitext(os.path.basename(path))[0]
+        for path in sorted(glob.glob(os.path.join(currentdir, "convert_*.py")))]
+    for module in converter_modules:
+        importlib.import_module(module)
+    # Handler classes of other tools, such as the ones of
+    # check_classic_configs, are not in the manifest.
+    for cls in common.handler_classes:
+        if (cls.__module__ in converter_modules and
+                cls.__module__ not in HANDLER_MODULES):
+            errors.append("module {} of handler class {} is not in"
+                          " HANDLER_MODULES".format(cls.__module__,
+                                                     cls.__name__))
+    with common.ConversionContext():
+        common.load_handlers(HANDLER_MODULES)
+        for m in common.init_methods:
+            m.method(m.obj)
+        handlers = {}
+        for key, dispatch_list in common.dispatchtable.items():
+            handlers[key] = set(data.obj.__class__.__module__
+                                for data in dispatch_list)
+        class_modules = dict((cls.__name__, cls.__module__)
+                             for cls in common.handlers)
+        builtin_policies = {}
+        for name, policy in common.pols_binds.policies.items():
+            module = class_modules.get(policy.module)
+            if module is not None and module not in CORE_MODULES:
+                builtin_policies[name] = module
+    for key in sorted(set(handlers) | set(COMMAND_HANDLERS)):
+        expected = set()
+        if key in COMMAND_HANDLERS:
+            expected.add(COMMAND_HANDLERS[key])
+        if handlers.get(key, set()) != expected:
+            errors.append("command \"{}\" is handled by {}, manifest has {}"
+                          "".format(key, sorted(handlers.get(key, set())),
+                                    sorted(expected)))
+    for name in sorted(set(builtin_policies) | set(BUILTIN_POLICY_HANDLERS)):
+        if builtin_policies.get(name) != BUILTIN_POLICY_HANDLERS.get(name):
+            errors.append("built-in policy {} is handled by {}, manifest has"
+                          " {}".format(name, builtin_policies.get(name),
+                                       BUILTIN_POLICY_HANDLERS.get(name)))
+    return errors
+
+
+def main():
+    errors = check_manifest()
+    for error in errors:
+        print(error)
+    if errors:
+        sys.exit(1)
+    print("handler manifest is up to date")
+
+
+if __name__ == '__main__':
+    main()
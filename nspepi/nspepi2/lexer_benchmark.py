@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Microbenchmark of cli_lex.Lexer: full tokenization of add cmp policy
+commands whose quoted rule is a few kilobytes long.
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import argparse
+
+import benchmark_common
+
+
+def cmp_policy_command(rule_size):
+    """
+    Returns an add cmp policy command with a quoted rule of about
+    rule_size characters, with escaped quotes and parentheses.
+    """
+    term = 'HTTP.REQ.URL.SUFFIX.EQ(\\"html\\") || '
+    rule = term * (rule_size // len(term)) + "HTTP.REQ.IS_VALID"
+    return 'add cmp policy cmp_pol1 -rule "{}" -resAction COMPRESS'.format(
+        rule)
+
+
+def tokenize(lexer, command):
+    """ Returns the number of tokens of command. """
+    lexer.input(command)
+    count = 0
+    while lexer.token() is not None:
+        count += 1
+    return count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure CLI command tokenization.")
+    benchmark_common.add_arguments(arg_parser, runs=21)
+    args = arg_parser.parse_args()
+    benchmark_common.use_nspepi_dir(args.nspepi_dir)
+    import cli_lex
+    lexer = cli_lex.Lexer()
+    for rule_size in (1024, 4096, 16384):
+        command = cmp_policy_command(rule_size)
+        benchmark_common.report(
+            "tokenize, {} KB rule".format(rule_size // 1024),
+            benchmark_common.median_time(
+                lambda: tokenize(lexer, command), args.runs, 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Memory benchmark of the parse trees and CLI tokens kept for a config:
+parses a generated config of cmp policies and binds, and reports the
+memory allocated per command, per parse tree node and per token, and the
+peak resident set size of nspepi converting the whole config.
+Dependency packages: None (Python 3 for tracemalloc, Unix for the peak
+resident set size)
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Windows: the peak resident set size is not reported.
+    resource = None
+
+import benchmark_common
+
+
+def config_lines(policies):
+    """ Returns the lines of a config with the given number of policies. """
+    lines = []
+    for i in range(policies):
+        lines.append('add cmp policy cmp_pol{0} -rule "HTTP.REQ.URL.SUFFIX'
+                     '.EQ(\\"html\\") || HTTP.REQ.HEADER(\\"Host\\").EQ('
+                     '\\"host{0}.example.com\\")" -resAction COMPRESS\n'
+                     .format(i))
+        lines.append("bind cmp global cmp_pol{0} -priority {1}\n".format(
+            i, 100 + i))
+    return lines
+
+
+def object_size(obj):
+    """ Returns the size of an object with its __dict__, if any. """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def allocated(build):
+    """
+    Returns what build() returns and the bytes allocated for it.
+    build - function building the objects to measure
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def conversion_peak_rss(nspepi_dir, lines):
+    """
+    Converts a config with nspepi_main.py in a child process, and returns
+    the peak resident set size of the child in bytes.
+    nspepi_dir - path of the nspepi2 directory
+    lines - lines of the config
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        config_path = os.path.join(work_dir, "ns.conf")
+        with open(config_path, "w") as config:
+            config.writelines(lines)
+        with open(os.devnull, "w") as devnull:
+            proc = subprocess.Popen(
+                [sys.executable, os.path.join(nspepi_dir, "nspepi_main.py"),
+                 "-f", config_path], stdout=devnull, stderr=devnull)
+            # wait4 gives the resource usage of this child alone.
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = status
+        if status != 0:
+            sys.exit("nspepi_main.py failed to convert the config")
+    finally:
+        shutil.rmtree(work_dir)
+    if sys.platform == "darwin":
+        return usage.ru_maxrss
+    return usage.ru_maxrss * 1024
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the memory of parse trees and CLI tokens.")
+    arg_parser.add_argument(
+        "-p", "--policies", type=int, default=4000,
+        help="number of cmp policies of the config (default: %(default)s)")
+    benchmark_common.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    nspepi_dir = benchmark_common.use_nspepi_dir(args.nspepi_dir)
+    lines = config_lines(args.policies)
+    if resource is not None:
+        # Measured first: a child starts with the peak resident set size
+        # of this process when it is created. The difference from a one
+        # policy config leaves out the interpreter and the modules.
+        small_rss = conversion_peak_rss(nspepi_dir, config_lines(1))
+        rss = conversion_peak_rss(nspepi_dir, lines)
+    import cli_lex
+    import cli_yacc
+    import nspepi_parse_tree
+    cli_yacc.cli_yacc_init()
+
+    def parse():
+        return [cli_yacc.cli_yacc_parse(line, lineno)
+                for lineno, line in enumerate(lines, 1)]
+
+    def tokenize():
+        lexer = cli_lex.Lexer()
+        tokens = []
+        for line in lines:
+            lexer.input(line)
+            token = lexer.token()
+            while token is not None:
+                tokens.append(token)
+                token = lexer.token()
+        return tokens
+
+    trees, trees_size = allocated(parse)
+    tree_ids = set(map(id, trees))
+    nodes = [obj for obj in gc.get_objects()
+             if isinstance(obj, nspepi_parse_tree.CLIParseTreeNode)
+             and id(obj) not in tree_ids]
+    tokens, tokens_size = allocated(tokenize)
+    benchmark_common.report(
+        "parse trees, allocated per command", trees_size / len(lines), "B")
+    benchmark_common.report(
+        "parse tree nodes per command", len(nodes) / len(lines), "")
+    benchmark_common.report(
+        "parse tree node", sum(map(object_size, nodes)) / len(nodes), "B")
+    benchmark_common.report(
+        "parse tree root node", sum(map(object_size, trees)) / len(trees),
+        "B")
+    benchmark_common.report(
+        "tokens, allocated per token", tokens_size / len(tokens), "B")
+    benchmark_common.report(
+        "LexToken", sum(map(object_size, tokens)) / len(tokens), "B")
+    if resource is not None:
+        benchmark_common.report(
+            "conversion peak RSS, 1 policy", small_rss / 1048576.0, "MiB")
+        benchmark_common.report(
+            "conversion peak RSS, {} policies".format(args.policies),
+            rss / 1048576.0, "MiB")
+        benchmark_common.report(
+            "conversion peak RSS per command",
+            (rss - small_rss) / (len(lines) - 2.0), "B")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Library API of nspepi: converts configs and expressions within the calling
+process. Each call runs in a new ConversionContext, so that one process can
+run many conversions one after another, or from several threads, without
+state of one conversion leaking into another. Conversions are serialized:
+the converter modules keep their state in module globals, so only one
+context can be entered at a time and calls from other threads wait for
+it. Calls from several threads are safe but do not run in parallel; use
+the jobs argument of convert_config to convert expressions in parallel.
+
+Example:
+    import nspepi_api
+    result = nspepi_api.convert_config(open("ns.conf").read())
+    new_config = result.output
+
+Dependency packages: PLY (optional, for use_ply)
+"""
+
+import logging
+
+import cli_yacc
+import convert_cli_commands
+import nspepi_common as common
+import nspepi_main
+import nspepi_output
+
+
+class ConversionResult(object):
+    """
+    Result of a conversion.
+    output - the converted config, or the converted expression enclosed in
+             quotes, or None if the expression cannot be converted
+    messages - list of (level name, message) of the warnings and errors,
+               the ones written to the warn_<conf> file by nspepi
+    context - ConversionContext with the state the conversion ended with
+    """
+    __slots__ = ('output', 'messages', 'context')
+
+    def __init__(self, output, messages, context):
+        self.output = output
+        self.messages = messages
+        self.context = context
+
+    def __repr__(self):
+        """ Creates an unambiguous representation of the result.
+
+        Returns:
+            str: the string representation
+        """
+        return common.class_repr(self)
+
+
+def convert_config(config, name="ns.conf", jobs=1, cache_dir=None,
+                   use_ply=False):
+    """
+    Converts classic policy expressions in a config to advanced
+    expressions and deprecated commands to non-deprecated commands.
+
+    Args:
+        config: config text, or an iterable of its lines such as a file
+                object
+        name: config file name used in the comments of the commands which
+              could not be converted
+        jobs: number of processes converting expressions of the config
+        cache_dir: directory of an on-disk cache of expression conversions
+                   to reuse, or None
+        use_ply: True to parse commands with the PLY parser
+
+    Returns:
+        ConversionResult with the converted config as output
+    """
+    if isinstance(config, str):
+        config = config.splitlines(True)
+
+    def convert():
+        convert_cli_commands.tool_error_comment = (
+            " # Error in conversion in using nspepi tool, for details see"
+            " the warn_" + name + "\n")
+        convert_cli_commands.parsing_config_file = True
+        outfile = nspepi_output.StringOutput()
+        nspepi_main.convert_config_file(config, outfile, False)
+        return outfile.getvalue()
+    return _run(convert, jobs, cache_dir, use_ply)
+
+
+def convert_expression(expr, cache_dir=None):
+    """
+    Converts a classic policy expression, or the classic parts of an
+    advanced policy expression, to an advanced policy expression.
+
+    Args:
+        expr: the expression to convert
+        cache_dir: directory of an on-disk cache of expression conversions
+                   to reuse, or None
+
+    Returns:
+        ConversionResult with the converted expression enclosed in quotes,
+        or None, as output
+    """
+    def convert():
+        convert_cli_commands.no_conversion_collect_data = False
+        return nspepi_main.convert_expression(expr)
+    return _run(convert, 1, cache_dir, False)
+
+
+def _run(convert, jobs, cache_dir, use_ply):
+    """
+    Runs a conversion in a new context, collecting the messages logged.
+    convert - function doing the conversion and returning its output
+    jobs - number of processes converting expressions
+    cache_dir - directory of the on-disk cache, or None
+    use_ply - True to parse commands with the PLY parser
+    Returns the ConversionResult.
+    """
+    context = common.ConversionContext()
+    log_buffer = common.LogRecordBuffer()
+    with context:
+        log_buffer.start()
+        try:
+            common.nspepi_tool_jobs = jobs
+            cli_yacc.use_ply = use_ply
+            if cache_dir is not None:
+                common.open_nspepi_tool_disk_cache(cache_dir,
+                                                   close_at_exit=False)
+            try:
+                convert_cli_commands.convert_cli_init()
+                output = convert()
+            finally:
+                if common.nspepi_tool_disk_cache is not None:
+                    common.nspepi_tool_disk_cache.close()
+                    common.nspepi_tool_disk_cache = None
+        finally:
+            log_buffer.stop()
+    messages = [(record.levelname, record.getMessage())
+                for record in log_buffer.take()
+                if record.levelno >= logging.WARNING]
+    return ConversionResult(output, messages, context)
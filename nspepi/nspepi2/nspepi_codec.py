@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+# Copyright 2021 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Quoting and escaping of CLI values and decoding of policy expression
+string literals, shared by the parse tree and the expression lexer.
+"""
+
+import logging
+import re
+
+# Characters for which a CLI value has to be quoted.
+must_quote_chars = re.compile('[ \t\r\n"\'\\\\()]')
+# Characters which have to be escaped inside a quoted CLI value.
+must_escape_chars = "\t\r\n\"\\"
+# Characters that start a q-quoted CLI value after "q".
+qquote_delims = "/{<|~$^+=&%@`?"
+
+
+def _escape(val):
+    """ Escapes the characters in must_escape_chars, backslash first. """
+    return (val.replace("\\", "\\\\").replace("\"", "\\\"")
+            .replace("\t", "\\t").replace("\r", "\\r").replace("\n", "\\n"))
+
+
+# Quoted form of short values, which are mostly names and keywords that
+# repeat across commands. Cleared when it reaches the maximum size.
+_quoted_values = {}
+_quoted_values_max_size = 65536
+_quoted_value_max_len = 256
+
+
+def quote_cli_value(val, make_str=False):
+    """
+    Normalizes the string representation for an item in a CLI command
+    so that it will correctly be understood by the CLI. Only uses double
+    quotes, and only if any quoting is needed; this may put in quotes in
+    some cases where they are not actually needed.
+    val - the string value to normalize.
+    make_str - to always quote, when special characters are needed in
+               string.
+    Returns the normalized string.
+    """
+    memoize = len(val) <= _quoted_value_max_len
+    if memoize:
+        result = _quoted_values.get((val, make_str))
+        if result is not None:
+            return result
+    if not val:
+        result = '""'
+    elif (make_str or val[0] == '-' or val[0] == '#'
+            or (val[0] == 'q' and len(val) > 1 and
+                val[1] in qquote_delims)
+            or must_quote_chars.search(val)):
+        result = '"' + _escape(val) + '"'
+    else:
+        result = val
+    if memoize:
+        if len(_quoted_values) >= _quoted_values_max_size:
+            _quoted_values.clear()
+        _quoted_values[(val, make_str)] = result
+    return result
+
+
+# Run of characters without escapes in a string literal.
+_pi_plain_re = re.compile(r'[^"\\]*')
+_pi_hex_re = re.compile(r'[0-9a-fA-F]{2}')
+_pi_oct_re = re.compile(r'[0-7]{1,3}')
+_pi_escapes = {"\\": "\\", "'": "'", "\"": "\"",
+               "t": "\t", "r": "\r", "n": "\n"}
+
+
+def decode_pi_string(expr):
+    """
+    Decodes the string literal at the start of expr.
+    expr - text starting with the opening double quote of the literal.
+    Returns None if expr doesn't start with a valid string literal, or
+    a list with:
+        - the value of the literal, after handling backslashes
+        - the length of the literal, including the double quotes
+    """
+    if not expr.startswith('"'):
+        return None
+    pieces = []
+    expr_length = len(expr)
+    # Skip the opening quote
+    index = 1
+    while True:
+        end = _pi_plain_re.match(expr, index).end()
+        pieces.append(expr[index:end])
+        index = end
+        if index >= expr_length:
+            return None
+        if expr[index] == '"':
+            break
+        # Backslash
+        index += 1
+        if index >= expr_length:
+            return None
+        ch = expr[index]
+        if ch in _pi_escapes:
+            pieces.append(_pi_escapes[ch])
+            index += 1
+        elif ch == 'x':
+            # Two hex digits for a byte
+            m = _pi_hex_re.match(expr, index + 1)
+            if m is None:
+                return None
+            hex_value = int(m.group(), 16)
+            if hex_value > 127:
+                logging.error("Invalid hex value is used. Maximum "
+                              "hex value allowed is 7f.")
+                return None
+            pieces.append(chr(hex_value))
+            index = m.end()
+        elif ch in "01234567":
+            # Up to three octal digits for a byte
+            m = _pi_oct_re.match(expr, index)
+            oct_value = int(m.group(), 8)
+            if oct_value > 127:
+                logging.error("Invalid octal value is used. Maximum "
+                              "octal value allowed is 177.")
+                return None
+            pieces.append(chr(oct_value))
+            index = m.end()
+        else:
+            return None
+    # Include the closing quote in the length.
+    return ["".join(pieces), index + 1]
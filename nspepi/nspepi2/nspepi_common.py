@@ -9,41 +9,471 @@ Common data for nspepi accessible from other modules.
 Dependency packages: None
 """
 
+import atexit
 import collections
 import copy
+import errno
 import functools
+import glob
+import importlib
 import itertools
 import logging
+import subprocess
 import sys
+import threading
 import os
-import inspect
 
 
+import classic_expr_translator
+import handler_manifest
 import nspepi_parse_tree
 
-currentfile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 has intern as a builtin.
+    pass
+
+# hashlib, multiprocessing and sqlite3 are only imported when the on-disk
+# cache or worker processes are used, as they are slow to import and
+# nspepi -e needs neither.
+sqlite3 = None
+
+currentfile = os.path.abspath(__file__)
 currentdir = os.path.dirname(currentfile)
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
 
+# Cached path of old nspepi tool, looked up on first use.
+_nspepi_tool_path = None
+
+
 def get_nspepi_tool_path():
     """ Get the path of old nspepi tool.
     This function will check whether the tool
     exists in the current directory or the
     parent directory, and return the path
     based on that."""
-    file_found = False
+    global _nspepi_tool_path
+    if _nspepi_tool_path is not None:
+        return _nspepi_tool_path
     filename = 'nspepi_helper'
     for path in [currentdir, parentdir]:
         candidate = os.path.join(path, filename)
         if os.path.isfile(candidate):
-            file_found = True
+            _nspepi_tool_path = os.path.abspath(candidate)
             break
-    if file_found:
-        return os.path.abspath(candidate)
+    return _nspepi_tool_path
+
+
+class NspepiHelper(object):
+    """
+    Old nspepi tool kept running in its -s mode, so that Perl and the
+    tool are compiled once per run instead of once per expression.
+    Requests and responses are "<length>\\n<data>" on the tool's
+    stdin and stdout. Response data is the same output as that of
+    "perl nspepi_helper -e <expr>" with stderr merged into stdout.
+    """
+
+    def __init__(self, tool_path):
+        self._cmd = ['perl', tool_path, '-s']
+        self._proc = None
+        self._returncode = None
+
+    def run(self, expr):
+        """
+        Returns the tool output for expr.
+        Raises subprocess.CalledProcessError if the tool fails.
+        expr - classic expression to be converted
+        """
+        if self._proc is None:
+            self._proc = subprocess.Popen(
+                self._cmd, shell=False, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if not isinstance(expr, bytes):
+            expr = expr.encode()
+        header = b""
+        try:
+            self._proc.stdin.write(str(len(expr)).encode() + b"\n" + expr)
+            self._proc.stdin.flush()
+            header = self._proc.stdout.readline()
+            length = int(header)
+        except (IOError, OSError, ValueError):
+            # Tool exited or wrote something other than a response,
+            # report whatever it printed.
+            output = self._proc.stdout.read()
+            if header:
+                output = header + output
+            self.close()
+            raise subprocess.CalledProcessError(
+                self._returncode, self._cmd + [expr], output)
+        return self._proc.stdout.read(length)
+
+    def close(self):
+        """ Stops the tool process, if running. """
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        self._returncode = self._proc.wait()
+        self._proc.stdout.close()
+        self._proc = None
+
+
+class NspepiToolDiskCache(object):
+    """
+    Old nspepi tool output kept in an sqlite database in a cache directory,
+    so that it can be reused by later runs and by other nspepi processes
+    using the same directory.
+    Entries are keyed on a hash of the expression and of the nspepi_helper
+    and nspepi2 sources, so that entries of other tool versions are not
+    used. New entries are written in one transaction by flush().
+    """
+
+    def __init__(self, cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError as exc:
+            # Also created by another nspepi process starting at once.
+            if exc.errno != errno.EEXIST:
+                raise
+        self._version = NspepiToolDiskCache.sources_hash()
+        self._pending = {}
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "nspepi_cache.sqlite"), timeout=60)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tool_output"
+                           " (key TEXT PRIMARY KEY, output BLOB)")
+        self._conn.commit()
+
+    @staticmethod
+    def sources_hash():
+        """ Returns hash of nspepi_helper and the nspepi2 sources. """
+        import hashlib
+        digest = hashlib.sha256()
+        paths = sorted(glob.glob(os.path.join(currentdir, "*.py")))
+        paths.append(get_nspepi_tool_path())
+        for path in paths:
+            if path is None:
+                continue
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as source:
+                digest.update(source.read())
+        return digest.hexdigest()
+
+    def _key(self, expr):
+        import hashlib
+        if not isinstance(expr, bytes):
+            expr = expr.encode()
+        return hashlib.sha256(self._version.encode() + b"\0" +
+                              expr).hexdigest()
+
+    def get(self, expr):
+        """
+        Returns the cached tool output for expr, or None if not cached.
+        expr - classic expression
+        """
+        key = self._key(expr)
+        if key in self._pending:
+            return self._pending[key]
+        try:
+            row = self._conn.execute("SELECT output FROM tool_output"
+                                     " WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as exc:
+            logging.error("Unable to read nspepi cache: {}".format(exc))
+            return None
+        if row is None:
+            return None
+        return bytes(row[0])
+
+    def put(self, expr, output):
+        """
+        Adds the tool output for expr, to be written by flush().
+        expr - classic expression
+        output - tool output
+        """
+        self._pending[self._key(expr)] = output
+
+    def flush(self):
+        """ Writes the new entries to the database. """
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tool_output VALUES (?, ?)",
+                [(key, sqlite3.Binary(output))
+                 for key, output in self._pending.items()])
+        self._pending = {}
+
+    def close(self):
+        """ Writes the new entries and closes the database. """
+        try:
+            self.flush()
+        except sqlite3.Error as exc:
+            logging.error("Unable to update nspepi cache: {}".format(exc))
+        self._conn.close()
+
+
+def open_nspepi_tool_disk_cache(cache_dir, close_at_exit=True):
+    """
+    Makes run_nspepi_tool use the on-disk cache in cache_dir.
+    cache_dir - directory of the cache database, created if needed
+    close_at_exit - True to close the cache when the program exits,
+                    False if the caller closes it
+    """
+    global nspepi_tool_disk_cache
+    global sqlite3
+    try:
+        import sqlite3
+    except ImportError:
+        logging.error("Python sqlite3 module is not available,"
+                      " not using nspepi cache directory")
+        return
+    try:
+        nspepi_tool_disk_cache = NspepiToolDiskCache(cache_dir)
+    except (sqlite3.Error, IOError, OSError) as exc:
+        logging.error("Unable to use nspepi cache directory {}: {}".format(
+            cache_dir, exc))
+        return
+    if close_at_exit:
+        atexit.register(nspepi_tool_disk_cache.close)
+
+
+_nspepi_helper = None
+# On-disk cache used by run_nspepi_tool, if any.
+nspepi_tool_disk_cache = None
+# Number of worker processes used by run_nspepi_tool_batch.
+nspepi_tool_jobs = 1
+# Set to run old nspepi tool also for the expressions which are converted
+# in-process, and to report when the outputs differ.
+compare_nspepi_tool = False
+
+
+# Old nspepi tool output of the expressions run so far. The output only
+# depends on the expression, so it is kept for the whole run and shared by
+# both passes over the config file and by the config checker. A failure of
+# the tool is kept as the raised exception.
+nspepi_tool_cache = {}
+nspepi_tool_cache_hits = 0
+nspepi_tool_cache_misses = 0
+nspepi_tool_disk_cache_hits = 0
+
+
+def run_nspepi_tool(expr):
+    """
+    Returns old nspepi tool output for the given expression, with stderr
+    merged into it, like
+    subprocess.check_output(['perl', <tool>, '-e', expr]) does.
+    The output is looked up in nspepi_tool_cache and then in
+    nspepi_tool_disk_cache first.
+    Raises subprocess.CalledProcessError if the tool fails.
+    expr - classic expression to be converted
+    """
+    global nspepi_tool_cache_hits
+    if expr in nspepi_tool_cache:
+        nspepi_tool_cache_hits += 1
     else:
+        output = _get_disk_cached_output(expr)
+        if output is None:
+            output = _nspepi_tool_result(expr)
+        _store_nspepi_tool_output(expr, output)
+    output = nspepi_tool_cache[expr]
+    if isinstance(output, subprocess.CalledProcessError):
+        raise output
+    return output
+
+
+def run_nspepi_tool_batch(exprs):
+    """
+    Runs old nspepi tool for the given expressions which are not in
+    nspepi_tool_cache yet, so that run_nspepi_tool later finds all of
+    them there. The expressions are spread over nspepi_tool_jobs worker
+    processes, except when comparing with old nspepi tool, whose messages
+    would then be logged in no particular order.
+    exprs - classic expressions to be converted
+    """
+    pending = []
+    for expr in sorted(exprs):
+        if expr in nspepi_tool_cache:
+            continue
+        output = _get_disk_cached_output(expr)
+        if output is None:
+            pending.append(expr)
+        else:
+            _store_nspepi_tool_output(expr, output)
+    if nspepi_tool_jobs > 1 and len(pending) > 1 and not compare_nspepi_tool:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(nspepi_tool_jobs, len(pending)),
+                                    _init_nspepi_tool_worker)
+        try:
+            outputs = pool.map(_nspepi_tool_result, pending)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outputs = [_nspepi_tool_result(expr) for expr in pending]
+    for expr, output in zip(pending, outputs):
+        _store_nspepi_tool_output(expr, output)
+
+
+def _get_disk_cached_output(expr):
+    """
+    Helper function for run_nspepi_tool, counts a miss of nspepi_tool_cache
+    and returns output from nspepi_tool_disk_cache, or None.
+    expr - classic expression
+    """
+    global nspepi_tool_cache_misses
+    global nspepi_tool_disk_cache_hits
+    nspepi_tool_cache_misses += 1
+    if nspepi_tool_disk_cache is None or compare_nspepi_tool:
         return None
+    output = nspepi_tool_disk_cache.get(expr)
+    if output is not None:
+        nspepi_tool_disk_cache_hits += 1
+    return output
+
+
+def _store_nspepi_tool_output(expr, output):
+    """
+    Helper function for run_nspepi_tool, adds output to the caches.
+    expr - classic expression
+    output - tool output or the raised subprocess.CalledProcessError
+    """
+    if (nspepi_tool_disk_cache is not None and not compare_nspepi_tool and
+            not isinstance(output, subprocess.CalledProcessError)):
+        nspepi_tool_disk_cache.put(expr, output)
+    nspepi_tool_cache[expr] = output
+
+
+def _init_nspepi_tool_worker():
+    """
+    Initializes a worker process of run_nspepi_tool_batch. The old nspepi
+    tool process of the parent must not be used, the worker starts its
+    own when needed.
+    """
+    global _nspepi_helper
+    _nspepi_helper = None
+
+
+def _nspepi_tool_result(expr):
+    """
+    Returns old nspepi tool output for expr, or the raised
+    subprocess.CalledProcessError.
+    expr - classic expression to be converted
+    """
+    try:
+        return _run_nspepi_tool(expr)
+    except subprocess.CalledProcessError as exc:
+        return exc
+
+
+def _run_nspepi_tool(expr):
+    """
+    Helper function for run_nspepi_tool.
+    The expression is converted in-process when possible, otherwise the
+    tool process is started on first use and reused afterwards.
+    expr - classic expression to be converted
+    """
+    global _nspepi_helper
+    output = classic_expr_translator.translate(expr)
+    if output is not None:
+        output = output.encode()
+        if not compare_nspepi_tool:
+            return output
+    if _nspepi_helper is None:
+        _nspepi_helper = NspepiHelper(get_nspepi_tool_path())
+        atexit.register(_nspepi_helper.close)
+    tool_output = _nspepi_helper.run(expr)
+    if output is not None and output != tool_output:
+        logging.error("In-process conversion differs from nspepi_helper"
+                      " for expression: {}".format(expr))
+        logging.error("In-process output: {}".format(output))
+        logging.error("nspepi_helper output: {}".format(tool_output))
+    return tool_output
+
+
+class LogRecordBuffer(logging.Handler):
+    """
+    Logging handler which keeps the records logged by the thread that
+    started it while it is started, so that they can be logged later by
+    replay_log_records. While started, it replaces the handlers of the root
+    logger and passes the records of other threads on to them.
+    """
+
+    def __init__(self):
+        levels = [handler.level for handler in logging.getLogger().handlers]
+        logging.Handler.__init__(self, min(levels or [logging.NOTSET]))
+        self._records = []
+        self._handlers = None
+        self._thread = None
+
+    def emit(self, record):
+        if record.thread == self._thread:
+            self._records.append(record)
+            return
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def start(self):
+        """ Starts keeping the records instead of logging them. """
+        root = logging.getLogger()
+        self._handlers = root.handlers
+        self._thread = threading.current_thread().ident
+        root.handlers = [self]
+
+    def stop(self):
+        """ Restores the handlers of the root logger. """
+        logging.getLogger().handlers = self._handlers
+
+    def take(self):
+        """ Returns the records kept so far and forgets them. """
+        records = self._records
+        self._records = []
+        return records
+
+
+def replay_log_records(records):
+    """
+    Logs the records kept by LogRecordBuffer.
+    records - list of log records
+    """
+    root = logging.getLogger()
+    for record in records:
+        root.handle(record)
+
+
+# True iff debug logs are written. Debug messages on the hot paths (parse
+# tree, parser, priority analysis) are only built when this is set.
+debug_trace = False
+
+
+def enable_debug_trace(enabled):
+    """
+    Switches building of debug messages on or off. Called once at
+    startup when logging is set up.
+    enabled - True iff debug logs are written
+    """
+    global debug_trace
+    debug_trace = enabled
+
+
+def trace_event(phase, lineno=None, key=None):
+    """
+    Logs a debug event for a processing phase, or for the command
+    being processed in that phase. Callers check debug_trace first.
+    phase  - name of the phase
+    lineno - line number of the command, if any
+    key    - command type of the command ("op group ot"), if any
+    """
+    event = "Trace: phase=" + phase
+    if lineno is not None:
+        event += " line=" + str(lineno)
+    if key is not None:
+        event += " command=\"" + key + "\""
+    logging.debug(event)
 
 
 CMD_MOD_ERR_MSG = (" Advanced expressions only have a fixed ordering of the"
@@ -65,6 +495,13 @@ init_methods = []
 # bindings.
 # Two level dictionary: bind_table[bind_cmd_module][policy_type]
 bind_table = collections.OrderedDict()
+# classes registered by register_class_methods, in the order of
+# registration, to create the handler objects of each conversion context.
+handler_classes = []
+# handler objects created in the current conversion context
+# key: handler class
+# value: handler object
+handlers = collections.OrderedDict()
 
 
 class DispatchData(object):
@@ -90,7 +527,24 @@ def register_class_methods(cls):
     Returns:
         cls: The class itself that was passed in as an argument.
     """
+    handler_classes.append(cls)
+    _register_handler(cls)
+    return cls
+
+
+def _register_handler(cls):
+    """
+    Creates the handler object of a class registered by
+    register_class_methods and adds its tagged methods to the dispatch
+    tables of the current conversion context.
+
+    Args:
+        cls: The registered class.
+    """
+    if cls in handlers:
+        return
     obj = cls()
+    handlers[cls] = obj
     class_name = obj.__class__.__name__
     for name, method in cls.__dict__.items():
         if hasattr(method, "register_for_cmd"):
@@ -106,7 +560,44 @@ def register_class_methods(cls):
                 bind_table[bind_module][class_name] = DispatchData(obj, method)
         if hasattr(method, "register_for_init_call"):
             init_methods.append(DispatchData(obj, method))
-    return cls
+
+
+def load_handlers(module_names):
+    """
+    Imports converter modules and creates the handler objects of their
+    classes in the current conversion context, if not done yet. Modules
+    create their handler objects in the current context when they are
+    first imported, so this only creates the ones of modules imported
+    in another context.
+    The init and final methods are kept in the order of
+    handler_manifest.HANDLER_MODULES, whatever the order modules are
+    loaded in.
+
+    Args:
+        module_names: Names of the modules
+    """
+    for name in module_names:
+        importlib.import_module(name)
+    for cls in handler_classes:
+        if cls.__module__ in module_names:
+            _register_handler(cls)
+    init_methods.sort(key=_handler_order)
+    final_methods.sort(key=_handler_order)
+
+
+def _handler_order(data):
+    """
+    Returns the sort key of DispatchData in the init and final methods:
+    the position of the module of its handler class in
+    handler_manifest.HANDLER_MODULES, then the position of the class in
+    handler_classes.
+    """
+    cls = data.obj.__class__
+    if cls.__module__ in handler_manifest.HANDLER_MODULES:
+        module_order = handler_manifest.HANDLER_MODULES.index(cls.__module__)
+    else:
+        module_order = len(handler_manifest.HANDLER_MODULES)
+    return (module_order, handler_classes.index(cls))
 
 
 def register_for_cmd(op, group, ot):
@@ -258,7 +749,29 @@ def class_repr(obj):
     Returns:
         The string representation
     """
-    return '<' + type(obj).__name__ + ' ' + dict_repr(obj.__dict__) + '>'
+    attrs = dict(getattr(obj, '__dict__', {}))
+    transient_slots = getattr(obj, 'transient_slots', ())
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, name) and name not in transient_slots:
+                attrs[name] = getattr(obj, name)
+    return '<' + type(obj).__name__ + ' ' + dict_repr(attrs) + '>'
+
+
+def intern_name(name):
+    """
+    Interns an identifier string, such as a command group or policy name,
+    so that the many records holding the same name share one string.
+
+    Args:
+        name: The name to intern, None is returned as is
+
+    Returns:
+        The interned name
+    """
+    if type(name) is str:
+        return intern(name)
+    return name
 
 
 def get_cmd_arg(arg, cmd_tree):
@@ -293,6 +806,8 @@ class Group(object):
     Represents a group command based on a parsed command and provides
     methods to read and set info based on analysis.
     """
+    __slots__ = ('name', 'weight')
+
     def __init__(self, name="", weight="0"):
         """
         Construct object based on parsed group command parameters.
@@ -301,7 +816,7 @@ class Group(object):
             name: Name of the group
             weight: Weight of the group
         """
-        self.name = name
+        self.name = intern_name(name)
         self.weight = weight
 
     def __repr__(self):
@@ -318,6 +833,8 @@ class Policy(object):
     Represents a policy command based on a parsed command and provides
     methods to read and set info based on analysis.
     """
+    __slots__ = ('name', 'module', 'policy_type')
+
     def __init__(self, name="", module="", policy_type=""):
         """
         Construct object based on parsed policy command parameters.
@@ -328,8 +845,8 @@ class Policy(object):
                     (ex. responder, TMSession for tm sessionPolicy, etc.)
             policy_type: Type of the policy ("classic" or "advanced")
         """
-        self.name = name
-        self.module = module
+        self.name = intern_name(name)
+        self.module = intern_name(module)
         self.policy_type = policy_type
 
     def __repr__(self):
@@ -341,48 +858,242 @@ class Policy(object):
         return class_repr(self)
 
 
-class Bind(object):
+class BindIndex(object):
     """
-    Represents a bind command based on a parsed command and provides
-    methods to read and set info based on analysis.
+    Index of bind IDs by tuple keys. The keys are kept in the order that
+    nested dictionaries keyed by the parts of the keys would have, i.e.
+    by when each leading part of a key was first seen.
     """
-    def __init__(self, entity, entity_type, entity_name, policy_name,
-                 policy_module, bind_type, priority, cmd_str, global_type="",
-                 lineno="0"):
+    __slots__ = ('_binds', '_keys')
+
+    def __init__(self):
+        # key: tuple key, in the order of insertion
+        # value: list of bind IDs
+        self._binds = collections.OrderedDict()
+        # sorted keys, None if not yet sorted
+        self._keys = None
+
+    def add(self, key, bind_id):
         """
-        Construct object based on parsed bind command parameters.
+        Adds a bind ID at a key.
 
         Args:
-            entity: OT of the command (ex. vserver, user, group, service)
-            entity_type: Group of the command (ex. lb, cs, cr, ssl, aaa)
-            entity_name: Name of the entity (None if global)
-            policy_name: Name of the bound policy
-            policy_module: Module of the bound policy
-            bind_type: Type of the bind (ex. request, response, etc.)
-            priority: Priority of the bind command
-            cmd_str: String representation of the bind command
-            global_type: Suggested global type based on analysis
-                         (override or default or "")
-            lineno: Line number of the original bind command in config file
+            key: tuple key
+            bind_id: ID of the bind in its BindTable
         """
-        self.entity = entity
-        self.entity_type = entity_type
-        self.entity_name = entity_name
-        self.policy_name = policy_name
-        self.policy_module = policy_module
-        self.bind_type = bind_type
-        self.priority = priority
-        self.cmd_str = cmd_str
-        self.global_type = global_type
-        self.lineno = lineno
+        binds = self._binds.get(key)
+        if binds is None:
+            binds = self._binds[key] = []
+            self._keys = None
+        binds.append(bind_id)
+
+    def keys(self):
+        """ Returns the keys in the order described above. """
+        if self._keys is None:
+            self._keys = self._nested_order(list(self._binds), 0)
+        return self._keys
+
+    @staticmethod
+    def _nested_order(keys, inx):
+        """
+        Orders keys, having the same first inx parts and listed in the
+        order of insertion, by when each following part was first seen.
+        """
+        if len(keys) < 2:
+            return keys
+        groups = collections.OrderedDict()
+        for key in keys:
+            group = groups.get(key[inx])
+            if group is None:
+                groups[key[inx]] = [key]
+            else:
+                group.append(key)
+        if len(groups) == len(keys):
+            return keys
+        ordered = []
+        for group in groups.values():
+            ordered.extend(BindIndex._nested_order(group, inx + 1))
+        return ordered
+
+    def __getitem__(self, key):
+        return self._binds[key]
+
+    def __contains__(self, key):
+        return key in self._binds
+
+    def __len__(self):
+        return len(self._binds)
+
+
+class BindView(object):
+    """
+    Shows a bind of a BindTable like a record, for debug logs.
+    """
+    __slots__ = ('table', 'bind_id')
+
+    def __init__(self, table, bind_id):
+        self.table = table
+        self.bind_id = bind_id
 
     def __repr__(self):
-        """ Creates an unambiguous representation of the Bind object.
+        """ Creates an unambiguous representation of the bind.
 
         Returns:
             str: the string representation
         """
-        return class_repr(self)
+        t = self.table
+        i = self.bind_id
+        return '<Bind ' + dict_repr({
+            'entity': t.entities[i], 'entity_type': t.entity_types[i],
+            'entity_name': t.entity_names[i],
+            'policy_name': t.policy_names[i], 'policy_module': t.modules[i],
+            'bind_type': t.bind_types[i], 'priority': str(t.priorities[i]),
+            'cmd_str': t.cmd_str(i), 'global_type': t.global_types[i],
+            'lineno': t.linenos[i]}) + '>'
+
+
+class BindTable(object):
+    """
+    Holds the bind commands of the config for priority analysis and
+    reprioritization. Each bind is identified by an integer bind ID, and
+    its values are kept in one list per column, at the index of the bind
+    ID, as are the analysis results.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """ Removes all binds and analysis results. """
+        # OT of the command (ex. global, vserver, user, group, service)
+        self.entities = []
+        # Group of the command (ex. lb, cs, cr, ssl, aaa)
+        self.entity_types = []
+        # Name of the entity (None if global)
+        self.entity_names = []
+        # Name and module of the bound policy
+        self.policy_names = []
+        self.modules = []
+        # Type of the bind (ex. REQUEST, RESPONSE or "")
+        self.bind_types = []
+        # Priority of the bind command as an int; may be 0
+        self.priorities = []
+        # gotoPriorityExpression value
+        self.gotos = []
+        # Positional index or keyword name for the priority and goto
+        # arguments
+        self.priority_args = []
+        self.goto_args = []
+        # Processed and possibly modified parse tree of the bind command
+        self.parse_trees = []
+        # Where the bind is to be inserted: "before", "inplace" or "after"
+        self.positions = []
+        # Type of the bound policy ("classic", "advanced" or None)
+        self.policy_types = []
+        # Bind type information used for the -type keyword ("REQUEST" or
+        # "RESPONSE")
+        self.flow_type_directions = []
+        # Original bind command read from config
+        self.cmds = []
+        # Line number of the original bind command in config file
+        self.linenos = []
+        # Suggested global type based on analysis (override, default or "")
+        self.global_types = []
+        # IDs of all binds per bind point, for reprioritization
+        # key: (entity, entity_type, entity_name, module, bind_type)
+        #      with bind_type in lowercase, and entity_type and
+        #      entity_name as None for global binds
+        self.bindpoints = BindIndex()
+        # IDs of classic policy binds, for priority analysis
+        # key: (entity, entity_type, entity_name, module, bind_type)
+        #      with entity_type and entity_name as None for global binds
+        self.classic_bindpoints = BindIndex()
+        # IDs of the binds that cannot be converted
+        self.unsupported = set()
+        # key: bind ID
+        # value: suggested global type based on analysis
+        self.updated_global_types = {}
+
+    def add(self, entity, entity_type, entity_name, policy_name, module,
+            bind_type, priority, orig_cmd, lineno, parse_tree, position,
+            goto, priority_arg, goto_arg, policy_type,
+            flow_type_direction):
+        """
+        Adds a bind command.
+
+        Args:
+            entity: OT of the command (ex. vserver, user, group, service)
+            entity_type: Group of the command (ex. lb, cs, cr, ssl, aaa)
+            entity_name: Name of the entity (None if global)
+            policy_name: Name of the bound policy
+            module: Module of the bound policy
+            bind_type: Type of the bind (ex. REQUEST, RESPONSE or "")
+            priority: Priority of the bind command as an int
+            orig_cmd: Original bind command read from config
+            lineno: Line number of the original bind command
+            parse_tree: Processed parse tree of the bind command
+            position: Position of insertion
+            goto: gotoPriorityExpression value
+            priority_arg: Positional index or keyword name for priority
+            goto_arg: Positional index or keyword name for goto
+            policy_type: Type of the bound policy
+            flow_type_direction: Bind type information ("REQUEST" or
+                                 "RESPONSE")
+
+        Returns:
+            The bind ID
+        """
+        bind_id = len(self.entities)
+        entity = intern_name(entity)
+        entity_type = intern_name(entity_type)
+        entity_name = intern_name(entity_name)
+        module = intern_name(module)
+        bind_type = intern_name(bind_type)
+        self.entities.append(entity)
+        self.entity_types.append(entity_type)
+        self.entity_names.append(entity_name)
+        self.policy_names.append(intern_name(policy_name))
+        self.modules.append(module)
+        self.bind_types.append(bind_type)
+        self.priorities.append(priority)
+        self.gotos.append(goto)
+        self.priority_args.append(priority_arg)
+        self.goto_args.append(goto_arg)
+        self.parse_trees.append(parse_tree)
+        self.positions.append(position)
+        self.policy_types.append(policy_type)
+        self.flow_type_directions.append(flow_type_direction)
+        self.cmds.append(orig_cmd)
+        self.linenos.append(lineno)
+        self.global_types.append("")
+        if entity == "global":
+            entity_type = entity_name = None
+        self.bindpoints.add(
+            (entity, entity_type, entity_name, module, bind_type.lower()),
+            bind_id)
+        if policy_type == "classic":
+            self.classic_bindpoints.add(
+                (entity, entity_type, entity_name, module, bind_type),
+                bind_id)
+        return bind_id
+
+    def cmd_str(self, bind_id):
+        """ Returns the original bind command of a bind. """
+        return self.cmds[bind_id]
+
+    def view(self, bind_ids):
+        """ Returns BindViews of a list of bind IDs, for debug logs. """
+        return [BindView(self, bind_id) for bind_id in bind_ids]
+
+    def view_per_module(self, binds):
+        """
+        Returns BindViews of bind IDs per module and bind_type, for debug
+        logs.
+        """
+        return dict((module, dict((bind_type, self.view(bind_ids))
+                                  for bind_type, bind_ids in
+                                  bind_types.items()))
+                    for module, bind_types in binds.items())
 
 
 class PoliciesAndBinds(object):
@@ -398,6 +1109,12 @@ class PoliciesAndBinds(object):
     # to detect interleaving
     ORDER = ["global", "user", "group", "vpn", "lb", "cs", "cr", "service",
              "global"]
+    # Index of each entity group/"state" in ORDER, the first one for global
+    ORDER_INDEXES = dict((name, inx) for inx, name in reversed(
+        list(enumerate(ORDER))))
+    # Sort key of each entity group/"state" at the same priority, see
+    # entity_key()
+    ENTITY_KEYS = dict((name, inx) for inx, name in enumerate(ORDER[1:]))
     # List of the policy modules for which global override
     # should be skipped.
     skip_global_override = []
@@ -409,40 +1126,9 @@ class PoliciesAndBinds(object):
     # key: name of policy
     # value: Policy object
     policies = collections.defaultdict(lambda: Policy())
-    # dictionary that holds global bind commands for analysis
-    # global_binds[<module>][<bind_type>]
-    # key: policy module of bound policy (ex. responder, appfw, etc.)
-    # value: another dictionary with:
-    #        key: bind_type (ex. request/response)
-    #        value: list of Bind objects representing bind command
-    global_binds = collections.defaultdict(  # module
-        lambda: collections.defaultdict(list))  # bind_type
-    # dictionary that holds entity bind commands for analysis
-    # entity_binds[<entity>][<entity_type>][<entity_name>][<module>]
-    #                                                     [<bindtype>]
-    # key: entity (ex. vserver, user, group, service, global)
-    # value: another dictionary with:
-    #        key: entity_type (ex. lb, cs, cr, ssl, vpn, authorization, aaa)
-    #        value: another dictionary with:
-    #               key: entity_name (name of bind entity)
-    #               value: another dictionary with:
-    #                      key: module (module of bound policy)
-    #                      value: another dictionary with:
-    #                             key: bind_type (ex. request/response)
-    #                             value: list of Bind objects
-    entity_binds = collections.defaultdict(  # entity
-        lambda: collections.defaultdict(  # entity_type
-            lambda: collections.defaultdict(  # entity_name
-                lambda: collections.defaultdict(  # module
-                    lambda: collections.defaultdict(list)))))  # bind_type
-    # dictionary that holds analysis results for bind commands
-    # key: str representation of original bind command
-    # value: another dictionary with:
-    #        key: analysis result name for bind command
-    #        value: analysis result value for bind command
-    #        ex. key: "unsupported", value: True
-    priority_analysis_results = collections.defaultdict(  # bind cmd
-        lambda: collections.defaultdict())  # dict of results
+    # table that holds the bind commands, for analysis and
+    # reprioritization, and the analysis results
+    binds = BindTable()
 
     def __init__(self):
         pass
@@ -472,7 +1158,8 @@ class PoliciesAndBinds(object):
             groupobj: Group object representing group command
         """
         PoliciesAndBinds.groups[groupobj.name] = groupobj
-        logging.debug("Stored group: {}".format(groupobj))
+        if debug_trace:
+            logging.debug("Stored group: {}".format(groupobj))
 
     def get_group(self, groupname):
         """
@@ -491,7 +1178,8 @@ class PoliciesAndBinds(object):
             policyobj: Policy object representing policy command
         """
         PoliciesAndBinds.policies[policyobj.name] = policyobj
-        logging.debug("Stored policy: {}".format(policyobj))
+        if debug_trace:
+            logging.debug("Stored policy: {}".format(policyobj))
 
     def get_policy(self, policyname):
         """
@@ -502,24 +1190,66 @@ class PoliciesAndBinds(object):
         """
         return PoliciesAndBinds.policies[policyname]
 
-    def store_original_bind(self, bindobj):
+    def store_bind(self, *args):
         """
-        Store bind object representing bind command for analysis.
+        Store bind command for analysis and reprioritization. Only the
+        binds of classic policies are analyzed.
 
         Args:
-            bindobj: Bind object representing bind command
+            args: Values of the bind as for BindTable.add()
+
+        Returns:
+            The bind ID
         """
-        if (bindobj.policy_name in PoliciesAndBinds.policies
-            and PoliciesAndBinds.policies[bindobj.policy_name].policy_type
-                == "classic"):
-            logging.debug("Stored bind: {}".format(bindobj))
-            if bindobj.entity == "global":
-                (PoliciesAndBinds.global_binds
-                    [bindobj.policy_module][bindobj.bind_type]).append(bindobj)
-            else:
-                (PoliciesAndBinds.entity_binds
-                    [bindobj.entity][bindobj.entity_type][bindobj.entity_name]
-                    [bindobj.policy_module][bindobj.bind_type]).append(bindobj)
+        bind_id = PoliciesAndBinds.binds.add(*args)
+        if (debug_trace and
+                PoliciesAndBinds.binds.policy_types[bind_id] == "classic"):
+            logging.debug("Stored bind: {}".format(
+                BindView(PoliciesAndBinds.binds, bind_id)))
+        return bind_id
+
+    @staticmethod
+    def flatten_entity_binds():
+        """
+        Merges the classic policy binds of all entities per module and
+        bind_type in one pass over the bind table, keeping the order of
+        its bind points.
+
+        Returns:
+            global_binds: global binds
+            vserver_binds: binds of all vservers, entity_type by entity_type
+            local_binds: binds of all entities
+            user_binds: binds of all users
+            group_binds: binds of all groups
+            Each of them is a dictionary with:
+                key: module of policy
+                value: another dictionary with:
+                       key: bind_type
+                       value: list of bind IDs
+        """
+        def binds_per_module():
+            return collections.defaultdict(  # module
+                lambda: collections.defaultdict(list))  # bind_type
+        global_binds = binds_per_module()
+        vserver_binds = binds_per_module()
+        local_binds = binds_per_module()
+        user_binds = binds_per_module()
+        group_binds = binds_per_module()
+        entity_merges = {"vserver": vserver_binds, "user": user_binds,
+                         "group": group_binds}
+        bindpoints = PoliciesAndBinds.binds.classic_bindpoints
+        for key in bindpoints.keys():
+            entity, _, _, module, bind_type = key
+            binds = bindpoints[key]
+            if entity == "global":
+                global_binds[module][bind_type].extend(binds)
+                continue
+            local_binds[module][bind_type].extend(binds)
+            merged = entity_merges.get(entity)
+            if merged is not None:
+                merged[module][bind_type].extend(binds)
+        return (global_binds, vserver_binds, local_binds, user_binds,
+                group_binds)
 
     def do_priority_analysis(self, global_list, local_list,
                              skip_global_override=False):
@@ -528,100 +1258,107 @@ class PoliciesAndBinds(object):
         for a particular module and bind_type.
 
         Args:
-            global_list: List of global binds per module and bindtype
-            local_list: List of local binds per entitytype and module
+            global_list: List of global bind IDs per module and bindtype
+            local_list: List of local bind IDs per entitytype and module
                         and bindtype
             skip_global_override: Whether to skip global override
                                   or not in analysis.
 
         Returns:
-            res: List of unsupported binds
-            res_gtypes: List of Bind objects with suggested 'global_type'
+            res: List of unsupported bind IDs
+            res_gtypes: List of bind IDs with suggested 'global_type'
                         as "override" or "default" based on analysis
         """
+        t = PoliciesAndBinds.binds
+        priorities = t.priorities
         res = []
         res_gtypes = []
         state = 1 if skip_global_override else 0
         states = ["global", "local", "global"]
         g_types = ["override", "", "default"]
-        # store globals and locals combined in dictionary by priority
-        # key: priority
-        # value: list of bind object(s)
-        combined = collections.defaultdict(list)
-        [combined[int(o.priority)].append(o) for o in local_list + global_list]
-        # go through sorted combined list of priorities and determine if the
+        # sort globals and locals together by priority. The sort is stable,
+        # so binds at the same priority keep locals before globals.
+        combined = local_list + global_list
+        combined.sort(key=priorities.__getitem__)
+        # go through the binds in order of priority and determine if the
         # bindings fall under globals (override) followed by locals and
         # then by globals (default) based on priority
-        for prio in sorted(combined.keys()):
-            # there could be multiple binds at the same priority
-            # so go through each in order
-            for o in combined[prio]:
-                s = "global" if o.entity == "global" else "local"
-                # if type of prev priority or prev bind differs from curr then
-                # go to next type/state.
-                if s != states[state]:
-                    if (state + 1) < len(states):
-                        state += 1
-                    else:
-                        # no more valid states so all priorities including
-                        # and after current priority cannot be converted
-                        res.extend(combined[prio])
-                        break
-                o.global_type = g_types[state]
-                res_gtypes.append(o)
-        logging.debug("do_priority_analysis(): ")
-        logging.debug("\nglobals: {}\n\nlocals: {}\n\nunsupported: {}"
-                      "".format(global_list, local_list, res))
+        count = len(combined)
+        prio_start = 0
+        inx = 0
+        while inx < count:
+            o = combined[inx]
+            prio = priorities[o]
+            if prio != priorities[combined[prio_start]]:
+                prio_start = inx
+            s = "global" if t.entities[o] == "global" else "local"
+            # if type of prev priority or prev bind differs from curr then
+            # go to next type/state.
+            if s != states[state]:
+                if (state + 1) < len(states):
+                    state += 1
+                else:
+                    # no more valid states so all binds at current priority
+                    # cannot be converted, then go to the next priority
+                    inx = prio_start
+                    while inx < count and priorities[combined[inx]] == prio:
+                        res.append(combined[inx])
+                        inx += 1
+                    continue
+            t.global_types[o] = g_types[state]
+            res_gtypes.append(o)
+            inx += 1
+        if debug_trace:
+            logging.debug("do_priority_analysis(): ")
+            logging.debug("\nglobals: {}\n\nlocals: {}\n\nunsupported: {}"
+                          "".format(t.view(global_list), t.view(local_list),
+                                    t.view(res)))
         return res, res_gtypes
 
-    def analyze_vserver_priorities(self):
+    def analyze_vserver_priorities(self, global_binds=None,
+                                   vserver_binds=None):
         """
         Analyze priorities of all classic policies bound to global against
         vserver entities. The goal is to detect if any classic policy bind
         cannot be converted to global override, local, or global default
         while preserving their original priorities. For those classic policy
         binds that can't be converted their analysis results are stored in
-        priority_analysis_results.
+        the bind table.
+
+        Args:
+            global_binds: global binds per module and bind_type as returned
+                          by flatten_entity_binds()
+            vserver_binds: binds of all vservers per module and bind_type as
+                           returned by flatten_entity_binds()
         """
         # store list of unsupported binds after analysis
         unsupported = set()
         # store list of bind objects with updated 'global_type'
         updated_global_types = []
-        # store list of merged binds for a particular entity_type
-        local_binds = collections.defaultdict(  # entity_type (ex. lb or cs)
-            lambda: collections.defaultdict(  # module
-                lambda: collections.defaultdict(list)))  # bind_type
-        # iterate through all binds and merge all binds for a particular
-        # entity_type per module and bind_type in local_binds.
-        # i.e. combine entries for all VServers together,
-        # keeping all other dimensions separate.
-        ebinds = PoliciesAndBinds.entity_binds
-        entity = "vserver"
-        for entity_type in ebinds[entity]:
-            for vs in ebinds[entity][entity_type]:
-                for module in ebinds[entity][entity_type][vs]:
-                    for bind_type in ebinds[entity][entity_type][vs][module]:
-                        local_binds[entity_type][module][bind_type] += (
-                            ebinds[entity][entity_type][vs][module][bind_type])
-        logging.debug("Local binds: {}".format(local_binds))
+        # binds of all VServers are combined together per module and
+        # bind_type, keeping all other dimensions separate.
+        if global_binds is None or vserver_binds is None:
+            global_binds, vserver_binds = self.flatten_entity_binds()[:2]
+        t = PoliciesAndBinds.binds
+        if debug_trace:
+            logging.debug("Local binds: {}".format(
+                t.view_per_module(vserver_binds)))
         # if a module only contains global binds or local binds then
         # they can all be converted. However, if both global and local
         # binds exist for a module then analyze them to determine if
         # conversion is possible or not and store analysis results.
-        gbinds = PoliciesAndBinds.global_binds
+        gbinds = global_binds
         for gmodule in gbinds:
             for gbind_type in gbinds[gmodule]:
                 locals_list = []
-                if local_binds:
-                    for entity_type in local_binds:
-                        if (gmodule in local_binds[entity_type] and gbind_type
-                                in local_binds[entity_type][gmodule]):
-                            # module and bind_type match for global and local
-                            locals_list += (
-                                 local_binds[entity_type][gmodule][gbind_type])
-                logging.debug(
-                    "do_priority_analysis() for {} {}"
-                    "".format(gmodule, gbind_type))
+                if (gmodule in vserver_binds and
+                        gbind_type in vserver_binds[gmodule]):
+                    # module and bind_type match for global and local
+                    locals_list = vserver_binds[gmodule][gbind_type]
+                if debug_trace:
+                    logging.debug(
+                        "do_priority_analysis() for {} {}"
+                        "".format(gmodule, gbind_type))
                 unsupp, updated_gtypes = self.do_priority_analysis(
                                           gbinds[gmodule][gbind_type], locals_list,
                                           gmodule in PoliciesAndBinds.
@@ -629,23 +1366,23 @@ class PoliciesAndBinds(object):
                 unsupported.update(unsupp)
                 updated_global_types += updated_gtypes
         # store analysis results
-        res = PoliciesAndBinds.priority_analysis_results
-        for bindobj in unsupported:
-            res[bindobj.cmd_str]["unsupported"] = True
-        for bindobj in updated_global_types:
-            res[bindobj.cmd_str]['global_type'] = bindobj.global_type
+        t.unsupported.update(unsupported)
+        for bind_id in updated_global_types:
+            t.updated_global_types[bind_id] = t.global_types[bind_id]
 
     @staticmethod
     def get_entity_state_name(o):
         """
-        Returns the computed name for the state of the passed-in bind object
+        Returns the computed name for the state of the passed-in bind
         for use in priority analysis.
 
         Args:
-            o - Bind object
+            o - bind ID
         """
-        return o.entity if (o.entity == "global" or o.entity == "user"
-                            or o.entity == "group") else o.entity_type
+        entity = PoliciesAndBinds.binds.entities[o]
+        return entity if (entity == "global" or entity == "user"
+                          or entity == "group") else (
+                              PoliciesAndBinds.binds.entity_types[o])
 
     @staticmethod
     def entity_key(o):
@@ -655,15 +1392,14 @@ class PoliciesAndBinds(object):
         priority for interleaving priority analysis.
 
         Args:
-            o - Bind object to determine key for sort
+            o - bind ID to determine key for sort
         """
         # removing global from the beginning because at the same priority
         # there's no concept of global override and global default. Based on
         # investigation the globals always came after the locals so
         # that's why global is only at the end here.
-        order = PoliciesAndBinds.ORDER[1:]
         name = PoliciesAndBinds.get_entity_state_name(o)
-        return -1 if name not in order else order.index(name)
+        return PoliciesAndBinds.ENTITY_KEYS.get(name, -1)
 
     def do_priority_analysis_for_all_entities(
             self, global_list, local_list, skip_global_override=False):
@@ -672,14 +1408,16 @@ class PoliciesAndBinds(object):
         for a single module and bindtype.
 
         Args:
-            global_list: List of global binds per module and bindtype
-            local_list: List of all local binds per module and bindtype
+            global_list: List of global bind IDs per module and bindtype
+            local_list: List of all local bind IDs per module and bindtype
             skip_global_override: Whether to skip global override
                                   or not in analysis
 
         Returns:
-            res: List of unsupported binds
+            res: List of unsupported bind IDs
         """
+        t = PoliciesAndBinds.binds
+        priorities = t.priorities
         res = []
         state = 1 if skip_global_override else 0
         # "global" is at the beginning of the list to account for global
@@ -695,64 +1433,72 @@ class PoliciesAndBinds(object):
         # also support that using a combination of global override and
         # global default.
         states = PoliciesAndBinds.ORDER
-        # store globals and locals combined in dictionary by priority
-        # key: priority
-        # value: list of bind object(s)
-        combined = collections.defaultdict(list)
-        [combined[int(o.priority)].append(o) for o in local_list + global_list]
-        # go through sorted combined list of priorities and determine if the
-        # bindings fall under the order specified above in variable "states"
-        for prio in sorted(combined.keys()):
-            # there could be multiple binds at the same priority
-            # so go through each in sorted order based on order
-            # specified above in variable "states"
-            for o in sorted(combined[prio], key=PoliciesAndBinds.entity_key):
-                s = PoliciesAndBinds.get_entity_state_name(o)
-                # if entity of prev priority or prev bind differs from curr
-                # then go to next type/state
-                if s != states[state]:
-                    # if entity's group/"state" is not applicable then skip
-                    # for cr, gslb and authentication. Evaluation for them
-                    # only involve globals and don't support combination
-                    # with others.
-                    if s not in states:
-                        continue
-                    # if curr bind is of a prev entity group/"state" that
-                    # has already been processed then mark as unsupported.
-                    # Obtain index of current state from states but for
-                    # global pick the first ("override") and last ("default")
-                    # correctly based on whether current state is past
-                    # global "override" by passing in the start index
-                    # as 0 if current state is at global "override" or 1
-                    # if current state is past global "override" to pick
-                    # global "default" for current state of "global".
-                    state_index = states.index(s, 0 if state == 0 else 1)
-                    if state_index < state:
+        last_state = len(states) - 1
+        state_indexes = PoliciesAndBinds.ORDER_INDEXES
+        entity_keys = PoliciesAndBinds.ENTITY_KEYS
+        # sort globals and locals together by priority and, at the same
+        # priority, in the order specified above in variable "states".
+        # The sort is stable, so binds with the same key keep locals before
+        # globals. The key is a single int as entity_key() is from -1 to
+        # len(states) - 2.
+        combined = local_list + global_list
+        combined.sort(key=lambda o: priorities[o] * len(states) +
+                      entity_keys.get(
+                          PoliciesAndBinds.get_entity_state_name(o), -1) + 1)
+        # go through the binds and determine if they fall under the order
+        # specified above in variable "states"
+        for o in combined:
+            s = PoliciesAndBinds.get_entity_state_name(o)
+            # if entity of prev priority or prev bind differs from curr
+            # then go to next type/state
+            if s != states[state]:
+                # if entity's group/"state" is not applicable then skip
+                # for cr, gslb and authentication. Evaluation for them
+                # only involve globals and don't support combination
+                # with others.
+                if s not in state_indexes:
+                    continue
+                # if curr bind is of a prev entity group/"state" that
+                # has already been processed then mark as unsupported.
+                # For global pick the first ("override") or last
+                # ("default") state based on whether current state is
+                # past global "override".
+                if s == "global" and state != 0:
+                    state_index = last_state
+                else:
+                    state_index = state_indexes[s]
+                if state_index < state:
+                    if debug_trace:
                         logging.debug("state {} for {} is already processed"
                                       " as current state is at {} so marking"
                                       " as unsupported"
-                                      "".format(s, o.cmd_str, states[state]))
-                        res.append(o)
-                        continue
-                    # go to next state if possible and check if curr bind
-                    # falls under that
-                    while s != states[state]:
-                        if (state + 1) < len(states):
-                            state += 1
-                        else:
-                            # no more valid states so all binds at current
-                            # priority and after cannot be converted
+                                      "".format(s, t.cmd_str(o),
+                                                states[state]))
+                    res.append(o)
+                    continue
+                # go to next state if possible and check if curr bind
+                # falls under that
+                while s != states[state]:
+                    if state < last_state:
+                        state += 1
+                    else:
+                        # no more valid states so all binds at current
+                        # priority and after cannot be converted
+                        if debug_trace:
                             logging.debug("no more valid states so marking"
                                           " as unsupported for {}"
-                                          "".format(o.cmd_str))
-                            res.append(o)
-                            break
-        logging.debug("do_priority_analysis_for_all_entities(): ")
-        logging.debug("\nglobals: {}\n\nlocals: {}\n\nunsupported: {}"
-                      "".format(global_list, local_list, res))
+                                          "".format(t.cmd_str(o)))
+                        res.append(o)
+                        break
+        if debug_trace:
+            logging.debug("do_priority_analysis_for_all_entities(): ")
+            logging.debug("\nglobals: {}\n\nlocals: {}\n\nunsupported: {}"
+                          "".format(t.view(global_list), t.view(local_list),
+                                    t.view(res)))
         return res
 
-    def analyze_multiple_entities_for_interleaving_priorities(self):
+    def analyze_multiple_entities_for_interleaving_priorities(
+            self, global_binds=None, local_binds=None):
         """
         Analyze priorities of all classic policies bound to global against
         all entities for interleaving priorities. The goal is to detect if
@@ -760,52 +1506,48 @@ class PoliciesAndBinds(object):
         user, group, vpn, lb, cs, service, global default in that order
         while preserving their original priorities. For those classic policy
         binds that can't be converted their analysis results are stored in
-        priority_analysis_results.
+        the bind table.
+
+        Args:
+            global_binds: global binds per module and bind_type as returned
+                          by flatten_entity_binds()
+            local_binds: binds of all entities per module and bind_type as
+                         returned by flatten_entity_binds()
         """
         # store list of unsupported binds after analysis
         unsupported = set()
-        # store list of merged binds for all entity_types
-        local_binds = collections.defaultdict(  # module of policy
-            lambda: collections.defaultdict(list))  # bind_type
-        # iterate through all binds and merge all binds for each module and
-        # bind_type in local_binds.
-        # i.e. combine entries for all VServers and types of entities
-        # together, keeping all other dimensions separate.
-        ebinds = PoliciesAndBinds.entity_binds
-        for entity in ebinds:
-            for entity_type in ebinds[entity]:
-                for vs in ebinds[entity][entity_type]:
-                    for module in ebinds[entity][entity_type][vs]:
-                        for bind_type in (ebinds
-                                          [entity][entity_type][vs][module]):
-                            local_binds[module][bind_type] += (
-                                ebinds
-                                [entity][entity_type][vs][module][bind_type])
-        logging.debug("analyze_multiple_entities_for_interleaving_priorities:")
-        logging.debug("Local binds: {}".format(local_binds))
+        # binds of all VServers and types of entities are combined together
+        # per module and bind_type, keeping all other dimensions separate.
+        if global_binds is None or local_binds is None:
+            flat_binds = self.flatten_entity_binds()
+            global_binds, local_binds = flat_binds[0], flat_binds[2]
+        t = PoliciesAndBinds.binds
+        if debug_trace:
+            logging.debug("analyze_multiple_entities_for_interleaving_priorities:")
+            logging.debug("Local binds: {}".format(
+                t.view_per_module(local_binds)))
         # if a module contains only global binds then they can all be
         # converted. However, if only local binds or both global and local
         # binds exist for a module then analyze them to determine if
         # conversion is possible or not and store analysis results.
-        gbinds = PoliciesAndBinds.global_binds
+        gbinds = global_binds
         for module in local_binds:
             for bind_type in local_binds[module]:
                 globals_list = []
                 if module in gbinds and bind_type in gbinds[module]:
                     # module and bind_type match for both global and local
-                    globals_list += gbinds[module][bind_type]
-                logging.debug(
-                    "self.do_priority_analysis_for_all_entities() for {} {}"
-                    "".format(module, bind_type))
+                    globals_list = gbinds[module][bind_type]
+                if debug_trace:
+                    logging.debug(
+                        "self.do_priority_analysis_for_all_entities() for {} {}"
+                        "".format(module, bind_type))
                 unsupported.update(
                     self.do_priority_analysis_for_all_entities(
                         globals_list, local_binds[module][bind_type],
                         module in PoliciesAndBinds.
                         get_skip_global_override()))
         # store analysis results
-        res = PoliciesAndBinds.priority_analysis_results
-        for bindobj in unsupported:
-            res[bindobj.cmd_str]["unsupported"] = True
+        t.unsupported.update(unsupported)
 
     def do_priority_analysis_for_all_users_groups(self, user_list, group_list):
         """
@@ -824,161 +1566,160 @@ class PoliciesAndBinds(object):
         4. Check if any groups have the same weight and give an error
 
         Args:
-            user_list: List of user binds per module and bindtype
-            group_list: List of group binds per module and bindtype
+            user_list: List of user bind IDs per module and bindtype
+            group_list: List of group bind IDs per module and bindtype
 
         Returns:
-            res: List of unsupported binds
+            res: Set of unsupported bind IDs
         """
+        t = PoliciesAndBinds.binds
+        priorities = t.priorities
+        entities = t.entities
+        entity_names = t.entity_names
         res = set()
         state = 0
         states = ["user", "group"]
-        # store users and groups combined in dictionary by priority
-        # key: priority
-        # value: list of bind object(s)
-        combined = collections.defaultdict(list)
-        [combined[int(o.priority)].append(o) for o in user_list + group_list]
+        state_indexes = {"user": 0, "group": 1}
+        # sort users and groups together by priority and, at the same
+        # priority, in the order specified above in variable "states"
+        combined = user_list + group_list
+        combined.sort(key=lambda o: priorities[o] * len(states) +
+                      state_indexes[entities[o]])
         # check for case #1 described in method comments above
-        # go through sorted combined list of priorities and determine if the
-        # bindings fall under the order specified above in variable "states"
-        for prio in sorted(combined.keys()):
-            # there could be multiple binds at the same priority
-            # so go through each in sorted order based on order
-            # specified above in variable "states"
-            for o in sorted(combined[prio],
-                            key=lambda b: states.index(b.entity)):
-                s = o.entity
-                # if entity of prev priority or prev bind differs from curr
-                # then go to next type/state
-                if s != states[state]:
-                    # if curr bind is of a prev "state" that has already been
-                    # processed then mark as unsupported. This is to handle
-                    # case #1 described in method comments above.
-                    if states.index(s) < state:
+        # go through the binds and determine if they fall under the order
+        # specified above in variable "states"
+        for o in combined:
+            s = entities[o]
+            # if entity of prev priority or prev bind differs from curr
+            # then go to next type/state
+            if s != states[state]:
+                # if curr bind is of a prev "state" that has already been
+                # processed then mark as unsupported. This is to handle
+                # case #1 described in method comments above.
+                if state_indexes[s] < state:
+                    if debug_trace:
                         logging.debug("state {} for {} is already processed"
                                       " as current state is at {} so marking"
                                       " as unsupported"
-                                      "".format(s, o.cmd_str, states[state]))
-                        res.add(o)
-                        continue
-                    # go to next state if possible and check if curr bind
-                    # falls under that
-                    while s != states[state]:
-                        if (state + 1) < len(states):
-                            state += 1
-                        else:
-                            # no more valid states so all binds at current
-                            # priority and after cannot be converted
+                                      "".format(s, t.cmd_str(o),
+                                                states[state]))
+                    res.add(o)
+                    continue
+                # go to next state if possible and check if curr bind
+                # falls under that
+                while s != states[state]:
+                    if (state + 1) < len(states):
+                        state += 1
+                    else:
+                        # no more valid states so all binds at current
+                        # priority and after cannot be converted
+                        if debug_trace:
                             logging.debug("no more valid states so marking"
                                           " as unsupported for {}"
-                                          "".format(o.cmd_str))
-                            res.add(o)
-                            break
+                                          "".format(t.cmd_str(o)))
+                        res.add(o)
+                        break
+        # weight of each group of the binds
+        # key: group name
+        # value: weight
+        weights = {}
+        for o in group_list:
+            if entity_names[o] not in weights:
+                weights[entity_names[o]] = int(
+                    self.get_group(entity_names[o]).weight)
+        # sort group binds by priority and, at the same priority, in
+        # ns.conf order
+        groups = sorted(group_list, key=lambda o: int(t.linenos[o]))
+        groups.sort(key=priorities.__getitem__)
         # check for case #2 described in method comments above
-        # store groups in dictionary by priority
-        # key: priority
-        # value: list of group bind object(s)
-        groups = collections.defaultdict(list)
-        [groups[int(o.priority)].append(o) for o in group_list]
-        # store list of groups that have already been processed
-        # at earlier priorities
-        earlier = [""]
-        # go through sorted group list of priorities and determine if
-        # any earlier group bind comes after a different group bind
-        # indicating interleaving between groups
-        for prio in sorted(groups.keys()):
-            # there could be multiple binds at the same priority
-            # so go through each in sorted order based on ns.conf order
-            # and check for interleaving.
-            for o in sorted(groups[prio], key=lambda o: int(o.lineno)):
-                if o.entity_name in earlier and o.entity_name != earlier[-1]:
+        # store groups that have already been processed at earlier
+        # priorities, and the last one of them
+        earlier = set([""])
+        last = ""
+        # go through the group binds and determine if any earlier group bind
+        # comes after a different group bind indicating interleaving between
+        # groups
+        for o in groups:
+            name = entity_names[o]
+            if name in earlier and name != last:
+                if debug_trace:
                     logging.debug("group {} for {} is already processed"
                                   " earlier so marking as unsupported"
-                                  "".format(o.entity_name, o.cmd_str))
-                    res.add(o)
-                    continue
-                elif o.entity_name != earlier[-1]:
-                    earlier.append(o.entity_name)
+                                  "".format(name, t.cmd_str(o)))
+                res.add(o)
+                continue
+            elif name != last:
+                earlier.add(name)
+                last = name
         # store max weight seen for groups processed
         max_weight = 0
         # check for case #3 described in method comments above
-        # go through sorted group list of priorities and determine
-        # if the weights of the group are in contradictory order
-        # to the priorities
-        for prio in sorted(groups.keys()):
-            # there could be multiple binds at the same priority
-            # so go through each and check for interleaving.
-            for o in sorted(groups[prio], key=lambda o: int(o.lineno)):
-                # lower numbered weights indicate higher preference of the
-                # group compared to higher numbered weights
-                w = int(self.get_group(o.entity_name).weight)
-                # at increasing priorities if there's a group encountered
-                # whose weight is less than the largest group weight seen
-                # of groups at earlier priorities then mark it as
-                # unsupported
-                if w < max_weight:
+        # go through the group binds and determine if the weights of the
+        # group are in contradictory order to the priorities
+        for o in groups:
+            # lower numbered weights indicate higher preference of the
+            # group compared to higher numbered weights
+            w = weights[entity_names[o]]
+            # at increasing priorities if there's a group encountered
+            # whose weight is less than the largest group weight seen
+            # of groups at earlier priorities then mark it as
+            # unsupported
+            if w < max_weight:
+                if debug_trace:
                     logging.debug("group {} for {} has weight {} less than"
                                   " max weight {} for an earlier group so"
                                   " marking as unsupported"
                                   "".format(
-                                      o.entity_name, o.cmd_str, w, max_weight))
-                    res.add(o)
-                    continue
-                elif w > max_weight:
-                    max_weight = w
+                                      entity_names[o], t.cmd_str(o), w,
+                                      max_weight))
+                res.add(o)
+                continue
+            elif w > max_weight:
+                max_weight = w
         # check for case #4 described in method comments above
         # go through sorted group list in order weights and give
         # an error if more than one group has the same weight
-        weights = collections.defaultdict(set)
-        [weights[int(self.get_group(o.entity_name).weight)].add(o)
-            for o in group_list]
-        for v in weights.values():
-            same_weight_group_set = set([o.entity_name for o in v])
+        same_weight = collections.defaultdict(set)
+        [same_weight[weights[entity_names[o]]].add(o) for o in group_list]
+        for v in same_weight.values():
+            same_weight_group_set = set([entity_names[o] for o in v])
             if len(same_weight_group_set) > 1:
                 logging.error("Groups: {} having the same weight and bindings"
                               " have no defined ordering in Advanced Policy"
                               " evaluation.".format(
                                   ", ".join(sorted(same_weight_group_set))))
                 res.update(v)
-        logging.debug("do_priority_analysis_for_all_users_groups(): ")
-        logging.debug("\nusers: {}\n\ngroups: {}\n\nunsupported: {}"
-                      "".format(user_list, group_list, res))
+        if debug_trace:
+            logging.debug("do_priority_analysis_for_all_users_groups(): ")
+            logging.debug("\nusers: {}\n\ngroups: {}\n\nunsupported: {}"
+                          "".format(t.view(user_list), t.view(group_list),
+                                    t.view(res)))
         return res
 
-    def analyze_user_group_priorities(self):
+    def analyze_user_group_priorities(self, user_binds=None,
+                                      group_binds=None):
         """
         Analyze user and group priorities.
+
+        Args:
+            user_binds: binds of all users per module and bind_type as
+                        returned by flatten_entity_binds()
+            group_binds: binds of all groups per module and bind_type as
+                         returned by flatten_entity_binds()
         """
         # store list of unsupported binds after analysis
         unsupported = set()
-        # store list of merged binds for all users
-        user_binds = collections.defaultdict(  # module of policy
-            lambda: collections.defaultdict(list))  # bind_type
-        # store list of merged binds for all groups
-        group_binds = collections.defaultdict(  # module of policy
-            lambda: collections.defaultdict(list))  # bind_type
-        # iterate through all binds and merge all binds for each module and
-        # bind_type in user_binds and group_binds.
-        # i.e. combine entries for all users and groups
-        # respectively, keeping all other dimensions separate.
-        ebinds = PoliciesAndBinds.entity_binds
-        for entity in ["user", "group"]:
-            for entity_type in ebinds[entity]:
-                for name in ebinds[entity][entity_type]:
-                    for module in ebinds[entity][entity_type][name]:
-                        for bind_type in (ebinds
-                                          [entity][entity_type][name][module]):
-                            if entity == "user":
-                                user_binds[module][bind_type] += (
-                                    ebinds[entity][entity_type][name][module]
-                                    [bind_type])
-                            elif entity == "group":
-                                group_binds[module][bind_type] += (
-                                    ebinds[entity][entity_type][name][module]
-                                    [bind_type])
-        logging.debug("analyze_user_group_priorities():")
-        logging.debug("user binds: {}".format(user_binds))
-        logging.debug("group binds: {}".format(group_binds))
+        # binds of all users and groups are combined respectively per
+        # module and bind_type, keeping all other dimensions separate.
+        if user_binds is None or group_binds is None:
+            user_binds, group_binds = self.flatten_entity_binds()[3:]
+        t = PoliciesAndBinds.binds
+        if debug_trace:
+            logging.debug("analyze_user_group_priorities():")
+            logging.debug("user binds: {}".format(
+                t.view_per_module(user_binds)))
+            logging.debug("group binds: {}".format(
+                t.view_per_module(group_binds)))
         # if a module contains only user binds then they can all be
         # converted. However, if only group binds or both user and group
         # binds exist for a module then analyze them to determine if
@@ -988,63 +1729,187 @@ class PoliciesAndBinds(object):
                 user_list = []
                 if module in user_binds and bind_type in user_binds[module]:
                     # module and bind_type match for both group and user
-                    user_list += user_binds[module][bind_type]
-                logging.debug(
-                    "do_priority_analysis_for_all_users_groups() for {} {}"
-                    "".format(module, bind_type))
+                    user_list = user_binds[module][bind_type]
+                if debug_trace:
+                    logging.debug(
+                        "do_priority_analysis_for_all_users_groups() for {} {}"
+                        "".format(module, bind_type))
                 unsupported.update(
                     self.do_priority_analysis_for_all_users_groups(
                         user_list, group_binds[module][bind_type]))
         # store analysis results
-        res = PoliciesAndBinds.priority_analysis_results
-        for bindobj in unsupported:
-            res[bindobj.cmd_str]["unsupported"] = True
+        t.unsupported.update(unsupported)
 
     def analyze(self):
         """
         Run analysis methods on PoliciesAndBinds.
         """
-        self.analyze_vserver_priorities()
-        self.analyze_user_group_priorities()
-        self.analyze_multiple_entities_for_interleaving_priorities()
-
-    def is_bind_unsupported(self, orig_bind_str):
+        global_binds, vserver_binds, local_binds, user_binds, group_binds = \
+            self.flatten_entity_binds()
+        self.analyze_vserver_priorities(global_binds, vserver_binds)
+        self.analyze_user_group_priorities(user_binds, group_binds)
+        self.analyze_multiple_entities_for_interleaving_priorities(
+            global_binds, local_binds)
+
+    def is_bind_unsupported(self, bind_id):
         """
-        Determine if bind is unsupported for passed in bind command string.
+        Determine if bind is unsupported for passed in bind.
 
         Args:
-            orig_bind_str: Bind command string of original bind command read
-                           from config
+            bind_id: ID of the bind in the bind table
 
         Returns:
             result: Priority analysis result for passed in bind command or
                     None if no result is present for it
         """
-        result = None
-        res = PoliciesAndBinds.priority_analysis_results
-        if orig_bind_str in res and "unsupported" in res[orig_bind_str]:
-            result = res[orig_bind_str]["unsupported"]
-        return result
+        t = PoliciesAndBinds.binds
+        if bind_id in t.unsupported:
+            return True
+        return None
 
-    def get_global_type_for_bind(self, orig_bind_str):
+    def get_global_type_for_bind(self, bind_id):
         """
-        Return the global type based on analysis for passed in bind command
-        string.
+        Return the global type based on analysis for passed in bind.
 
         Args:
-            orig_bind_str: Bind command string of original bind command read
-                           from config
+            bind_id: ID of the bind in the bind table
 
         Returns:
             result: Global type based on analysis result for passed in bind
                     command or None if no result is present for it
         """
-        result = None
-        res = PoliciesAndBinds.priority_analysis_results
-        if orig_bind_str in res and "global_type" in res[orig_bind_str]:
-            result = res[orig_bind_str]["global_type"]
-        return result
+        t = PoliciesAndBinds.binds
+        return t.updated_global_types.get(bind_id)
 
 
 # store all policies and any associated binds for analysis
 pols_binds = PoliciesAndBinds()
+
+
+# Per-run state registered by register_run_state.
+# Each item is (owner, name, factory).
+_run_state = []
+
+
+def register_run_state(owner, name, factory):
+    """
+    Registers a module global or class attribute holding state of a
+    conversion run, so that each ConversionContext has its own value.
+
+    Args:
+        owner: Module or class having the attribute
+        name: Name of the attribute
+        factory: Function returning the initial value for a new context
+    """
+    _run_state.append((owner, name, factory))
+
+
+class ConversionContext(object):
+    """
+    State of one conversion run: the handler objects and dispatch tables,
+    the policies and binds, the caches and options of the run, and all
+    other state registered by register_run_state.
+    The converter modules read the state from their module globals and
+    class attributes, so entering the context puts its state there and
+    exiting it takes the state back, restoring what was there before.
+    A new context has no handler objects; a run creates the ones it needs
+    with load_handlers. State registered by modules imported after the
+    context was created is added to the context when it is entered or
+    exited.
+    Since the state lives in module globals, only one context can be
+    entered at a time: conversions in contexts are serialized, other
+    threads wait until the context is exited. Every module global and
+    class attribute that a conversion changes must be registered.
+    State whose values only depend on their keys is shared by all
+    contexts: the old nspepi tool process, nspepi_tool_cache,
+    cli_lex.adv_token_cache, the quoted values of nspepi_codec, the PLY
+    parser of cli_yacc and nspepi_parse_tree.tree_generation, which only
+    ever grows.
+    """
+    _lock = threading.RLock()
+
+    def __init__(self):
+        # key: (owner, name)
+        # value: value of the attribute while the context is not entered
+        self.state = collections.OrderedDict(
+            ((owner, name), factory())
+            for owner, name, factory in _run_state)
+        self._saved = None
+
+    def get(self, owner, name):
+        """
+        Returns the value of registered state in this context.
+
+        Args:
+            owner: Module or class having the attribute
+            name: Name of the attribute
+        """
+        if self._saved is not None:
+            return getattr(owner, name)
+        return self.state[(owner, name)]
+
+    def __enter__(self):
+        ConversionContext._lock.acquire()
+        try:
+            for owner, name, factory in _run_state[len(self.state):]:
+                self.state[(owner, name)] = factory()
+            self._saved = [(key, getattr(key[0], key[1], _missing))
+                           for key in self.state]
+            for (owner, name), value in self.state.items():
+                setattr(owner, name, value)
+        except Exception:
+            if self._saved is not None:
+                self._restore()
+            ConversionContext._lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            new_state = _run_state[len(self.state):]
+            for key in self.state:
+                self.state[key] = getattr(key[0], key[1])
+            # State of modules imported in the context: keep it, and leave
+            # the initial value for outside the context.
+            for owner, name, factory in new_state:
+                self.state[(owner, name)] = getattr(owner, name)
+                setattr(owner, name, factory())
+            self._restore()
+        finally:
+            ConversionContext._lock.release()
+        return False
+
+    def _restore(self):
+        """ Puts back the state that was there before entering. """
+        for (owner, name), value in self._saved:
+            if value is _missing:
+                if hasattr(owner, name):
+                    delattr(owner, name)
+            else:
+                setattr(owner, name, value)
+        self._saved = None
+
+
+# Marks state that was not set before entering a context.
+_missing = object()
+
+_module = sys.modules[__name__]
+register_run_state(_module, "dispatchtable",
+                   lambda: collections.defaultdict(list))
+register_run_state(_module, "final_methods", list)
+register_run_state(_module, "init_methods", list)
+register_run_state(_module, "bind_table", collections.OrderedDict)
+register_run_state(_module, "handlers", collections.OrderedDict)
+register_run_state(_module, "nspepi_tool_disk_cache", lambda: None)
+register_run_state(_module, "nspepi_tool_jobs", lambda: 1)
+register_run_state(_module, "compare_nspepi_tool", lambda: False)
+register_run_state(_module, "nspepi_tool_cache_hits", lambda: 0)
+register_run_state(_module, "nspepi_tool_cache_misses", lambda: 0)
+register_run_state(_module, "nspepi_tool_disk_cache_hits", lambda: 0)
+register_run_state(_module, "debug_trace", lambda: False)
+register_run_state(PoliciesAndBinds, "skip_global_override", list)
+register_run_state(PoliciesAndBinds, "groups",
+                   lambda: collections.defaultdict(lambda: Group()))
+register_run_state(PoliciesAndBinds, "policies",
+                   lambda: collections.defaultdict(lambda: Policy()))
+register_run_state(PoliciesAndBinds, "binds", BindTable)
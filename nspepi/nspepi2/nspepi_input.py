@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Input stage for the config to convert: reads a config file or the
+standard input, decompressing gzip, bzip2 and xz input on the fly, or
+maps an uncompressed config file in memory so that the lines that are
+not converted can be copied to the output as bytes.
+"""
+
+import bz2
+import codecs
+import gzip
+import heapq
+import io
+import locale
+import mmap
+import os
+import stat
+import sys
+
+try:
+    import lzma
+except ImportError:
+    # Python 2: xz input is not supported.
+    lzma = None
+
+# Name used for the standard input.
+stdin_name = "-"
+
+# Leading bytes and file name suffixes of the compressed formats.
+_gzip_magic = b"\x1f\x8b"
+_bzip2_magic = b"BZh"
+_xz_magic = b"\xfd7zXZ\x00"
+compressed_suffixes = (".gz", ".bz2", ".xz")
+
+# Encodings in which a line of the config is the bytes up to b"\n", so
+# that lines can be found in the mapped file without decoding it.
+_mappable_encodings = ("ascii", "utf-8", "iso8859-1", "cp1252")
+
+
+def config_name(path):
+    """
+    Returns the config file name to use for naming the files written
+    for the config at path.
+    path - path of the config file, or stdin_name for standard input.
+    """
+    if path == stdin_name:
+        return "stdin"
+    name = os.path.basename(path)
+    for suffix in compressed_suffixes:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def input_exists(path):
+    """ Returns True if path names an existing config or standard input. """
+    return path == stdin_name or os.path.exists(path)
+
+
+def open_config(path, mappable=False):
+    """
+    Opens a config for reading its lines. The compression format is
+    found from the leading bytes, and the input is decompressed while
+    it is read, so that neither a seekable file nor a decompressed copy
+    on disk is needed.
+    path - path of the config file, or stdin_name for standard input.
+    mappable - True to return a MappedConfig if the config can be mapped.
+    Returns a file object or MappedConfig to be closed by the caller.
+    """
+    if mappable and path != stdin_name:
+        mapped = MappedConfig.open(path)
+        if mapped is not None:
+            return mapped
+    if path == stdin_name:
+        raw = io.open(sys.stdin.fileno(), "rb", closefd=False)
+        source = raw
+    else:
+        raw = io.open(path, "rb")
+        source = path
+    magic = raw.peek(len(_xz_magic))[:len(_xz_magic)]
+    if magic.startswith(_gzip_magic):
+        opener = _open_gzip
+    elif magic.startswith(_bzip2_magic):
+        opener = bz2.BZ2File
+    elif magic.startswith(_xz_magic) and lzma is not None:
+        opener = lzma.LZMAFile
+    else:
+        opener = None
+    if opener is None:
+        stream = raw
+    else:
+        # The decompressors open a file by name themselves, and leave
+        # a file object passed to them open.
+        if source is not raw:
+            raw.close()
+        stream = opener(source)
+    if sys.version_info[0] < 3:
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+def _open_gzip(source):
+    """ Opens gzip input from a file name or a file object. """
+    if isinstance(source, str):
+        return gzip.GzipFile(source, "rb")
+    return gzip.GzipFile(fileobj=source, mode="rb")
+
+
+class MappedConfig(object):
+    """
+    Uncompressed config file mapped in memory. Iterating over it gives its
+    lines as a text file does. lines() gives the lines with their line
+    numbers and byte offsets, and can skip the lines that are of no
+    interest, which are then written to the output from the map with
+    write_range(), without decoding and encoding them.
+    path - path of the config file
+    mapping - mmap of the config file
+    encoding - encoding of the config file, as a text file has
+    """
+    # Lines can be written as byte ranges with write_range().
+    byte_ranges = True
+    # Bytes written at a time by write_range().
+    chunk_size = 1 << 20
+
+    def __init__(self, path, mapping, encoding):
+        self.path = path
+        self.encoding = encoding
+        self.size = len(mapping)
+        self._map = mapping
+
+    @classmethod
+    def open(cls, path):
+        """
+        Maps a config file.
+        path - path of the config file
+        Returns the MappedConfig, or None if the file is compressed, is
+        not a regular file, is empty, has carriage returns, which a text
+        file reads as line ends, or its encoding is not one in which
+        lines end with b"\n", or text files get other line ends.
+        """
+        if sys.version_info[0] < 3 or os.linesep != "\n":
+            return None
+        encoding = locale.getpreferredencoding(False)
+        if codecs.lookup(encoding).name not in _mappable_encodings:
+            return None
+        with io.open(path, "rb") as raw:
+            info = os.fstat(raw.fileno())
+            if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+                return None
+            magic = raw.read(len(_xz_magic))
+            if (magic.startswith(_gzip_magic) or
+                    magic.startswith(_bzip2_magic) or
+                    magic.startswith(_xz_magic)):
+                return None
+            try:
+                mapping = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                return None
+        if mapping.find(b"\r") != -1:
+            mapping.close()
+            return None
+        return cls(path, mapping, encoding)
+
+    def __iter__(self):
+        for _, line, _, _ in self.lines():
+            yield line
+
+    def lines(self, patterns=None):
+        """
+        Generates (line number, line, start offset, end offset) of the
+        lines of the config.
+        patterns - None for all lines, or compiled regular expressions
+                   over bytes for only the first line and the lines in
+                   which one of them matches; a match ending just after
+                   a newline is in the line that follows it
+        """
+        mapping = self._map
+        encoding = self.encoding
+        if patterns is None:
+            mapping.seek(0)
+            end = 0
+            for lineno, line in enumerate(iter(mapping.readline, b""), 1):
+                start = end
+                end += len(line)
+                yield lineno, line.decode(encoding), start, end
+            return
+        lineno = 1
+        counted = 0
+        end = 0
+        starts = heapq.merge([0], *[self._line_starts(pattern)
+                                    for pattern in patterns])
+        for start in starts:
+            if start < end:
+                # already generated for another pattern
+                continue
+            lineno += mapping[counted:start].count(b"\n")
+            counted = start
+            end = mapping.find(b"\n", start) + 1 or self.size
+            yield lineno, mapping[start:end].decode(encoding), start, end
+
+    def _line_starts(self, pattern):
+        """
+        Generates the start offsets of the lines in which a regular
+        expression matches, see lines().
+        """
+        mapping = self._map
+        pos = 0
+        while True:
+            match = pattern.search(mapping, pos)
+            if match is None:
+                return
+            yield mapping.rfind(b"\n", 0, match.end()) + 1
+            # Continue from the newline at the end of the line.
+            pos = mapping.find(b"\n", match.end())
+            if pos == -1:
+                return
+
+    def write_range(self, outfile, byte_range):
+        """
+        Writes the bytes of a range of lines to the output.
+        outfile - OutputFile opened with the encoding of the config
+        byte_range - slice of the byte offsets of the lines
+        """
+        mapping = self._map
+        for start in range(byte_range.start, byte_range.stop,
+                           self.chunk_size):
+            outfile.write_raw(mapping[start:min(start + self.chunk_size,
+                                                byte_range.stop)])
+
+    def close(self):
+        """ Unmaps the config file. """
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -8,28 +8,28 @@
 Convert classic expressions to advanced expressions and deprecated
 commands to non-deprecated ones.
 
-Dependency packages: PLY, pytest
+Dependency packages: pytest, PLY (optional, for --usePly)
 """
 
+from __future__ import print_function
+
 # Ensure that the version string conforms to PEP 440:
 # https://www.python.org/dev/peps/pep-0440/
 __version__ = "1.2"
 
 import argparse
-import glob
-import importlib
 import logging
-import logging.handlers
 import os
 import os.path
 import sys
-from inspect import cleandoc
-import inspect
 import re
+import textwrap
 
+import cli_lex
 import cli_yacc
 from convert_classic_expr import convert_classic_expr, \
-    convert_adv_expr
+    convert_adv_expr, collect_classic_exprs
+import handler_manifest
 import nspepi_common as common
 
 import convert_cli_commands
@@ -42,6 +42,30 @@ console_log_handler = None
 debug_log_handler = None
 error_log_handler = None
 
+def roll_over_log_file(file_name, backup_count):
+    """
+    Renames a log file to file_name.1, file_name.1 to file_name.2 and so
+    on, keeping backup_count old logs, as RotatingFileHandler does.
+    Done here so that logging.handlers, which is slow to import, is not
+    needed.
+
+    Args:
+        file_name - log file name
+        backup_count - number of old log files to keep
+    """
+    for inx in range(backup_count - 1, 0, -1):
+        src = "{}.{}".format(file_name, inx)
+        dst = "{}.{}".format(file_name, inx + 1)
+        if os.path.exists(src):
+            if os.path.exists(dst):
+                os.remove(dst)
+            os.rename(src, dst)
+    dst = file_name + ".1"
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(file_name, dst)
+
+
 def create_file_log_handler(file_name, log_level):
     """
     Creates file logging handler.
@@ -50,13 +74,10 @@ def create_file_log_handler(file_name, log_level):
         file_name - log file name
         log_level - The level of logs to put in the file
     """
-    # create file handler and roll logs if needed
-    exists = os.path.isfile(file_name)
-    file_handler = logging.handlers.RotatingFileHandler(file_name,
-                                                        mode='a',
-                                                        backupCount=9)
-    if exists:
-        file_handler.doRollover()
+    # roll logs if needed and create file handler
+    if os.path.isfile(file_name):
+        roll_over_log_file(file_name, 9)
+    file_handler = logging.FileHandler(file_name, mode='a')
     # set the file log handler level
     file_handler.setLevel(log_level)
     # create formatters and add them to the handlers
@@ -104,6 +125,8 @@ def setup_logging(log_file_name, file_log_level, error_file_name, debug_file_nam
         ch_format = logging.Formatter('%(levelname)s - %(message)s')
         console_log_handler.setFormatter(ch_format)
         logger.addHandler(console_log_handler)
+    common.enable_debug_trace(bool(debug_file_name) or
+                              file_log_level <= logging.DEBUG)
 
 
 def classic_policy_expr(expr):
@@ -135,8 +158,108 @@ def output_line(line, outfile, verbose):
         verbose: True iff converted commands should also be output to console
     """
     outfile.write(line)
+    if verbose and outfile.echo is not None:
+        outfile.echo.write(line)
+
+
+def output_tree(tree, outfile, verbose):
+    """
+    Output a (potentially) converted command, streaming it to the file
+    unless it also needs to be logged.
+
+    Args:
+        tree: parse tree of the command to output
+        outfile: Output file to write converted commands
+        verbose: True iff converted commands should also be output to console
+    """
     if verbose:
-        logging.info(line.rstrip())
+        output_line(str(tree), outfile, verbose)
+    else:
+        tree.write_to(outfile)
+
+
+def append_byte_range(parsed_cmds, start, end):
+    """
+    Adds a range of lines of a mapped config, to be output as they are, to
+    the parsed commands, joining it to a range just before it.
+
+    Args:
+        parsed_cmds: list of (line or slice of byte offsets of lines,
+                     command type, parse tree, log records)
+        start: byte offset of the first line
+        end: byte offset after the last line
+    """
+    if (parsed_cmds and type(parsed_cmds[-1][0]) is slice and
+            parsed_cmds[-1][0].stop == start):
+        start = parsed_cmds.pop()[0].start
+    parsed_cmds.append((slice(start, end), None, None, ()))
+
+
+def import_converter_modules():
+    """
+    Imports all converter modules and creates their handlers for the
+    commands in the current conversion context.
+    """
+    common.load_handlers(handler_manifest.HANDLER_MODULES)
+
+
+def add_handler_modules(parsed_tree, key, module_names):
+    """
+    Adds the converter modules needed to convert a command, going by the
+    handler manifest, to a set of module names.
+
+    Args:
+        parsed_tree: parse tree of the command
+        key: command type of the command ("op group ot" in lowercase)
+        module_names: set of module names
+
+    Returns:
+        True iff the command has a handler
+    """
+    module = handler_manifest.COMMAND_HANDLERS.get(key)
+    if module is None:
+        return False
+    module_names.add(module)
+    # Binds of built-in policies are converted by the module of the
+    # policies, which stores them at the start of processing.
+    if parsed_tree.keyword_exists("policyName"):
+        module = handler_manifest.BUILTIN_POLICY_HANDLERS.get(
+            parsed_tree.keyword_value("policyName")[0].value)
+        if module is not None:
+            module_names.add(module)
+    return True
+
+
+def is_command(expr):
+    """
+    Returns True if expr is an add, set or bind command rather than an
+    expression.
+    """
+    return re.search(r'^\s*((add)|(set)|(bind))\s+[a-zA-Z]', expr,
+                     re.IGNORECASE) is not None
+
+
+def convert_expression(expr):
+    """
+    Converts a classic policy expression, or the classic parts of an
+    advanced policy expression, to an advanced policy expression.
+
+    Args:
+        expr: the expression to convert
+
+    Returns:
+        The converted expression, enclosed in quotes, or None if it
+        cannot be converted
+    """
+    output = convert_classic_expr(expr)
+    # return value of convert_classic_expr will be enclosed with quotes.
+    if output is not None and convert_cli_commands. \
+            remove_quotes(output) == expr:
+        # If expression is not converted, then it can be advanced
+        # expression. Advanced expressions can have Q and S prefixes and
+        # SYS.EVAL_CLASSIC_EXPR expression which needs to be converted.
+        output = convert_adv_expr(expr)
+    return output
 
 
 def convert_config_file(infile, outfile, verbose):
@@ -151,18 +274,13 @@ def convert_config_file(infile, outfile, verbose):
         verbose: True iff converted commands should also be output to console
     """
     cli_yacc.cli_yacc_init()
-    # import all modules that start with convert_* so that the handler methods
-    # for various commands are registered
-    currentfile = os.path.abspath(inspect.getfile(inspect.currentframe()))
-    currentdir = os.path.dirname(currentfile)
-    for module in glob.glob(os.path.join(currentdir, 'convert_*.py')):
-        importlib.import_module(os.path.splitext(os.path.basename(module))[0])
-    # call methods registered to be called before the start of processing
-    # config file.
-    for m in common.init_methods:
-        m.method(m.obj)
     lineno = 0
     if handle_default_config:
+        import_converter_modules()
+        # call methods registered to be called before the start of
+        # processing config file.
+        for m in common.init_methods:
+            m.method(m.obj)
         default_cmds = [
                 "set cmp parameter",
         ]
@@ -185,54 +303,131 @@ def convert_config_file(infile, outfile, verbose):
                                 output_line(str(output), outfile, verbose)
                         default_cmds_handled = True
                     else:
-                        output_line(str(parsed_tree), outfile, verbose)
+                        output_tree(parsed_tree, outfile, verbose)
             else:
-                output_line(str(parsed_tree), outfile, verbose)
+                output_tree(parsed_tree, outfile, verbose)
     else:
-        for cmd in infile:
-            lineno += 1
-            parsed_tree = cli_yacc.cli_yacc_parse(cmd, lineno)
-            if parsed_tree is not None:
-                # construct dictionary key to look up registered method to call to
-                # parse and transform the command to be emitted
-                # Registered method can return either string or tree.
-                key = " ".join(parsed_tree.get_command_type()).lower()
-                if key in common.dispatchtable:
-                    for m in common.dispatchtable[key]:
-                        m.method(m.obj, parsed_tree)
-
-        infile.seek(0)
+        # Each line is parsed once, and the parse trees are used by both
+        # passes. The first pass dispatches copies of the trees, so that the
+        # second pass gets them as parsed.
+        # All lines are parsed before the first pass, so that the classic
+        # expressions of the commands to be converted can be run through
+        # old nspepi tool in one batch. Messages logged while parsing a line
+        # are logged when the line is dispatched in each pass, to keep them
+        # in line order.
+        # Only the converter modules handling the commands present are
+        # loaded, after all lines are parsed.
+        # Lines whose first words show that they have no handler are
+        # output as they are, without being parsed, unless debug logs
+        # are written: those have the tokens of every line.
+        # When the config is mapped in memory, the lines with a possible
+        # handler are found in the map, and the lines between them are
+        # kept as byte ranges and written from the map.
+        byte_ranges = getattr(infile, "byte_ranges", False)
+        classic_exprs = set()
+        # (line or slice of byte offsets of lines,
+        #  command type if the command has a handler else None,
+        #  parse tree if the command has a handler, log records)
+        parsed_cmds = []
+        no_log_records = ()
+        handler_modules = set(handler_manifest.CORE_MODULES)
+        if byte_ranges:
+            patterns = None
+            if not common.debug_trace:
+                patterns = cli_lex.header_scan_patterns(
+                    handler_manifest.COMMAND_HANDLERS)
+            lines = infile.lines(patterns)
+        else:
+            lines = ((lineno, cmd, None, None)
+                     for lineno, cmd in enumerate(infile, 1))
+        range_end = 0
+        if common.debug_trace:
+            common.trace_event("parse")
+        log_buffer = common.LogRecordBuffer()
+        log_buffer.start()
+        try:
+            for lineno, cmd, start, end in lines:
+                if byte_ranges and start > range_end:
+                    append_byte_range(parsed_cmds, range_end, start)
+                range_end = end
+                key = None
+                parsed_tree = None
+                log_records = no_log_records
+                if common.debug_trace:
+                    header_key = None
+                else:
+                    header_key = cli_lex.command_header_key(cmd)
+                if (header_key is None or
+                        header_key in handler_manifest.COMMAND_HANDLERS):
+                    parsed_tree = cli_yacc.cli_yacc_parse(cmd, lineno)
+                    if parsed_tree is not None:
+                        key = " ".join(parsed_tree.get_command_type()).lower()
+                        if add_handler_modules(parsed_tree, key,
+                                               handler_modules):
+                            collect_classic_exprs(parsed_tree, classic_exprs)
+                        else:
+                            # Output as the line itself.
+                            key = None
+                            parsed_tree = None
+                    log_records = log_buffer.take() or no_log_records
+                if key is None and not log_records and byte_ranges:
+                    append_byte_range(parsed_cmds, start, end)
+                else:
+                    parsed_cmds.append((cmd, key, parsed_tree, log_records))
+            if byte_ranges and infile.size > range_end:
+                append_byte_range(parsed_cmds, range_end, infile.size)
+        finally:
+            log_buffer.stop()
+        common.load_handlers(handler_modules)
+        # call methods registered to be called before the start of
+        # processing config file.
+        for m in common.init_methods:
+            m.method(m.obj)
+        common.run_nspepi_tool_batch(classic_exprs)
+        if common.debug_trace:
+            common.trace_event("collect")
+        for cmd, key, parsed_tree, log_records in parsed_cmds:
+            if log_records:
+                common.replay_log_records(log_records)
+            # Registered method can return either string or tree.
+            if key in common.dispatchtable:
+                if common.debug_trace:
+                    common.trace_event("collect", parsed_tree.lineno, key)
+                parsed_tree = parsed_tree.clone()
+                for m in common.dispatchtable[key]:
+                    m.method(m.obj, parsed_tree)
+
         convert_cli_commands.NamedExpression.add_reference_named_exprs()
         convert_cli_commands.no_conversion_collect_data = False
-        while convert_cli_commands.policy_entities_names:
-            convert_cli_commands.policy_entities_names.pop()
-        while convert_cli_commands.classic_entities_names:
-            convert_cli_commands.classic_entities_names.pop()
-        convert_cli_commands.NamedExpression.register_built_in_named_exprs()
-        lineno = 0
-        for cmd in infile:
-            lineno += 1
-            parsed_tree = cli_yacc.cli_yacc_parse(cmd, lineno)
-            if parsed_tree is not None:
-                # construct dictionary key to look up registered method to call to
-                # parse and transform the command to be emitted
-                # Registered method can return either string or tree.
-                key = " ".join(parsed_tree.get_command_type()).lower()
-                if key in common.dispatchtable:
-                    for m in common.dispatchtable[key]:
-                        for output in m.method(m.obj, parsed_tree):
-                            if (type(output) == str):
-                                output_line(output, outfile, verbose)
+        convert_cli_commands.reset_entity_names()
+        if common.debug_trace:
+            common.trace_event("convert")
+        for inx, (cmd, key, parsed_tree, log_records) in enumerate(
+                parsed_cmds):
+            # Not needed after this pass.
+            parsed_cmds[inx] = None
+            if log_records:
+                common.replay_log_records(log_records)
+            # Registered method can return either string or tree.
+            if key in common.dispatchtable:
+                if common.debug_trace:
+                    common.trace_event("convert", parsed_tree.lineno, key)
+                for m in common.dispatchtable[key]:
+                    for output in m.method(m.obj, parsed_tree):
+                        if (type(output) == str):
+                            output_line(output, outfile, verbose)
+                        else:
+                            if output.invalid:
+                                output_line((str(output).strip() + convert_cli_commands.tool_error_comment), outfile, verbose)
                             else:
-                                if output.invalid:
-                                    output_line((str(output).strip() + convert_cli_commands.tool_error_comment), outfile, verbose)
-                                else:
-                                    output_line(str(output), outfile, verbose)
-                else:
-                    output_line(str(parsed_tree), outfile, verbose)
+                                output_tree(output, outfile, verbose)
+            elif type(cmd) is slice:
+                infile.write_range(outfile, cmd)
             else:
                 output_line(cmd, outfile, verbose)
         # call methods registered to be called at end of processing
+        if common.debug_trace:
+            common.trace_event("final")
         for m in common.final_methods:
             for output in m.method(m.obj):
                 if (type(output) == str):
@@ -241,8 +436,10 @@ def convert_config_file(infile, outfile, verbose):
                     if output.invalid:
                         output_line(str(output).strip() + convert_cli_commands.tool_error_comment, outfile, verbose)
                     else:
-                        output_line(str(output), outfile, verbose)
+                        output_tree(output, outfile, verbose)
         # analyze policy bindings for any unsupported bindings
+        if common.debug_trace:
+            common.trace_event("priority analysis")
         common.pols_binds.analyze()
         # Get all bind commands after reprioritizing.
         config_obj = convert_cli_commands.ConvertConfig()
@@ -253,22 +450,31 @@ def convert_config_file(infile, outfile, verbose):
                 if output.invalid:
                     output_line(str(output).strip() + convert_cli_commands.tool_error_comment, outfile, verbose)
                 else:
-                    output_line(str(output), outfile, verbose)
+                    output_tree(output, outfile, verbose)
+        expr_module = convert_cli_commands.convert_classic_expr
+        logging.debug("Classic expression conversion cache: {} hits, {} misses"
+                      .format(expr_module.conversion_cache_hits,
+                              expr_module.conversion_cache_misses))
+        logging.debug("nspepi tool output cache: {} hits, {} misses, {} of"
+            " them on disk".format(
+            common.nspepi_tool_cache_hits, common.nspepi_tool_cache_misses,
+            common.nspepi_tool_disk_cache_hits))
 
 
 def main():
-    desc = cleandoc(
+    desc = textwrap.dedent(
         """
         Convert classic policy expressions to advanced policy
         expressions and deprecated commands to non-deprecated
         commands.
-        """)
-    usage_example = cleandoc(
+        """).strip()
+    usage_example = textwrap.dedent(
         """
-	Usage Examples:
+        Usage Examples:
           i) nspepi -e "req.tcp.destport == 80"
           ii) nspepi -f ns.conf
-        """)
+          iii) zcat ns.conf.gz | nspepi -f - > new_ns.conf
+        """).strip()
     arg_parser = argparse.ArgumentParser(
         prog="nspepi",
         description=desc,
@@ -286,7 +492,14 @@ def main():
              " expression (maximum length of 8191 allowed)")
     group.add_argument(
         "-f", "--infile", metavar="<path to ns config file>",
-        help="convert Citrix ADC configuration file")
+        help="convert Citrix ADC configuration file, which can be gzip,"
+             " bzip2 or xz compressed, or - to read it from the standard"
+             " input")
+    arg_parser.add_argument(
+        "-o", "--outfile", metavar="<path to converted config file>",
+        help="write the converted config to this file, or to the standard"
+             " output for - (default: new_<config file name>, or the"
+             " standard output when reading the standard input)")
     arg_parser.add_argument(
         "-d", "--debug", action="store_true", help="log debug output")
     arg_parser.add_argument(
@@ -294,70 +507,116 @@ def main():
     arg_parser.add_argument(
         '-V', '--version', action='version',
         version='%(prog)s {}'.format(__version__))
+    arg_parser.add_argument(
+        "--cache-dir", metavar="<path to cache directory>",
+        help="reuse expression conversions of earlier runs kept in this"
+             " directory")
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=1, metavar="<number of jobs>",
+        help="number of processes converting expressions of the config file")
     arg_parser.add_argument('-E', '--newErrorFileName', action="store_true",
         help=argparse.SUPPRESS)
+    arg_parser.add_argument('--compareHelper', action="store_true",
+        help=argparse.SUPPRESS)
+    arg_parser.add_argument('--usePly', action="store_true",
+        help=argparse.SUPPRESS)
     try:
         args = arg_parser.parse_args()
     except IOError as e:
         exit(str(e))
+    if args.jobs < 1:
+        arg_parser.error("argument -j/--jobs: must be at least 1")
+    if args.outfile is not None and args.infile is None:
+        arg_parser.error("argument -o/--outfile: only allowed with"
+                         " argument -f/--infile")
     # obtain logging parameters and setup logging
     conf_file_path = ''
     conf_file_name = 'expr'
     if args.infile is not None:
-        conf_file_path = os.path.dirname(args.infile)
-        conf_file_name = os.path.basename(args.infile)
+        # Only imported for config files, to keep -e fast to start.
+        import nspepi_input
+        import nspepi_output
+        if args.infile != nspepi_input.stdin_name:
+            conf_file_path = os.path.dirname(args.infile)
+        conf_file_name = nspepi_input.config_name(args.infile)
+    # Messages go to the standard error when the converted config goes to
+    # the standard output.
+    new_path = args.outfile
+    if new_path is None:
+        if (args.infile is not None and
+                args.infile == nspepi_input.stdin_name):
+            new_path = "-"
+        else:
+            new_path = os.path.join(conf_file_path, "new_" + conf_file_name)
+    message_file = sys.stderr if new_path == "-" else sys.stdout
     log_file_name = os.path.join(conf_file_path, 'warn_' + conf_file_name)
     err_file_name = os.path.join(conf_file_path, 'error_' + conf_file_name) if args.newErrorFileName else None
     debug_file_name = os.path.join(conf_file_path, 'debug_' + conf_file_name) if args.debug else None
     # For -v and -e options, logs will be seen on console and warn file.
     # For other options, logs will only be in warn file and not on console.
     setup_logging(log_file_name, logging.WARNING, err_file_name, debug_file_name, args.verbose or args.expression is not None)
+    common.compare_nspepi_tool = args.compareHelper
+    cli_yacc.use_ply = args.usePly
+    common.nspepi_tool_jobs = args.jobs
+    if args.cache_dir is not None:
+        common.open_nspepi_tool_disk_cache(args.cache_dir)
     convert_cli_commands.convert_cli_init()
     convert_cli_commands.tool_error_comment = " # Error in conversion in using nspepi tool, for details see the warn_" + conf_file_name + "\n"
     # convert classic policy expression if given as an argument
     if args.expression is not None:
         convert_cli_commands.no_conversion_collect_data = False
         # Check that given argument value is not a command
-        if re.search(r'^\s*((add)|(set)|(bind))\s+[a-zA-Z]', args.expression, re.IGNORECASE):
+        if is_command(args.expression):
             print("Error: argument e: Make sure argument value "
                   "provided is an expression and not a command")
             return
-        output = convert_classic_expr(args.expression)
-        # return value of convert_classic_expr will be enclosed with quotes.
-        if output is not None and convert_cli_commands. \
-                remove_quotes(output) == args.expression:
-            # If expression is not converted, then it can be advanced
-            # expression. Advanced expressions can have Q and S prefixes and
-            # SYS.EVAL_CLASSIC_EXPR expression which needs to be converted.
-            output = convert_adv_expr(args.expression)
+        output = convert_expression(args.expression)
         if output is not None:
             print(output)
     # convert ns config file
     elif args.infile is not None:
         convert_cli_commands.parsing_config_file = True
-        new_path = os.path.join(conf_file_path, "new_" + conf_file_name)
-        if not os.path.exists(args.infile):
-            print("\nInput file " + args.infile + " does not exist")
+        if not nspepi_input.input_exists(args.infile):
+            print("\nInput file " + args.infile + " does not exist",
+                  file=message_file)
             return
-        with open(args.infile, 'r') as infile:
-            with open(new_path, 'w') as outfile:
+        # The config file is mapped in memory unless every line is shown
+        # on the console.
+        with nspepi_input.open_config(
+                args.infile, mappable=not args.verbose) as infile:
+            # The converted config replaces new_path only once the whole
+            # file is converted.
+            echo = nspepi_output.ConsoleEcho() if args.verbose else None
+            encoding = None
+            if isinstance(infile, nspepi_input.MappedConfig):
+                encoding = infile.encoding
+            with nspepi_output.OutputFile(
+                    None if new_path == "-" else new_path, echo,
+                    encoding=encoding) as outfile:
                 convert_config_file(infile, outfile, args.verbose)
-                if err_file_name:
-                    if os.path.getsize(err_file_name) == 0:
-                        os.remove(err_file_name)
-                if os.path.getsize(log_file_name) == 0:
-                    error_warn_msg = ".\nConversion is successful, no error or warning is generated."
-                    os.remove(log_file_name)
-                else:
-                    error_warn_msg = ".\nCheck warn_" + conf_file_name + \
-                        " file for all warnings or errors that have been generated." + \
-                        "\nPlease try to convert the errors manually or reach out to " + \
-                        "the support team for helping in conversion."
-                print("\nConverted config will be available in a new file new_"
-                      + conf_file_name + error_warn_msg) 
-                if args.debug:
-                    print("Check debug_" + conf_file_name + " file for debug logs.")
-    print("\nUse nspepi tool available at https://github.com/citrix/ADC-scripts/tree/master/nspepi for the most complete and up-to-date version.")
+            if err_file_name:
+                if os.path.getsize(err_file_name) == 0:
+                    os.remove(err_file_name)
+            if os.path.getsize(log_file_name) == 0:
+                error_warn_msg = ".\nConversion is successful, no error or warning is generated."
+                os.remove(log_file_name)
+            else:
+                error_warn_msg = ".\nCheck warn_" + conf_file_name + \
+                    " file for all warnings or errors that have been generated." + \
+                    "\nPlease try to convert the errors manually or reach out to " + \
+                    "the support team for helping in conversion."
+            if new_path == "-":
+                print("\nConverted config is written to the standard output"
+                      + error_warn_msg, file=message_file)
+            else:
+                print("\nConverted config will be available in a new file "
+                      + os.path.basename(new_path) + error_warn_msg,
+                      file=message_file)
+            if args.debug:
+                print("Check debug_" + conf_file_name + " file for debug logs.",
+                      file=message_file)
+    print("\nUse nspepi tool available at https://github.com/citrix/ADC-scripts/tree/master/nspepi for the most complete and up-to-date version.",
+          file=message_file)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Output stage for the converted config: buffered writes to a temporary
+file that replaces the output file only once the conversion completes,
+a console echo of the output for the verbose mode, and output kept in
+memory for the library API.
+"""
+
+import os
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    _replace_file = os.replace
+except AttributeError:
+    # Python 2: rename is atomic on POSIX.
+    _replace_file = os.rename
+
+
+class ConsoleEcho(object):
+    """
+    Echoes output lines to the console from a background thread, so that
+    a slow console does not hold up the conversion.
+    stream - stream to write the lines to.
+    prefix - text put before each line.
+    """
+
+    def __init__(self, stream=None, prefix="INFO - "):
+        self._stream = stream if stream is not None else sys.stderr
+        self._prefix = prefix
+        self._lines = queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, line):
+        """ Queues a line to be echoed. Never blocks on the console. """
+        self._lines.put(line)
+
+    def _run(self):
+        """ Writes queued lines in batches until close is called. """
+        done = False
+        while not done:
+            lines = [self._lines.get()]
+            try:
+                while True:
+                    lines.append(self._lines.get_nowait())
+            except queue.Empty:
+                pass
+            if lines[-1] is None:
+                lines.pop()
+                done = True
+            if lines:
+                self._stream.write("".join(
+                    self._prefix + line.rstrip() + "\n" for line in lines))
+                self._stream.flush()
+
+    def close(self):
+        """ Waits for the queued lines to be written. """
+        self._lines.put(None)
+        self._thread.join()
+
+
+class OutputFile(object):
+    """
+    Buffered output file that is written to a temporary file next to
+    path and renamed to path on commit, so that path never holds a
+    partial output.
+    path - the output file name, or None to write to the standard output.
+    echo - ConsoleEcho to also send the output lines to, or None.
+    buffer_size - number of characters to collect before writing.
+    encoding - None to write text, or the encoding to write text in to a
+               binary file, which bytes can also be written to with
+               write_raw.
+    """
+
+    def __init__(self, path, echo=None, buffer_size=1 << 20, encoding=None):
+        self.path = path
+        self.echo = echo
+        self._encoding = encoding
+        mode = 'w' if encoding is None else 'wb'
+        if path is None:
+            self._temp_path = None
+            self._file = sys.stdout
+            if encoding is not None:
+                sys.stdout.flush()
+                self._file = sys.stdout.buffer
+        else:
+            self._temp_path = "{}.{}.tmp".format(path, os.getpid())
+            self._file = open(self._temp_path, mode)
+        self._buffer = []
+        self._buffered = 0
+        self._buffer_size = buffer_size
+
+    def write(self, text):
+        """ Adds text to the output. """
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self._buffer_size:
+            self.flush()
+
+    def write_raw(self, data):
+        """
+        Adds bytes to the output of a file opened with an encoding.
+        """
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the buffered text to the temporary file. """
+        if not self._buffer:
+            return
+        if self._encoding is None:
+            self._file.write("".join(self._buffer))
+        else:
+            # Runs of text are encoded together.
+            text = []
+            for part in self._buffer:
+                if isinstance(part, bytes):
+                    if text:
+                        self._file.write(
+                            "".join(text).encode(self._encoding))
+                        text = []
+                    self._file.write(part)
+                else:
+                    text.append(part)
+            if text:
+                self._file.write("".join(text).encode(self._encoding))
+        self._buffer = []
+        self._buffered = 0
+
+    def commit(self):
+        """ Completes the output and moves it to path. """
+        try:
+            self.flush()
+            self._file.flush()
+            if self._temp_path is not None:
+                os.fsync(self._file.fileno())
+        except Exception:
+            self.abort()
+            raise
+        self._close()
+        if self._temp_path is None:
+            return
+        try:
+            _replace_file(self._temp_path, self.path)
+        except Exception:
+            os.remove(self._temp_path)
+            raise
+
+    def abort(self):
+        """ Discards the output, leaving path as it was. """
+        self._buffer = []
+        self._close()
+        if (self._temp_path is not None and
+                os.path.exists(self._temp_path)):
+            os.remove(self._temp_path)
+
+    def _close(self):
+        """ Closes the temporary file and stops the echo. """
+        if self._temp_path is not None and not self._file.closed:
+            self._file.close()
+        if self.echo is not None:
+            self.echo.close()
+            self.echo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+class StringOutput(object):
+    """
+    Output kept in memory, for conversions run through the library API.
+    """
+    echo = None
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        """ Adds text to the output. """
+        self._parts.append(text)
+
+    def getvalue(self):
+        """ Returns the output written so far. """
+        return "".join(self._parts)
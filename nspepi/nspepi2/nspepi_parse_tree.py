@@ -4,12 +4,33 @@
 # Use of this software is governed by the license terms, if any,
 # which accompany or are included with this software.
 
-import re
+import copy
 import logging
+import sys
 from collections import OrderedDict
 
+import nspepi_codec
 import nspepi_common as common
 
+# Incremented on every change to a parse tree node. Commands cache their
+# rendered string together with the generation it was rendered at, since
+# parameter nodes don't know their command and can be shared by commands.
+tree_generation = 0
+
+
+def tree_changed():
+    """ Invalidates the rendered strings cached by commands. """
+    global tree_generation
+    tree_generation += 1
+
+
+# Keyword parameters of a command, in command order. Plain dicts keep
+# insertion order from Python 3.7 and are smaller than OrderedDict.
+if sys.version_info >= (3, 7):
+    KeywordDict = dict
+else:
+    KeywordDict = OrderedDict
+
 
 """
 Parse tree implementation
@@ -54,9 +75,7 @@ This tree can be created by the following code:
 
 class CLIParseTreeNode(object):
     """ A CLI parse tree node """
-    must_quote_chars = re.compile('[ \t\r\n"\'\\\\()]')
-    must_escape_chars = "\t\r\n\"\\"
-    qquote_delims = "/{<|~$^+=&%@`?"
+    __slots__ = ()
 
     def __init__(self):
         """ Create a CLI parse tree node object """
@@ -69,37 +88,16 @@ class CLIParseTreeNode(object):
         make_str - to normalize when special characters are needed in string.
         Returns the normalized string.
         """
-        # Only uses double quotes if any quoting is needed.
-        # This may put in quotes in some cases where they are not actually
-        # needed.
-        result = val
-        str_len = len(val)
-        if str_len == 0:
-            result = '""'
-        else:
-            if (make_str or val[0] == '-' or val[0] == '#'
-                    or (val[0] == 'q' and str_len > 1 and
-                        val[1] in self.qquote_delims)
-                    or self.must_quote_chars.search(val)):
-                result = '"'
-                for ch in val:
-                    if ch in self.must_escape_chars:
-                        if ch == '\t':
-                            result += '\\t'
-                        elif ch == '\r':
-                            result += '\\r'
-                        elif ch == '\n':
-                            result += '\\n'
-                        else:
-                            result += '\\' + ch
-                    else:
-                        result += ch
-                result += '"'
-        return result
+        return nspepi_codec.quote_cli_value(val, make_str)
 
 
 class CLICommand(CLIParseTreeNode):
     """ A CLI configuration command """
+    __slots__ = ('_upgraded', '_adv_upgraded', '_invalid', '_has_csec_expr',
+                 '_original_line', '_lineno', '_op', '_group', '_ot',
+                 '_positionals', '_keywords', '_rendered')
+    # Not part of the command, left out of its repr.
+    transient_slots = ('_rendered',)
 
     def __init__(self, op, group, ot):
         """ Create a CLI command object
@@ -123,15 +121,18 @@ class CLICommand(CLIParseTreeNode):
         self._has_csec_expr = False
         self._original_line = ""
         self._lineno = 0
-        self._op = op
-        self._group = group
-        self._ot = ot
+        self._op = common.intern_name(op)
+        self._group = common.intern_name(group)
+        self._ot = common.intern_name(ot)
         self._positionals = []
-        self._keywords = OrderedDict()
+        self._keywords = KeywordDict()
+        # (tree_generation, rendered string) or None
+        self._rendered = None
         super(CLICommand, self).__init__()
-        logging.debug('CLICommand created: op=' + op +
-                      ', group=' + group +
-                      ', ot=' + ot)
+        if common.debug_trace:
+            logging.debug('CLICommand created: op=' + op +
+                          ', group=' + group +
+                          ', ot=' + ot)
 
     def get_command_type(self):
         return [self._op, self._group, self._ot]
@@ -143,7 +144,8 @@ class CLICommand(CLIParseTreeNode):
     @lineno.setter
     def lineno(self, lineno):
         self._lineno = lineno
-        logging.debug('CLICommand lineno set: ' + str(lineno))
+        if common.debug_trace:
+            logging.debug('CLICommand lineno set: ' + str(lineno))
 
     @property
     def original_line(self):
@@ -154,8 +156,10 @@ class CLICommand(CLIParseTreeNode):
         self._original_line = original_line
         self._upgraded = False
         self._adv_upgraded = False
-        logging.debug('CLICommand original_line set: ' + original_line +
-                      ', upgraded set to False')
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand original_line set: ' + original_line +
+                          ', upgraded set to False')
 
     @property
     def op(self):
@@ -163,8 +167,10 @@ class CLICommand(CLIParseTreeNode):
 
     @op.setter
     def op(self, op):
-        self._op = op
-        logging.debug('CLICommand ot set: ' + op)
+        self._op = common.intern_name(op)
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand ot set: ' + op)
 
     @property
     def group(self):
@@ -172,8 +178,10 @@ class CLICommand(CLIParseTreeNode):
 
     @group.setter
     def group(self, group):
-        self._group = group
-        logging.debug('CLICommand ot set: ' + group)
+        self._group = common.intern_name(group)
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand ot set: ' + group)
 
     @property
     def ot(self):
@@ -181,13 +189,17 @@ class CLICommand(CLIParseTreeNode):
 
     @ot.setter
     def ot(self, ot):
-        self._ot = ot
-        logging.debug('CLICommand ot set: ' + ot)
+        self._ot = common.intern_name(ot)
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand ot set: ' + ot)
 
     def set_upgraded(self):
         """ Flags that this command was upgraded. """
         self._upgraded = True
-        logging.debug('CLICommand upgraded flag set')
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand upgraded flag set')
 
     @property
     def upgraded(self):
@@ -196,7 +208,9 @@ class CLICommand(CLIParseTreeNode):
     def set_adv_upgraded(self):
         """ Flags that this advanced command was upgraded. """
         self._adv_upgraded = True
-        logging.debug('CLICommand adv_upgraded flag set')
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand adv_upgraded flag set')
 
     @property
     def adv_upgraded(self):
@@ -205,7 +219,8 @@ class CLICommand(CLIParseTreeNode):
     def set_invalid(self):
         """ Flags that this command is invalid. """
         self._invalid = True
-        logging.debug('CLICommand invalid flag set')
+        if common.debug_trace:
+            logging.debug('CLICommand invalid flag set')
 
     @property
     def invalid(self):
@@ -228,8 +243,10 @@ class CLICommand(CLIParseTreeNode):
         """
         assert isinstance(positional_param, CLIPositionalParameter)
         self._positionals.append(positional_param)
-        logging.debug('CLICommand positional parameter added: ' +
-                      str(positional_param))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand positional parameter added: ' +
+                          str(positional_param))
 
     def add_positional_list(self, positional_params):
         """ Adds a list of positional parameters.
@@ -238,8 +255,10 @@ class CLICommand(CLIParseTreeNode):
         for pos in positional_params:
             assert isinstance(pos, CLIPositionalParameter)
             self._positionals.append(pos)
-            logging.debug('CLICommand positional parameter added: ' +
-                          str(pos))
+            tree_changed()
+            if common.debug_trace:
+                logging.debug('CLICommand positional parameter added: ' +
+                              str(pos))
 
     def remove_positional(self, inx):
         """ Removes the given positional parameter.
@@ -250,8 +269,10 @@ class CLICommand(CLIParseTreeNode):
         assert inx < len(self._positionals) and inx >= 0
         del self._positionals[inx]
         self._upgraded = True
-        logging.debug('CLICommand positional parameter removed at index: ' +
-                      str(inx))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand positional parameter removed at index: ' +
+                          str(inx))
 
     def add_keyword(self, keyword_param):
         """ Adds a keyword parameter at the end of the parameters.
@@ -259,8 +280,10 @@ class CLICommand(CLIParseTreeNode):
         """
         assert isinstance(keyword_param, CLIKeywordParameter)
         self._keywords[keyword_param.name.name] = keyword_param
-        logging.debug('CLICommand keyword parameter added: ' +
-                      str(keyword_param))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand keyword parameter added: ' +
+                          str(keyword_param))
 
     def add_keyword_list(self, keyword_params):
         """ Adds a list of keyword parameters.
@@ -269,8 +292,10 @@ class CLICommand(CLIParseTreeNode):
         for kw in keyword_params:
             assert isinstance(kw, CLIKeywordParameter)
             self._keywords[kw.name.name] = kw
-            logging.debug('CLICommand keyword parameter added: ' +
-                          str(kw))
+            tree_changed()
+            if common.debug_trace:
+                logging.debug('CLICommand keyword parameter added: ' +
+                              str(kw))
 
     def remove_keyword(self, name):
         """ Removes the given keyword parameter.
@@ -279,8 +304,10 @@ class CLICommand(CLIParseTreeNode):
         assert name in self._keywords
         del self._keywords[name]
         self._upgraded = True
-        logging.debug('CLICommand keyword parameter removed with key: ' +
-                      str(name))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand keyword parameter removed with key: ' +
+                          str(name))
 
     def remove_keyword_value(self, name, inx):
         """ Some keywords will have multiple values.
@@ -296,8 +323,10 @@ class CLICommand(CLIParseTreeNode):
         assert inx < len(keyword_param.values) and inx >= 0
         del keyword_param.values[inx]
         self._upgraded = True
-        logging.debug('CLICommand keyword parameter value removed at index: ' +
-                      str(inx) + " with key: " + str(name))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLICommand keyword parameter value removed at index: ' +
+                          str(inx) + " with key: " + str(name))
 
     def keyword_exists(self, name):
         """ Determine whether the given keyword existins for this command.
@@ -335,6 +364,27 @@ class CLICommand(CLIParseTreeNode):
             result = self._positionals[inx]
         return result
 
+    def clone(self):
+        """ Creates a copy of the command whose parameters can be modified
+        without affecting this command. Much cheaper than copy.deepcopy.
+        Returns the copy.
+        """
+        result = copy.copy(self)
+        result._positionals = [copy.copy(param)
+                               for param in self._positionals]
+        result._keywords = KeywordDict(
+            (name, param.clone()) for name, param in self._keywords.items())
+        return result
+
+    def parameter_values(self):
+        """ Gets the values of all positional and keyword parameters.
+        Returns the list of value strings.
+        """
+        result = [param.value for param in self._positionals]
+        for keyword in self._keywords.values():
+            result.extend(value.value for value in keyword.values)
+        return result
+
     def get_number_of_params(self):
         """ Gets the number of parameters. """
         no_of_params = len(self._positionals) + len(self._keywords)
@@ -346,13 +396,39 @@ class CLICommand(CLIParseTreeNode):
         """
         if not (self._upgraded or self._adv_upgraded):
             return self._original_line
+        if (self._rendered is not None and
+                self._rendered[0] == tree_generation):
+            return self._rendered[1]
+        fragments = [self._op, self._group, self._ot]
+        fragments.extend(str(node) for node in self._positionals)
+        fragments.extend(str(node) for node in self._keywords.values())
+        result = " ".join(fragments) + "\n"
+        self._rendered = (tree_generation, result)
+        return result
+
+    def write_to(self, fileobj):
+        """ Writes the string representation of the CLI node to fileobj,
+        as fragments, without building the whole string.
+        fileobj - file object to write to
+        """
+        if not (self._upgraded or self._adv_upgraded):
+            fileobj.write(self._original_line)
+        elif (self._rendered is not None and
+                self._rendered[0] == tree_generation):
+            fileobj.write(self._rendered[1])
         else:
-            result = self._op + " " + self._group + " " + self._ot
+            fileobj.write(self._op)
+            fileobj.write(" ")
+            fileobj.write(self._group)
+            fileobj.write(" ")
+            fileobj.write(self._ot)
             for node in self._positionals:
-                result += " " + str(node)
+                fileobj.write(" ")
+                fileobj.write(str(node))
             for node in self._keywords.values():
-                result += " " + str(node)
-            return result + "\n"
+                fileobj.write(" ")
+                node.write_to(fileobj)
+            fileobj.write("\n")
 
     def __repr__(self):
         """ Creates an unambiguous representation of the CLI node.
@@ -363,6 +439,7 @@ class CLICommand(CLIParseTreeNode):
 
 class CLIPositionalParameter(CLIParseTreeNode):
     """ A CLI positional parameter """
+    __slots__ = ('_value', '_quoted')
 
     def __init__(self, value):
         """ Creates a positional node.
@@ -371,7 +448,8 @@ class CLIPositionalParameter(CLIParseTreeNode):
         self._value = value
         self._quoted = False
         super(CLIPositionalParameter, self).__init__()
-        logging.debug('CLIPositionalParameter created: value=' + str(value))
+        if common.debug_trace:
+            logging.debug('CLIPositionalParameter created: value=' + str(value))
 
     @property
     def value(self):
@@ -384,6 +462,7 @@ class CLIPositionalParameter(CLIParseTreeNode):
     @quoted.setter
     def quoted(self, quoted):
         self._quoted = quoted
+        tree_changed()
 
     def set_value(self, value, quoted=False):
         """ Set the value of this parameter.
@@ -392,8 +471,10 @@ class CLIPositionalParameter(CLIParseTreeNode):
         """
         self._value = value
         self._quoted = quoted
-        logging.debug('CLIPositionalValue value updated: value=' + str(value)
-                      + ', quoted=' + str(quoted))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLIPositionalValue value updated: value=' + str(value)
+                          + ', quoted=' + str(quoted))
 
     def __str__(self):
         """ Creates a readable string representation of the positional
@@ -414,6 +495,7 @@ class CLIPositionalParameter(CLIParseTreeNode):
 
 class CLIKeywordParameter(CLIParseTreeNode):
     """ A CLI keyword parameter """
+    __slots__ = ('_name', '_values')
 
     def __init__(self, name):
         """ Creates a keyword parameter, initialized to have no value.
@@ -423,7 +505,17 @@ class CLIKeywordParameter(CLIParseTreeNode):
         self._name = name
         self._values = []
         super(CLIKeywordParameter, self).__init__()
-        logging.debug('CLIKeywordParameter created: name=' + str(name))
+        if common.debug_trace:
+            logging.debug('CLIKeywordParameter created: name=' + str(name))
+
+    def clone(self):
+        """ Creates a copy of the keyword parameter whose values can be
+        modified without affecting this parameter.
+        Returns the copy.
+        """
+        result = copy.copy(self)
+        result._values = [copy.copy(value) for value in self._values]
+        return result
 
     def add_value(self, value):
         """ Adds a value to the end of the list of keyword values.
@@ -431,7 +523,9 @@ class CLIKeywordParameter(CLIParseTreeNode):
         """
         child = CLIKeywordValue(value)
         self._values.append(child)
-        logging.debug('CLIKeywordParameter value added: ' + str(value))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLIKeywordParameter value added: ' + str(value))
 
     def add_value_list(self, values):
         """ Adds a list of keyword values.
@@ -450,6 +544,17 @@ class CLIKeywordParameter(CLIParseTreeNode):
             result += " " + str(value)
         return result
 
+    def write_to(self, fileobj):
+        """ Writes the string representation of the keyword parameter node
+        to fileobj, as fragments.
+        fileobj - file object to write to
+        """
+        fileobj.write("-")
+        fileobj.write(self._name.name)
+        for value in self._values:
+            fileobj.write(" ")
+            fileobj.write(str(value))
+
     def __repr__(self):
         """ Creates an unambiguous representation of the keyword parameter.
         Returns the string representation.
@@ -473,14 +578,16 @@ class CLIKeywordParameter(CLIParseTreeNode):
 
 class CLIKeywordName(CLIParseTreeNode):
     """ A CLI keyword name """
+    __slots__ = ('_name',)
 
     def __init__(self, name):
         """ Creates a keyword name node.
         name - the name of the keyword (without the "-")
         """
-        self._name = name
+        self._name = common.intern_name(name)
         super(CLIKeywordName, self).__init__()
-        logging.debug('CLIKeywordName created: name=' + name)
+        if common.debug_trace:
+            logging.debug('CLIKeywordName created: name=' + name)
 
     @property
     def name(self):
@@ -504,6 +611,7 @@ class CLIKeywordName(CLIParseTreeNode):
 
 class CLIKeywordValue(CLIParseTreeNode):
     """ The value for a CLI keyword parameter """
+    __slots__ = ('_value', '_quoted')
 
     def __init__(self, value):
         """ Creates a keyword value node.
@@ -512,7 +620,8 @@ class CLIKeywordValue(CLIParseTreeNode):
         self._value = value
         self._quoted = False
         super(CLIKeywordValue, self).__init__()
-        logging.debug('CLIKeywordValue created: value=' + str(value))
+        if common.debug_trace:
+            logging.debug('CLIKeywordValue created: value=' + str(value))
 
     @property
     def value(self):
@@ -525,6 +634,7 @@ class CLIKeywordValue(CLIParseTreeNode):
     @quoted.setter
     def quoted(self, quoted):
         self._quoted = quoted
+        tree_changed()
 
     def set_value(self, value, quoted=False):
         """ Set the value of this parameter.
@@ -533,8 +643,10 @@ class CLIKeywordValue(CLIParseTreeNode):
         """
         self._value = value
         self._quoted = quoted
-        logging.debug('CLIKeywordValue value updated: value=' + str(value) +
-                      ', quoted=' + str(quoted))
+        tree_changed()
+        if common.debug_trace:
+            logging.debug('CLIKeywordValue value updated: value=' + str(value) +
+                          ', quoted=' + str(quoted))
 
     def __str__(self):
         """ Creates a readable string representation of the keyword value node.
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Conversion server: keeps the converter modules, the old nspepi tool process
+and the expression caches loaded, and converts expressions and config
+snippets sent over HTTP on a UNIX socket or on a localhost port.
+
+Requests are POSTs with a JSON object as body:
+    /expression  {"expression": "<classic policy expression>"}
+    /config      {"config": "<config text>", "name": "<config file name>"}
+The response is a JSON object with "output", the converted expression or
+config (null if the expression cannot be converted), and "messages", a
+list of [level name, message] of the warnings and errors. Requests that
+cannot be served get a JSON object with "error" and an HTTP error status,
+500 if the conversion fails.
+Each request is converted in its own conversion context, see nspepi_api.
+Requests are read and answered in threads, but converted one at a time,
+as conversion contexts are entered one at a time.
+
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+import nspepi_api
+import nspepi_main
+
+# Maximum length of an expression, as for nspepi -e.
+MAX_EXPRESSION_LENGTH = 8191
+
+
+class RequestError(Exception):
+    """ Request that cannot be served, with the HTTP status to reply. """
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the conversion requests of a ConversionServer.
+    """
+    server_version = "nspepi/" + nspepi_main.__version__
+
+    def do_POST(self):
+        """ Converts the expression or config of the request. """
+        try:
+            if not self.server.slots.acquire(False):
+                raise RequestError(503, "too many requests in progress")
+            try:
+                body = self._read_request()
+                if self.path == "/expression":
+                    result = self._convert_expression(body)
+                elif self.path == "/config":
+                    result = self._convert_config(body)
+                else:
+                    raise RequestError(404, "unknown request " + self.path)
+            finally:
+                self.server.slots.release()
+        except RequestError as exc:
+            self._reply(exc.status, {"error": str(exc)})
+            return
+        except Exception as exc:
+            logging.exception("Conversion of %s request failed", self.path)
+            self._reply(500, {"error": "conversion failed: {}".format(exc)})
+            return
+        self._reply(200, {"output": result.output,
+                          "messages": result.messages})
+
+    def _read_request(self):
+        """ Returns the JSON object of the request body. """
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise RequestError(411, "Content-Length is required")
+        if length > self.server.max_request_size:
+            raise RequestError(413, "request is larger than {} bytes".format(
+                self.server.max_request_size))
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError as exc:
+            raise RequestError(400, "invalid JSON: {}".format(exc))
+        if not isinstance(body, dict):
+            raise RequestError(400, "request body must be a JSON object")
+        return body
+
+    def _convert_expression(self, body):
+        """ Converts the expression of a /expression request. """
+        expr = body.get("expression")
+        if not isinstance(expr, str):
+            raise RequestError(400, "expression must be a string")
+        if len(expr) > MAX_EXPRESSION_LENGTH:
+            raise RequestError(400, "expression length exceeds {}"
+                               " characters".format(MAX_EXPRESSION_LENGTH))
+        if nspepi_main.is_command(expr):
+            raise RequestError(400, "expression is a command")
+        return nspepi_api.convert_expression(
+            expr, cache_dir=self.server.cache_dir)
+
+    def _convert_config(self, body):
+        """ Converts the config of a /config request. """
+        config = body.get("config")
+        name = body.get("name", "ns.conf")
+        if not isinstance(config, str) or not isinstance(name, str):
+            raise RequestError(400, "config and name must be strings")
+        return nspepi_api.convert_config(
+            config, name=name, cache_dir=self.server.cache_dir)
+
+    def _reply(self, status, obj):
+        """ Sends a JSON response. """
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        """ Returns the client address for logs, also for UNIX sockets. """
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "local"
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s", self.address_string(), format % args)
+
+
+class ConversionServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server on a localhost port, serving requests in threads. Requests
+    are converted one at a time.
+    max_requests - number of requests admitted at a time, the one being
+                   converted and the ones waiting for it; more are refused
+                   with 503.
+    max_request_size - maximum size of a request body in bytes.
+    cache_dir - directory of the on-disk expression cache, or None.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, max_requests, max_request_size,
+                 cache_dir=None):
+        HTTPServer.__init__(self, address, ConversionRequestHandler)
+        self.slots = threading.BoundedSemaphore(max_requests)
+        self.max_request_size = max_request_size
+        self.cache_dir = cache_dir
+
+
+class UnixConversionServer(ThreadingMixIn, UnixStreamServer):
+    """
+    Same as ConversionServer, on a UNIX socket.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, max_requests, max_request_size,
+                 cache_dir=None):
+        if os.path.exists(path):
+            os.remove(path)
+        UnixStreamServer.__init__(self, path, ConversionRequestHandler)
+        self.slots = threading.BoundedSemaphore(max_requests)
+        self.max_request_size = max_request_size
+        self.cache_dir = cache_dir
+        # Used by BaseHTTPRequestHandler.
+        self.server_name = socket.gethostname()
+        self.server_port = 0
+
+
+def warm_up():
+    """
+    Loads the converter modules and runs a first conversion, so that
+    requests do not pay for it.
+    """
+    nspepi_main.import_converter_modules()
+    nspepi_api.convert_config("add lb vserver v1 HTTP 1.1.1.1 80\n")
+    nspepi_api.convert_expression("REQ.HTTP.URL == /")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        prog="nspepi_server",
+        description="Serve nspepi conversions of expressions and config"
+                    " snippets over HTTP.")
+    group = arg_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "--socket", metavar="<path to UNIX socket>",
+        help="listen on this UNIX socket")
+    group.add_argument(
+        "--port", type=int, metavar="<port>",
+        help="listen on this port of 127.0.0.1")
+    arg_parser.add_argument(
+        "--max-requests", type=int, default=16, metavar="<number>",
+        help="number of requests admitted at a time, more are refused;"
+             " requests are converted one at a time and the others wait"
+             " (default: 16)")
+    arg_parser.add_argument(
+        "--max-request-size", type=int, default=16 << 20,
+        metavar="<bytes>",
+        help="maximum size of a request (default: 16 MiB)")
+    arg_parser.add_argument(
+        "--cache-dir", metavar="<path to cache directory>",
+        help="reuse expression conversions of earlier runs kept in this"
+             " directory")
+    args = arg_parser.parse_args()
+    if args.max_requests < 1:
+        arg_parser.error("argument --max-requests: must be at least 1")
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s: %(levelname)s - %(message)s")
+    warm_up()
+    if args.socket is not None:
+        server = UnixConversionServer(args.socket, args.max_requests,
+                                      args.max_request_size, args.cache_dir)
+        logging.info("Listening on %s", args.socket)
+    else:
+        server = ConversionServer(("127.0.0.1", args.port),
+                                  args.max_requests, args.max_request_size,
+                                  args.cache_dir)
+        logging.info("Listening on 127.0.0.1:%d", server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Startup benchmark of nspepi -e: runs a single expression conversion in a
+new interpreter a number of times and fails if the median time exceeds the
+latency budget.
+Dependency packages: None
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def median_run_time(cmd, runs, cwd):
+    """
+    Returns the median wall clock time of cmd in milliseconds.
+
+    Args:
+        cmd: command to run
+        runs: number of runs
+        cwd: directory to run the command in
+    """
+    times = []
+    with open(os.devnull, "w") as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(cmd, cwd=cwd, stdout=devnull)
+            times.append((time.time() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the startup time of nspepi -e.")
+    arg_parser.add_argument(
+        "-n", "--runs", type=int, default=20,
+        help="number of runs (default: 20)")
+    arg_parser.add_argument(
+        "-b", "--budget", type=float, default=100.0,
+        help="latency budget in milliseconds (default: 100)")
+    arg_parser.add_argument(
+        "-e", "--expression", default="req.tcp.destport == 80",
+        help="expression to convert (default: %(default)s)")
+    args = arg_parser.parse_args()
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "nspepi_main.py")
+    # The warn file of -e is written to the current directory.
+    work_dir = tempfile.mkdtemp()
+    try:
+        python_time = median_run_time([sys.executable, "-c", "pass"],
+                                      args.runs, work_dir)
+        nspepi_time = median_run_time(
+            [sys.executable, main_path, "-e", args.expression],
+            args.runs, work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+    print("python startup: {:.1f} ms".format(python_time))
+    print("nspepi -e:      {:.1f} ms (budget {:.1f} ms)".format(
+        nspepi_time, args.budget))
+    if nspepi_time > args.budget:
+        print("nspepi -e is over the latency budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Shared setup of the nspepi tests: the nspepi2 modules are imported as the
+tool imports them, from the nspepi2 directory.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+NSPEPI2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+if NSPEPI2_DIR not in sys.path:
+    sys.path.insert(0, NSPEPI2_DIR)
+
+
+class NspepiRun(object):
+    """
+    Result of an nspepi_main.py or config_check_main.py run.
+    returncode - exit status of the run
+    stdout - text written to the standard output
+    stderr - text written to the standard error
+    output - text written to both
+    """
+
+    def __init__(self, returncode, stdout, stderr):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.output = stdout + stderr
+
+
+@pytest.fixture
+def run_nspepi(tmp_path):
+    """
+    Runs nspepi_main.py with the given arguments in a temporary directory,
+    where the config files and warn files are, and returns an NspepiRun.
+    Keyword arguments:
+    stdin - bytes to write to the standard input
+    script - script to run instead of nspepi_main.py
+    """
+    def run(*args, **kwargs):
+        script = kwargs.get("script", "nspepi_main.py")
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(NSPEPI2_DIR, script)] +
+            list(args), cwd=str(tmp_path), stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate(kwargs.get("stdin", b""))
+        return NspepiRun(proc.returncode, stdout.decode("utf-8"),
+                         stderr.decode("utf-8"))
+    return run
+
+
+def helper_available():
+    """ Returns True if nspepi_helper can be run, Perl has Switch.pm. """
+    import nspepi_common
+    if nspepi_common.get_nspepi_tool_path() is None:
+        return False
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.call(["perl", "-MSwitch", "-e", "1"],
+                                   stdout=devnull, stderr=devnull) == 0
+    except OSError:
+        return False
@@ -0,0 +1,65 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Differential tests of classic_expr_translator against old nspepi tool
+(nspepi_helper).
+data/classic_expr_corpus.jsonl has one {"expression", "output"} object per
+line, output being what "perl nspepi_helper -e <expression>" prints.
+"""
+
+import io
+import json
+import os
+
+import pytest
+
+from conftest import DATA_DIR, helper_available
+import classic_expr_translator
+import nspepi_common as common
+
+
+def load_corpus():
+    """ Returns the (expression, helper output) pairs of the corpus. """
+    path = os.path.join(DATA_DIR, "classic_expr_corpus.jsonl")
+    with io.open(path, encoding="utf-8") as corpus:
+        return [(entry["expression"], entry["output"])
+                for entry in map(json.loads, corpus)]
+
+
+def test_translate_matches_corpus():
+    """ translate() gives the recorded helper output for the corpus. """
+    mismatches = []
+    for expr, output in load_corpus():
+        translated = classic_expr_translator.translate(expr)
+        if translated != output:
+            mismatches.append((expr, output, translated))
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("expr", [
+    u"REQ.HTTP.URL == /caf\u00e9",
+    "REQ.IP.SOURCEIP == 10.0.0.0 -netmask 255.255.255.255",
+    "REQ.TCP.DESTPORT == 1-99999999999999999999",
+])
+def test_translate_leaves_to_helper(expr):
+    """ Expressions whose helper output cannot be reproduced exactly. """
+    assert classic_expr_translator.translate(expr) is None
+
+
+@pytest.mark.skipif(not helper_available(),
+                    reason="perl with Switch.pm is needed for nspepi_helper")
+def test_translate_matches_helper():
+    """ translate() gives the output of the helper run now. """
+    helper = common.NspepiHelper(common.get_nspepi_tool_path())
+    mismatches = []
+    try:
+        for expr, _ in load_corpus():
+            output = helper.run(expr).decode("utf-8")
+            translated = classic_expr_translator.translate(expr)
+            if translated is not None and translated != output:
+                mismatches.append((expr, output, translated))
+    finally:
+        helper.close()
+    assert mismatches == []
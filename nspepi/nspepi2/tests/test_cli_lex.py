@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of the command header scan in cli_lex, which decides which lines
+are parsed, against the parser.
+"""
+
+import io
+import logging
+import re
+
+import pytest
+
+import cli_lex
+import cli_yacc
+import handler_manifest
+import nspepi_input
+
+HEADER_LINES = [
+    u"add lb vserver v1 HTTP 1.1.1.1 80",
+    u"  ADD   LB\tVserver v1 HTTP 1.1.1.2 80   ",
+    u"add\tserver\ts1\t10.1.1.1",
+    u"set ns param -timezone GMT",
+    u"add lb monitor m1 HTTP -respCode 200",
+    u"bind lb vserver v1 -policyName p1 -priority 10",
+    u"enable ns feature LB CS",
+    u"add lb",
+    u"clear config",
+    u"save",
+    u"   ",
+    u"",
+    u"# add lb vserver v2 HTTP",
+    u"#add cmp policy p1",
+    # quotes and parentheses
+    u'add cmp policy p1 -rule "REQ.HTTP.URL == /a" -resAction COMPRESS',
+    u"add responder policy p2 'REQ.IS_VALID' DROP",
+    u"add rewrite action a1 replace (a) b",
+    u'add lb vserver v2 HTTP 1.1.1.3 80 -comment "say \\"hi\\""',
+    u'# comment with a "quote"',
+    # q quotes
+    u"q/add/ lb vserver v3",
+    u"add q{lb} vserver v3",
+    u"add lb q|vserver| v3",
+    u"add policy expression e1 q/REQ.IS_VALID/",
+    u"add qa vserver v3",
+    u"add lb qvserver v3",
+    # keywords in words 1, 2 and 3
+    u"-add lb vserver v4",
+    u"add -lb vserver v4",
+    u"show ns -summary",
+    u"add lb -x",
+    u"show -x y",
+    # comments in words 2 and 3
+    u"add #lb vserver",
+    u"add lb #vserver",
+    u"add lb vserver#x v5",
+    # non-ASCII text
+    u"add lb vserver café HTTP 1.1.1.4 80",
+    u"add lb vsérver v6 HTTP",
+    u"add lb v\u212aserver v7",
+    u"add \u0130b vserver v8",
+    u"add server éé 10.1.1.2",
+]
+
+
+@pytest.fixture(params=[False, True], ids=["default", "ply"])
+def parser(request):
+    """ Sets up the dedicated CLI parser or the PLY parser. """
+    if request.param:
+        pytest.importorskip("ply")
+    saved = cli_yacc.use_ply, cli_yacc._lexer, cli_yacc._parser
+    cli_yacc.use_ply = request.param
+    cli_yacc.cli_yacc_init()
+    yield
+    cli_yacc.use_ply, cli_yacc._lexer, cli_yacc._parser = saved
+
+
+def parsed_command_type(line):
+    """ Returns the command type of a line as the handlers get it. """
+    tree = cli_yacc.cli_yacc_parse(line + u"\n", 1)
+    if tree is None:
+        return u""
+    return u" ".join(tree.get_command_type()).lower()
+
+
+@pytest.mark.parametrize("line", HEADER_LINES)
+def test_header_key_matches_parser(line, parser, caplog):
+    """
+    A command type known from the first words is the one of the parse
+    tree, and the parser logs no errors.
+    """
+    key = cli_lex.command_header_key(line + u"\n")
+    if key is None:
+        return
+    with caplog.at_level(logging.DEBUG):
+        assert parsed_command_type(line) == key
+    assert [r for r in caplog.records if r.levelno >= logging.WARNING] == []
+
+
+def test_header_key_needs_parser():
+    """ Lines with quotes, q quotes or keywords are left to the parser. """
+    for line in [u'add cmp policy p1 -rule "REQ.IS_VALID"',
+                 u"add responder policy p2 'REQ.IS_VALID' DROP",
+                 u"add rewrite action a1 replace (a) b",
+                 u"q/add/ lb vserver v3", u"add lb q|vserver| v3",
+                 u"-add lb vserver v4", u"add -lb vserver v4", u"save",
+                 u"add #lb vserver"]:
+        assert cli_lex.command_header_key(line) is None, line
+
+
+def test_scan_patterns_find_header_lines(tmp_path):
+    """
+    The lines found by the scan patterns in a mapped config are the lines
+    whose command type is unknown or has a handler, and the lines with a
+    quote, a parenthesis or a non-ASCII character.
+    """
+    command_types = set(handler_manifest.COMMAND_HANDLERS)
+    path = str(tmp_path / "ns.conf")
+    lines = [u"add ns ip 10.1.1.1 255.255.255.0"] + HEADER_LINES
+    with io.open(path, "w", encoding="utf-8") as config:
+        config.write(u"".join(line + u"\n" for line in lines))
+    mapped = nspepi_input.MappedConfig.open(path)
+    if mapped is None:
+        pytest.skip("config file cannot be mapped with this locale")
+    with mapped:
+        found = [line.rstrip(u"\n") for _, line, _, _ in mapped.lines(
+            cli_lex.header_scan_patterns(command_types))]
+    special_re = re.compile(u"[\"'()\u0080-\U0010ffff]")
+    expected = [lines[0]] + [
+        line for line in HEADER_LINES
+        if cli_lex.command_header_key(line + u"\n") in command_types or
+        cli_lex.command_header_key(line + u"\n") is None or
+        special_re.search(line) is not None]
+    assert found == expected
@@ -0,0 +1,72 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of CLI command parsing with the dedicated parser and with PLY.
+"""
+
+import logging
+
+import pytest
+
+INVALID_CONFIG = "add server s1 10.1.1.1\n-foo bar\n"
+
+
+@pytest.mark.parametrize("parser_args", [[], ["--usePly"]],
+                         ids=["default", "ply"])
+def test_invalid_line_is_logged(run_nspepi, tmp_path, parser_args):
+    """ A syntax error is logged and the line is output unchanged. """
+    if parser_args:
+        pytest.importorskip("ply")
+    (tmp_path / "f.conf").write_text(INVALID_CONFIG)
+    result = run_nspepi("-f", "f.conf", *parser_args)
+    assert result.returncode == 0, result.output
+    assert "Traceback" not in result.output
+    assert (tmp_path / "new_f.conf").read_text() == INVALID_CONFIG
+    assert "CLI syntax error at foo" in (tmp_path / "warn_f.conf").read_text()
+
+
+def test_ply_syntax_error_token(monkeypatch, caplog):
+    """
+    PLY sets the lexer of the token of a syntax error before the error
+    is reported, and the line parses to no command.
+    """
+    pytest.importorskip("ply")
+    import cli_lex
+    import cli_yacc
+    monkeypatch.setattr(cli_yacc, "use_ply", True)
+    monkeypatch.setattr(cli_yacc, "_lexer", None)
+    monkeypatch.setattr(cli_yacc, "_parser", None)
+    cli_yacc.cli_yacc_init()
+    error_tokens = []
+
+    def errorfunc(token):
+        error_tokens.append(token)
+        cli_yacc.p_error(token)
+    monkeypatch.setattr(cli_yacc._ply_parser, "errorfunc", errorfunc)
+    with caplog.at_level(logging.ERROR):
+        assert cli_yacc.cli_yacc_parse("-foo bar\n", 1) is None
+    assert len(error_tokens) == 1
+    assert isinstance(error_tokens[0], cli_lex.LexToken)
+    assert error_tokens[0].value == "foo"
+    assert error_tokens[0].lexer is cli_yacc._lexer
+    assert [record.getMessage() for record in caplog.records] == [
+        "CLI syntax error at foo"]
+
+
+def test_ply_missing(monkeypatch):
+    """ --usePly without PLY installed exits with a message. """
+    import sys
+    import cli_yacc
+    monkeypatch.setitem(sys.modules, "ply", None)
+    monkeypatch.setitem(sys.modules, "ply.yacc", None)
+    monkeypatch.setattr(cli_yacc, "use_ply", True)
+    monkeypatch.setattr(cli_yacc, "_lexer", None)
+    monkeypatch.setattr(cli_yacc, "_parser", None)
+    monkeypatch.setattr(cli_yacc, "_ply_parser", None)
+    with pytest.raises(SystemExit) as exc_info:
+        cli_yacc.cli_yacc_init()
+    assert str(exc_info.value) == ("As required module PLY is not present,"
+                                   " we can't run the NSPEPI tool with"
+                                   " --usePly")
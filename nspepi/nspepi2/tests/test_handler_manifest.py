@@ -0,0 +1,25 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of the converter module manifest in handler_manifest.
+"""
+
+import handler_manifest
+
+
+def test_manifest_up_to_date():
+    """ The manifest has the module of every handler. """
+    assert handler_manifest.check_manifest() == []
+
+
+def test_missing_command_reported(monkeypatch):
+    """ A command missing from the manifest is reported. """
+    command_handlers = dict(handler_manifest.COMMAND_HANDLERS)
+    del command_handlers["add responder policy"]
+    monkeypatch.setattr(handler_manifest, "COMMAND_HANDLERS",
+                        command_handlers)
+    assert handler_manifest.check_manifest() == [
+        "command \"add responder policy\" is handled by"
+        " ['convert_responder_command'], manifest has []"]
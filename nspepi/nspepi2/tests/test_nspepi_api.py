@@ -0,0 +1,93 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of the library API in nspepi_api.
+"""
+
+import threading
+
+import check_classic_configs
+import convert_cli_commands
+import nspepi_api
+import nspepi_common as common
+
+# Defines the named expression e1 and uses it.
+DEFINES_E1 = (
+    'add policy expression e1 "REQ.HTTP.URL == /a"\n'
+    'add cmp policy p1 -rule "e1 && REQ.HTTP.METHOD == GET"'
+    ' -resAction COMPRESS\n'
+)
+
+# Uses e1 without defining it.
+USES_E1 = (
+    'add cmp policy p2 -rule "e1 || REQ.HTTP.METHOD == GET"'
+    ' -resAction COMPRESS\n'
+)
+
+CONFIGS = [
+    DEFINES_E1,
+    USES_E1,
+    'add lb vserver v1 HTTP 1.1.1.1 80 -rule "REQ.HTTP.METHOD == GET"\n'
+    'add filter policy f1 -rule "REQ.HTTP.URL == /b" -reqAction RESET\n'
+    'bind lb vserver v1 -policyName f1 -priority 10\n',
+    'add responder policy r1 "REQ.HTTP.URL == /c" DROP\n'
+    'bind responder global r1 10 END\n',
+]
+
+
+def test_named_expression_does_not_leak():
+    """ A named expression of one config is not known to the next. """
+    before = nspepi_api.convert_config(USES_E1)
+    defined = nspepi_api.convert_config(DEFINES_E1)
+    after = nspepi_api.convert_config(USES_E1)
+    assert "nspepi_adv_e1" in defined.output
+    assert after.output == before.output
+    assert after.messages == before.messages
+    assert '"e1 || HTTP.REQ.METHOD.EQ(GET)"' in after.output
+
+
+def test_context_keeps_its_state():
+    """ The result context has the named expressions of its config. """
+    defined = nspepi_api.convert_config(DEFINES_E1)
+    after = nspepi_api.convert_config(USES_E1)
+    assert "e1" in defined.context.get(convert_cli_commands, "named_expr")
+    assert "e1" not in after.context.get(convert_cli_commands, "named_expr")
+
+
+def test_check_configs_state_registered():
+    """ A new context has its own config check state. """
+    context = common.ConversionContext()
+    assert context.get(check_classic_configs, "named_expr") is None
+    assert context.get(check_classic_configs, "build_version") is None
+
+
+def test_expression_between_configs():
+    """ Expression conversions do not see the named expressions. """
+    nspepi_api.convert_config(DEFINES_E1)
+    result = nspepi_api.convert_expression("REQ.HTTP.URL == /a")
+    assert result.output == ('"HTTP.REQ.URL.PATH.EQ((\\"/a.\\" +'
+                             ' HTTP.REQ.URL.SUFFIX).STRIP_END_CHARS(\\".\\"))"')
+    assert result.messages == []
+
+
+def test_concurrent_calls():
+    """ Configs converted from several threads match serial runs. """
+    expected = [nspepi_api.convert_config(config) for config in CONFIGS]
+    results = {}
+
+    def convert(index):
+        results[index] = nspepi_api.convert_config(
+            CONFIGS[index % len(CONFIGS)])
+    threads = [threading.Thread(target=convert, args=(index,))
+               for index in range(4 * len(CONFIGS))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for index, result in sorted(results.items()):
+        serial = expected[index % len(CONFIGS)]
+        assert result.output == serial.output
+        assert result.messages == serial.messages
+    assert len(results) == len(threads)
@@ -0,0 +1,95 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Round-trip tests of nspepi_codec on random values.
+"""
+
+import random
+
+import pytest
+
+import cli_lex
+import nspepi_codec
+
+# Characters of the random values, with the ones that need quoting or
+# escaping more likely than others.
+_value_chars = ("abcXYZ019-#q/{.:*_ " * 3 + "\t\r\n\"'\\()" +
+                nspepi_codec.qquote_delims)
+_rounds = 5000
+# Escapes of a string literal other than hex and octal ones
+_named_escapes = {"\t": "t", "\r": "r", "\n": "n",
+                  "\"": "\"", "'": "'", "\\": "\\"}
+
+
+def random_value(rng, max_len=20):
+    """ Returns a random value of up to max_len characters. """
+    return "".join(rng.choice(_value_chars)
+                   for _ in range(rng.randint(0, max_len)))
+
+
+def lex_cli_value(text):
+    """ Returns the tokens of text as the last argument of a command. """
+    lexer = cli_lex.Lexer()
+    lexer.input("add " + text)
+    lexer.token()
+    tokens = []
+    while True:
+        token = lexer.token()
+        if token is None:
+            return tokens
+        tokens.append((token.type, token.value))
+
+
+def pi_literal(rng, value):
+    """ Returns a string literal for value, escaping characters at random. """
+    pieces = ['"']
+    for ch in value:
+        choice = rng.randint(0, 3)
+        if choice == 0 and ch not in "\"\\":
+            pieces.append(ch)
+        elif choice == 1 and ch in _named_escapes:
+            pieces.append("\\" + _named_escapes[ch])
+        elif choice == 2:
+            pieces.append("\\%03o" % ord(ch))
+        else:
+            pieces.append("\\x%02x" % ord(ch))
+    pieces.append('"')
+    return "".join(pieces)
+
+
+@pytest.mark.parametrize("make_str", [False, True])
+def test_quote_cli_value_round_trip(make_str):
+    """ A quoted value is read back by the CLI lexer as one argument. """
+    rng = random.Random(make_str)
+    for _ in range(_rounds):
+        value = random_value(rng)
+        quoted = nspepi_codec.quote_cli_value(value, make_str)
+        assert lex_cli_value(quoted) == [("NON_KEY", value)], quoted
+        if make_str:
+            assert quoted.startswith('"')
+
+
+def test_quote_cli_value_unquoted():
+    """ Values without special characters are left as they are. """
+    for value in ("lb_vserver1", "10.1.1.1", "HTTP.REQ.URL.EQ", "q"):
+        assert nspepi_codec.quote_cli_value(value) == value
+
+
+def test_decode_pi_string_round_trip():
+    """ A string literal decodes to its value and its length. """
+    rng = random.Random(1)
+    for _ in range(_rounds):
+        value = random_value(rng)
+        literal = pi_literal(rng, value)
+        rest = rng.choice(["", ".EQ(1)", ' + "x"'])
+        assert (nspepi_codec.decode_pi_string(literal + rest) ==
+                [value, len(literal)]), literal
+
+
+@pytest.mark.parametrize("expr", [
+    'abc"', '"abc', '"abc\\', '"\\q"', '"\\x4"', '"\\x80"', '"\\200"',
+])
+def test_decode_pi_string_invalid(expr):
+    assert nspepi_codec.decode_pi_string(expr) is None
@@ -0,0 +1,107 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of the old nspepi tool handling in nspepi_common.
+"""
+
+import errno
+import logging
+import logging.handlers
+import os
+import subprocess
+import threading
+
+import pytest
+
+from conftest import helper_available
+import nspepi_common as common
+
+
+@pytest.fixture
+def disk_cache():
+    """ Closes the on-disk cache opened by a test. """
+    yield
+    if common.nspepi_tool_disk_cache is not None:
+        common.nspepi_tool_disk_cache.close()
+        common.nspepi_tool_disk_cache = None
+
+
+def test_disk_cache_directory_created_concurrently(tmp_path, monkeypatch,
+                                                   disk_cache):
+    """
+    The cache is used when another run creates its directory between the
+    check for the directory and its creation.
+    """
+    pytest.importorskip("sqlite3")
+    cache_dir = str(tmp_path / "cache")
+    makedirs = os.makedirs
+
+    def makedirs_after_other_run(path, *args, **kwargs):
+        makedirs(path)
+        raise OSError(errno.EEXIST, "File exists", path)
+    monkeypatch.setattr(os, "makedirs", makedirs_after_other_run)
+    common.open_nspepi_tool_disk_cache(cache_dir, close_at_exit=False)
+    assert common.nspepi_tool_disk_cache is not None
+
+
+def test_disk_cache_existing_directory(tmp_path, disk_cache):
+    pytest.importorskip("sqlite3")
+    common.open_nspepi_tool_disk_cache(str(tmp_path), close_at_exit=False)
+    assert common.nspepi_tool_disk_cache is not None
+
+
+@pytest.mark.skipif(not helper_available(),
+                    reason="nspepi_helper needs Perl with Switch.pm")
+def test_helper_warnings_match_single_runs():
+    """
+    The warnings of expressions converted by one helper process are those
+    of a helper run for each expression, without the input line number.
+    """
+    tool_path = common.get_nspepi_tool_path()
+    exprs = [
+        "REQ.HTTP.URL == /a",
+        "REQ.IP.SOURCEIP == 10.0.0.0 -netmask 255.255.255.255",
+        "REQ.HTTP.METHOD == GET",
+        "REQ.IP.SOURCEIP == 10.0.0.0 -netmask 255.255.255.255",
+    ]
+    helper = common.NspepiHelper(tool_path)
+    try:
+        for expr in exprs:
+            proc = subprocess.Popen(["perl", tool_path, "-e", expr],
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            assert helper.run(expr) == proc.communicate()[0]
+    finally:
+        helper.close()
+
+
+def test_log_buffer_keeps_own_thread_records():
+    """
+    Records of the thread that started the buffer are kept, records of
+    other threads are logged by the root handlers.
+    """
+    root = logging.getLogger()
+    handler = logging.handlers.BufferingHandler(100)
+    saved_handlers, saved_level = root.handlers, root.level
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+    try:
+        log_buffer = common.LogRecordBuffer()
+        log_buffer.start()
+        try:
+            logging.warning("converting")
+            other = threading.Thread(target=logging.info,
+                                     args=("access log",))
+            other.start()
+            other.join()
+        finally:
+            log_buffer.stop()
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+    assert [record.getMessage() for record in log_buffer.take()] == [
+        "converting"]
+    assert [record.getMessage() for record in handler.buffer] == [
+        "access log"]
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of config input in nspepi_input: mapped configs, compressed configs
+and the standard input.
+"""
+
+import bz2
+import gzip
+
+import pytest
+
+import nspepi_input
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# Converted lines between lines copied as they are, with non-ASCII text.
+CONFIG = (
+    u"add ns ip 10.1.1.1 255.255.255.0\n"
+    u'add lb vserver v1 HTTP 1.1.1.1 80 -rule "REQ.HTTP.METHOD == GET"\n'
+    u"add server café 10.1.1.2\n"
+    u"set ns param -timezone GMT\n"
+    u'add cmp policy p1 -rule "REQ.HTTP.URL == /a" -resAction COMPRESS\n'
+    u"bind lb vserver v1 café\n"
+)
+
+CONVERTED_CONFIG = (
+    u"add ns ip 10.1.1.1 255.255.255.0\n"
+    u'add lb vserver v1 HTTP 1.1.1.1 80 -rule "HTTP.REQ.METHOD.EQ(GET)"\n'
+    u"add server café 10.1.1.2\n"
+    u"set ns param -timezone GMT\n"
+    u'add cmp policy p1 -rule "HTTP.REQ.URL.PATH.EQ((\\"/a.\\" +'
+    u' HTTP.REQ.URL.SUFFIX).STRIP_END_CHARS(\\".\\"))" -resAction COMPRESS\n'
+    u"bind lb vserver v1 café\n"
+)
+
+# Converted with an error logged to the warn file.
+WARN_CONFIG = (
+    u'add policy expression e1 "REQ.HTTP.URL == /a || e1"\n'
+    u'add lb vserver v1 HTTP 1.1.1.1 80 -rule "REQ.HTTP.METHOD == GET"\n'
+)
+
+CONVERTED_WARN_CONFIG = (
+    u'add policy expression e1 "REQ.HTTP.URL == /a || e1"\n'
+    u'add lb vserver v1 HTTP 1.1.1.1 80 -rule "HTTP.REQ.METHOD.EQ(GET)"\n'
+)
+
+# Config with commands that config_check_main reports.
+CHECKED_CONFIG = (
+    u"enable ns feature LB SC\n"
+    u"add lb vserver v1 HTTP 1.1.1.1 80\n"
+    u'add cmp policy p1 -rule "REQ.HTTP.URL == /a" -resAction COMPRESS\n'
+)
+
+ISSUES = (
+    u"enable ns feature LB SC\n"
+    u'add cmp policy p1 -rule "REQ.HTTP.URL == /a" -resAction COMPRESS\n'
+)
+
+
+def compress(data, suffix):
+    """ Returns data compressed in the format of a file name suffix. """
+    if suffix == ".gz":
+        return gzip.compress(data)
+    if suffix == ".bz2":
+        return bz2.compress(data)
+    if suffix == ".xz":
+        if lzma is None:
+            pytest.skip("lzma is not available")
+        return lzma.compress(data)
+    return data
+
+
+def mapped_lines(path, patterns=None):
+    """ Returns the lines of a mapped config, or None if not mapped. """
+    mapped = nspepi_input.MappedConfig.open(str(path))
+    if mapped is None:
+        return None
+    with mapped:
+        return list(mapped.lines(patterns))
+
+
+def test_mapped_lines(tmp_path):
+    """ Lines have their line numbers and the offsets of their bytes. """
+    path = tmp_path / "ns.conf"
+    data = CONFIG.encode("utf-8")
+    path.write_bytes(data)
+    lines = mapped_lines(path)
+    if lines is None:
+        pytest.skip("config file cannot be mapped with this locale")
+    assert [line for _, line, _, _ in lines] == CONFIG.splitlines(True)
+    assert [lineno for lineno, _, _, _ in lines] == list(range(1, 7))
+    for _, line, start, end in lines:
+        assert data[start:end] == line.encode("utf-8")
+
+
+def test_mapped_last_line_without_newline(tmp_path):
+    path = tmp_path / "ns.conf"
+    path.write_bytes(b"add ns ip 10.1.1.1 255.255.255.0\nsave ns config")
+    lines = mapped_lines(path)
+    if lines is None:
+        pytest.skip("config file cannot be mapped with this locale")
+    assert lines[-1] == (2, u"save ns config", 33, 47)
+
+
+@pytest.mark.parametrize("data", [b"add ns ip 10.1.1.1 255.255.255.0\r\n",
+                                  b"add server s1 10.1.1.2\rsave\n",
+                                  b"\x1f\x8b\x08\x00", b""])
+def test_not_mapped(tmp_path, data):
+    """
+    Configs with carriage returns, compressed configs and empty configs
+    are read as files.
+    """
+    path = tmp_path / "ns.conf"
+    path.write_bytes(data)
+    assert nspepi_input.MappedConfig.open(str(path)) is None
+
+
+@pytest.mark.parametrize("data, expected", [
+    (CONFIG, CONVERTED_CONFIG),
+    (CONFIG[:-1], CONVERTED_CONFIG[:-1]),
+    (CONFIG.replace(u"\n", u"\r\n"), CONVERTED_CONFIG),
+    (CONFIG + u"add ns ip 10.1.1.3 255.255.255.0",
+     CONVERTED_CONFIG + u"add ns ip 10.1.1.3 255.255.255.0"),
+], ids=["newline", "no-newline", "crlf", "unconverted-last"])
+def test_mapped_and_verbose_output(run_nspepi, tmp_path, data, expected):
+    """
+    The config is converted to the same output when it is mapped, and
+    when it is read as a file as with -v.
+    """
+    (tmp_path / "ns.conf").write_bytes(data.encode("utf-8"))
+    for args in [[], ["-v"]]:
+        result = run_nspepi("-f", "ns.conf", *args)
+        assert result.returncode == 0, result.output
+        assert (tmp_path / "new_ns.conf").read_bytes() == \
+            expected.encode("utf-8")
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".bz2", ".xz"])
+def test_compressed_config(run_nspepi, tmp_path, suffix):
+    """
+    A compressed config is converted to new_<config> and warn_<config>
+    without the compression suffix.
+    """
+    (tmp_path / ("ns.conf" + suffix)).write_bytes(
+        compress(WARN_CONFIG.encode("utf-8"), suffix))
+    result = run_nspepi("-f", "ns.conf" + suffix)
+    assert result.returncode == 0, result.output
+    assert (tmp_path / "new_ns.conf").read_text() == CONVERTED_WARN_CONFIG
+    assert "circular reference" in (tmp_path / "warn_ns.conf").read_text()
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz", ".bz2", ".xz"])
+def test_stdin_config(run_nspepi, tmp_path, suffix):
+    """
+    A config read from the standard input, compressed or not, is written
+    to the standard output, with the messages on the standard error and
+    the warnings in warn_stdin.
+    """
+    result = run_nspepi("-f", "-", stdin=compress(
+        WARN_CONFIG.encode("utf-8"), suffix))
+    assert result.returncode == 0, result.output
+    assert result.stdout == CONVERTED_WARN_CONFIG
+    assert "Check warn_stdin file" in result.stderr
+    assert "circular reference" in (tmp_path / "warn_stdin").read_text()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "warn_stdin"]
+
+
+def test_config_to_stdout(run_nspepi, tmp_path):
+    """ -o - writes the converted config to the standard output. """
+    (tmp_path / "ns.conf").write_text(WARN_CONFIG)
+    result = run_nspepi("-f", "ns.conf", "-o", "-")
+    assert result.returncode == 0, result.output
+    assert result.stdout == CONVERTED_WARN_CONFIG
+    assert not (tmp_path / "new_ns.conf").exists()
+    assert "circular reference" in (tmp_path / "warn_ns.conf").read_text()
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_config_check_stdin(run_nspepi, tmp_path, suffix):
+    """
+    config_check_main writes the same issues for a config read from the
+    standard input, to the standard output, as for a config file.
+    """
+    data = compress(CHECKED_CONFIG.encode("utf-8"), suffix)
+    (tmp_path / ("ns.conf" + suffix)).write_bytes(data)
+    result = run_nspepi("-f", "ns.conf" + suffix,
+                        script="config_check_main.py")
+    assert result.returncode == 0, result.output
+    assert (tmp_path / "issues_ns.conf").read_text() == ISSUES
+    result = run_nspepi("-f", "-", stdin=data, script="config_check_main.py")
+    assert result.returncode == 0, result.output
+    assert result.stdout == ISSUES
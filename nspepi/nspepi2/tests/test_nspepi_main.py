@@ -0,0 +1,69 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of config conversion with nspepi_main.py.
+"""
+
+CLASSIC_CONFIG = (
+    'add cmp policy p1 -rule "REQ.HTTP.URL == /a" -resAction COMPRESS\n'
+    'add lb vserver v1 HTTP 1.1.1.1 80 -rule "REQ.HTTP.METHOD == GET"\n'
+    'bind lb vserver v1 -policyName p1 -priority 10 -type RESPONSE\n'
+)
+
+CONVERTED_CONFIG = (
+    'add cmp policy p1 -rule "HTTP.REQ.URL.PATH.EQ((\\"/a.\\" +'
+    ' HTTP.REQ.URL.SUFFIX).STRIP_END_CHARS(\\".\\"))" -resAction COMPRESS\n'
+    'add lb vserver v1 HTTP 1.1.1.1 80 -rule "HTTP.REQ.METHOD.EQ(GET)"\n'
+    'bind lb vserver v1 -policyName p1 -priority 10 -type RESPONSE'
+    ' -gotoPriorityExpression END\n'
+)
+
+
+def test_classic_expressions_converted(run_nspepi, tmp_path):
+    """ Classic policy rules and vserver rules are converted. """
+    (tmp_path / "ns.conf").write_text(CLASSIC_CONFIG)
+    result = run_nspepi("-f", "ns.conf")
+    assert result.returncode == 0, result.output
+    assert "Traceback" not in result.output
+    assert (tmp_path / "new_ns.conf").read_text() == CONVERTED_CONFIG
+
+
+def test_named_expression_cycle_reported_once(run_nspepi, tmp_path):
+    """ A named expression using itself twice is reported once. """
+    (tmp_path / "ns.conf").write_text(
+        'add policy expression e1 "REQ.HTTP.URL == /a || e1 || e1"\n'
+        'add cmp policy p1 -rule "e1" -resAction COMPRESS\n')
+    result = run_nspepi("-f", "ns.conf")
+    assert result.returncode == 0, result.output
+    errors = [line.split(" ERROR - ", 1)[1]
+              for line in (tmp_path / "warn_ns.conf").read_text().splitlines()
+              if " ERROR - " in line]
+    assert errors == ["Line(1): Named expressions e1 -> e1 have a circular"
+                      " reference (lines 1)"]
+
+
+def test_deep_named_expression_chain(run_nspepi, tmp_path):
+    """
+    All named expressions of a chain of 3000 used by a policy are
+    converted, without reaching the recursion limit.
+    """
+    lines = ['add policy expression e0 "REQ.HTTP.URL == /a"\n']
+    for i in range(1, 3000):
+        lines.append('add policy expression e{} "e{} ||'
+                     ' REQ.HTTP.METHOD == GET"\n'.format(i, i - 1))
+    lines.append('add cmp policy p1 -rule "e2999" -resAction COMPRESS\n')
+    (tmp_path / "ns.conf").write_text("".join(lines))
+    result = run_nspepi("-f", "ns.conf")
+    assert result.returncode == 0, result.output
+    assert "RecursionError" not in result.output
+    new_lines = (tmp_path / "new_ns.conf").read_text().splitlines()
+    assert new_lines[-2:] == [
+        'add policy expression nspepi_adv_e2999 "nspepi_adv_e2998 ||'
+        ' HTTP.REQ.METHOD.EQ(GET)"',
+        'add cmp policy p1 -rule nspepi_adv_e2999 -resAction COMPRESS']
+    advanced_names = [line.split()[3] for line in new_lines
+                      if line.startswith("add policy expression nspepi_adv_")]
+    assert advanced_names == ["nspepi_adv_e{}".format(i)
+                              for i in range(3000)]
@@ -0,0 +1,118 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of the converted config output in nspepi_output.
+"""
+
+import io
+import time
+
+import pytest
+
+from conftest import NSPEPI2_DIR
+import nspepi_output
+
+OLD_OUTPUT = "add lb vserver v0 HTTP 1.1.1.1 80\n"
+
+CONFIG = (
+    'add lb vserver v1 HTTP 1.1.1.1 80 -rule "REQ.HTTP.METHOD == GET"\n'
+    'add server s1 10.1.1.2\n'
+)
+
+# Runs nspepi_main with a conversion that fails after writing its input.
+FAILING_MAIN = """
+import sys
+sys.path.insert(0, {nspepi2_dir!r})
+import nspepi_main
+
+
+def convert_config_file(infile, outfile, verbose):
+    for line in infile:
+        outfile.write(line)
+        if outfile.echo is not None:
+            outfile.echo.write(line)
+    outfile.flush()
+    raise RuntimeError("conversion failed")
+
+
+nspepi_main.convert_config_file = convert_config_file
+nspepi_main.main()
+"""
+
+
+class SlowStream(io.StringIO):
+    """ Console that takes a while for each write. """
+
+    def write(self, text):
+        time.sleep(0.01)
+        return io.StringIO.write(self, text)
+
+
+def test_commit_replaces_output(tmp_path):
+    path = tmp_path / "new_ns.conf"
+    path.write_text(OLD_OUTPUT)
+    with nspepi_output.OutputFile(str(path), buffer_size=8) as outfile:
+        outfile.write(CONFIG)
+        outfile.write("save ns config\n")
+        assert path.read_text() == OLD_OUTPUT
+    assert path.read_text() == CONFIG + "save ns config\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["new_ns.conf"]
+
+
+def test_exception_keeps_output(tmp_path):
+    """
+    An exception during the conversion leaves the earlier output as it
+    was, and removes the temporary file.
+    """
+    path = tmp_path / "new_ns.conf"
+    path.write_text(OLD_OUTPUT)
+    with pytest.raises(RuntimeError):
+        with nspepi_output.OutputFile(str(path), buffer_size=8) as outfile:
+            outfile.write(CONFIG)
+            assert len(list(tmp_path.glob("*.tmp"))) == 1
+            raise RuntimeError("conversion failed")
+    assert path.read_text() == OLD_OUTPUT
+    assert [p.name for p in tmp_path.iterdir()] == ["new_ns.conf"]
+
+
+@pytest.mark.parametrize("args", [[], ["-v"]], ids=["mapped", "verbose"])
+def test_failed_conversion_keeps_output(run_nspepi, tmp_path, args):
+    """
+    nspepi leaves the new_ file of an earlier run when the conversion
+    fails, and no temporary file.
+    """
+    (tmp_path / "ns.conf").write_text(CONFIG)
+    (tmp_path / "new_ns.conf").write_text(OLD_OUTPUT)
+    script = tmp_path / "failing_main.py"
+    script.write_text(FAILING_MAIN.format(nspepi2_dir=NSPEPI2_DIR))
+    result = run_nspepi("-f", "ns.conf", *args, script=str(script))
+    assert result.returncode != 0
+    assert "RuntimeError: conversion failed" in result.stderr
+    assert (tmp_path / "new_ns.conf").read_text() == OLD_OUTPUT
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_console_echo_writes_all_lines():
+    """ close() returns once every line is on a slow console. """
+    stream = SlowStream()
+    echo = nspepi_output.ConsoleEcho(stream, prefix="> ")
+    lines = ["add server s{0} 10.1.1.{0}\n".format(i) for i in range(200)]
+    for line in lines:
+        echo.write(line)
+    echo.close()
+    assert stream.getvalue() == "".join("> " + line for line in lines)
+
+
+def test_output_file_closes_echo(tmp_path):
+    """ Lines echoed by an output file are written once it commits. """
+    stream = SlowStream()
+    echo = nspepi_output.ConsoleEcho(stream, prefix="")
+    with nspepi_output.OutputFile(str(tmp_path / "new_ns.conf"),
+                                  echo) as outfile:
+        for line in CONFIG.splitlines(True):
+            outfile.write(line)
+            outfile.echo.write(line)
+    assert outfile.echo is None
+    assert stream.getvalue() == CONFIG
@@ -0,0 +1,125 @@
+# Copyright 2021-2024 Citrix Systems, Inc.  All rights reserved.
+# Use of this software is governed by the license terms, if any,
+# which accompany or are included with this software.
+
+"""
+Tests of the conversion server in nspepi_server.
+"""
+
+import json
+import threading
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    # Python 2
+    from httplib import HTTPConnection
+
+import pytest
+
+import nspepi_api
+import nspepi_server
+
+
+@pytest.fixture
+def server():
+    """ Serves conversions on a free localhost port. """
+    server = nspepi_server.ConversionServer(("127.0.0.1", 0), 2, 4096)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def post(server, path, body):
+    """
+    Sends a request to the server, and returns the status and the JSON
+    object of the response.
+    body - JSON object, or bytes sent as they are
+    """
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+    connection = HTTPConnection("127.0.0.1", server.server_address[1],
+                                timeout=30)
+    try:
+        connection.request("POST", path, body,
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        connection.close()
+
+
+def test_expression(server):
+    status, reply = post(server, "/expression",
+                         {"expression": "REQ.HTTP.METHOD == GET"})
+    assert status == 200
+    assert reply == {"output": '"HTTP.REQ.METHOD.EQ(GET)"', "messages": []}
+
+
+def test_config(server):
+    status, reply = post(server, "/config", {
+        "config": 'add lb vserver v1 HTTP 1.1.1.1 80'
+                  ' -rule "REQ.HTTP.METHOD == GET"\n',
+        "name": "lb.conf"})
+    assert status == 200
+    assert reply == {"output": 'add lb vserver v1 HTTP 1.1.1.1 80'
+                               ' -rule "HTTP.REQ.METHOD.EQ(GET)"\n',
+                     "messages": []}
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/expression", b"{not json"),
+    ("/expression", b"[1]"),
+    ("/expression", {"expression": 1}),
+    ("/expression", {"expression": "add lb vserver v1 HTTP"}),
+    ("/config", {"config": None}),
+])
+def test_bad_request(server, path, body):
+    status, reply = post(server, path, body)
+    assert status == 400
+    assert "error" in reply
+
+
+def test_unknown_request(server):
+    status, reply = post(server, "/convert", {"expression": "REQ.IS_VALID"})
+    assert status == 404
+    assert reply == {"error": "unknown request /convert"}
+
+
+def test_request_too_large(server):
+    status, reply = post(server, "/config", {"config": "#" * 8192})
+    assert status == 413
+    assert reply == {"error": "request is larger than 4096 bytes"}
+
+
+def test_too_many_requests(server):
+    """ Requests beyond max_requests are refused. """
+    for _ in range(2):
+        assert server.slots.acquire(False)
+    try:
+        status, reply = post(server, "/expression",
+                             {"expression": "REQ.IS_VALID"})
+    finally:
+        for _ in range(2):
+            server.slots.release()
+    assert status == 503
+    assert reply == {"error": "too many requests in progress"}
+
+
+def test_failed_conversion(server, monkeypatch):
+    """ A conversion raising an exception is answered with 500. """
+    def fail(*args, **kwargs):
+        raise AttributeError("'NoneType' object has no attribute 'value'")
+    monkeypatch.setattr(nspepi_api, "convert_config", fail)
+    status, reply = post(server, "/config", {"config": "add ns acl a1\n"})
+    assert status == 500
+    assert reply == {"error": "conversion failed: 'NoneType' object has no"
+                              " attribute 'value'"}
+    # The server goes on serving requests.
+    status, reply = post(server, "/expression",
+                         {"expression": "REQ.HTTP.METHOD == GET"})
+    assert status == 200